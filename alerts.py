@@ -0,0 +1,462 @@
+"""
+TripVibe Alerts - Saved price watches, checked against every scrape
+
+A watch is "tell me when SIN→NRT in June costs S$900 or less" or "when
+hotel X is S$250/night or less". There can be tens of thousands of them, so
+a scrape must not loop over all of them. The engine keeps them in an
+in-memory index:
+
+- keyed by what is watched and a day: ("flight", "SIN-NRT", "return",
+  "2026-06-12"), ("hotel", "us/the-plaza", "", "2026-06-12") or
+  ("hotel", "NYCA", "", "2026-06-12") for any hotel in a city. A watch is
+  in the bucket of every day it covers, so a bucket holds only watches
+  covering its day.
+- each bucket holds its watches sorted by max price, so one bisect on the
+  scrape's best price finds exactly the watches it satisfies.
+
+Checking a result is a dict lookup and a bisect per bucket, plus one step
+per watch that fires: O(log n + matches). Watches on other days of the
+month are never visited.
+
+Watches live in the shared SQLite file. A fired watch records the price it
+fired at, claimed with a conditional UPDATE, so it only fires again on a
+lower price and only one worker sends each notification. Notifications are
+appended to a local outbox (one JSON object per line) for a sender to pick
+up. Every add and remove is also logged by version, and a worker applies
+the changes it hasn't seen to just the buckets they touch, so one new
+watch costs each worker a few hundred inserts, not a rebuild. The full
+index is only built on a background thread: when the engine is created,
+and again if a worker falls further behind than the log keeps. Checks made
+before that build finishes fire nothing.
+
+Usage:
+    engine = default_engine()
+    engine.ready.wait()         # scripts: let the index load first
+    alert_id = engine.add("flight", "SIN-NRT", "2026-06-01", "2026-06-30", 900)
+    engine.add("hotel", "us/the-plaza", "2026-06-01", "2026-06-30", 250)
+
+    engine.check_flights("SIN", "NRT", "2026-06-12", flights, round_trip=True)
+    engine.check_hotels("NYCA", "2026-06-12", "2026-06-15", hotels)
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import metrics
+from hotel_index import hotel_slug
+from shared_state import connect
+
+DATA_DIR = Path(__file__).parent / "tripvibe_data"
+DEFAULT_DB = DATA_DIR / "shared.db"
+DEFAULT_OUTBOX = DATA_DIR / "alerts_outbox.jsonl"
+
+KINDS = ("flight", "hotel")
+TRIP_TYPES = ("return", "oneway")
+MAX_MONTHS = 24                 # months one watch may span
+CHANGE_LOG_SIZE = 10000         # adds/removes kept for workers catching up
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    target TEXT NOT NULL,
+    trip_type TEXT NOT NULL,
+    date_from TEXT NOT NULL,
+    date_to TEXT NOT NULL,
+    max_price INTEGER NOT NULL,
+    contact TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    notified_price INTEGER,
+    notified_at REAL
+);
+CREATE TABLE IF NOT EXISTS alert_version (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO alert_version (id, version) VALUES (0, 0);
+CREATE TABLE IF NOT EXISTS alert_changes (
+    version INTEGER PRIMARY KEY,
+    alert_id INTEGER NOT NULL,
+    op TEXT NOT NULL
+);
+"""
+
+_SELECT_WATCHES = "SELECT id, kind, target, trip_type, date_from, date_to, max_price, contact FROM alerts"
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+def months(date_from, date_to):
+    """The "YYYY-MM" buckets from date_from to date_to (ISO dates), inclusive."""
+    start = date.fromisoformat(date_from)
+    end = date.fromisoformat(date_to)
+    year, month = start.year, start.month
+    buckets = []
+    while (year, month) <= (end.year, end.month):
+        buckets.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return buckets
+
+
+def days(date_from, date_to):
+    """The ISO dates from date_from to date_to, inclusive."""
+    day = date.fromisoformat(date_from)
+    end = date.fromisoformat(date_to)
+    while day <= end:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+def _bucket_keys(watch):
+    for day in days(watch.date_from, watch.date_to):
+        yield (watch.kind, watch.target, watch.trip_type, day)
+
+
+class Watch:
+    """One saved alert, as held in the index."""
+
+    __slots__ = ("id", "kind", "target", "trip_type", "date_from", "date_to", "max_price", "contact")
+
+    def __init__(self, id, kind, target, trip_type, date_from, date_to, max_price, contact):
+        self.id = id
+        self.kind = kind
+        self.target = target
+        self.trip_type = trip_type
+        self.date_from = date_from
+        self.date_to = date_to
+        self.max_price = max_price
+        self.contact = contact
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Bucket:
+    """Watches of one (kind, target, trip type, day), sorted by max price."""
+
+    __slots__ = ("keys", "watches")
+
+    def __init__(self, watches=()):
+        # (price, id) keeps equal prices in a stable order
+        self.watches = sorted(watches, key=lambda w: (w.max_price, w.id))
+        self.keys = [(w.max_price, w.id) for w in self.watches]
+
+    def add(self, watch):
+        key = (watch.max_price, watch.id)
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.watches.insert(i, watch)
+
+    def remove(self, watch):
+        key = (watch.max_price, watch.id)
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+            del self.watches[i]
+
+    def at_or_above(self, price):
+        """Watches whose max price is price or more, i.e. that price satisfies."""
+        return self.watches[bisect_left(self.keys, (price,)):]
+
+
+class AlertEngine:
+    """Price watches indexed by target and day, evaluated per scrape."""
+
+    def __init__(self, db_path, outbox_path):
+        """
+        Args:
+            db_path: SQLite file shared by all workers
+            outbox_path: JSON-lines file notifications are appended to
+        """
+        self.db_path = db_path
+        self.outbox_path = outbox_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._watches = {}
+        self._version = None            # change log version the index is at
+        self._loading = False
+        self.ready = threading.Event()  # set once the first full load is in
+
+        os.makedirs(os.path.dirname(os.fspath(db_path)), exist_ok=True)
+        os.makedirs(os.path.dirname(os.fspath(outbox_path)), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        self._start_load()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    # ----- watches -----
+
+    def add(self, kind, target, date_from, date_to, max_price, trip_type="return", contact=""):
+        """Save a watch; returns its id.
+
+        Args:
+            kind: "flight" or "hotel"
+            target: "SIN-NRT" for flights; a hotel slug ("us/the-plaza",
+                see hotel_index.hotel_slug) or a city code for hotels
+            date_from: First departure/check-in date covered (YYYY-MM-DD)
+            date_to: Last departure/check-in date covered (YYYY-MM-DD)
+            max_price: Fires at this price or less (flight price, or hotel
+                price per night)
+            trip_type: "return" or "oneway" (flights only)
+            contact: Where the sender should deliver the notification
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown alert kind: {kind}")
+        if kind == "flight" and trip_type not in TRIP_TYPES:
+            raise ValueError(f"Unknown trip type: {trip_type}")
+        span = months(date_from, date_to)
+        if not span:
+            raise ValueError("date_to is before date_from")
+        if len(span) > MAX_MONTHS:
+            raise ValueError(f"A watch may span at most {MAX_MONTHS} months")
+        trip_type = trip_type if kind == "flight" else ""
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "INSERT INTO alerts (kind, target, trip_type, date_from, date_to, max_price, contact, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, target, trip_type, date_from, date_to, int(max_price), contact, time.time()),
+            )
+            self._log_change(conn, cur.lastrowid, "add")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        # Every worker's next check applies the change to its index
+        return cur.lastrowid
+
+    def remove(self, alert_id):
+        """Delete a watch; False if there was none with that id."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute("DELETE FROM alerts WHERE id = ?", (alert_id,))
+            if cur.rowcount == 1:
+                self._log_change(conn, alert_id, "remove")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    @staticmethod
+    def _log_change(conn, alert_id, op):
+        # Inside the caller's transaction, so versions are gapless
+        conn.execute("UPDATE alert_version SET version = version + 1")
+        conn.execute(
+            "INSERT INTO alert_changes (version, alert_id, op) SELECT version, ?, ? FROM alert_version",
+            (alert_id, op),
+        )
+        conn.execute(
+            "DELETE FROM alert_changes WHERE version <= (SELECT version FROM alert_version) - ?",
+            (CHANGE_LOG_SIZE,),
+        )
+
+    def get(self, alert_id):
+        """The watch as a dict, or None."""
+        row = self._conn().execute(_SELECT_WATCHES + " WHERE id = ?", (alert_id,)).fetchone()
+        return Watch(*row).to_dict() if row else None
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+
+    # ----- index -----
+
+    def _start_load(self):
+        """Build the whole index on a background thread; checks keep the old one meanwhile."""
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._load, name="alert-index", daemon=True).start()
+
+    def _load(self):
+        try:
+            conn = self._conn()
+            # One read transaction: the rows are exactly those of version
+            conn.execute("BEGIN")
+            try:
+                version = conn.execute("SELECT version FROM alert_version").fetchone()[0]
+                rows = conn.execute(_SELECT_WATCHES).fetchall()
+            finally:
+                conn.execute("COMMIT")
+            by_day = {}
+            watches = {}
+            for row in rows:
+                watch = Watch(*row)
+                watches[watch.id] = watch
+                for key in _bucket_keys(watch):
+                    members = by_day.get(key)
+                    if members is None:
+                        members = by_day[key] = []
+                    members.append(watch)
+            # Sorted once per bucket rather than an insert per watch
+            buckets = {key: _Bucket(members) for key, members in by_day.items()}
+            with self._lock:
+                self._buckets = buckets
+                self._watches = watches
+                self._version = version
+        except Exception as e:
+            print(f"Alert index not loaded: {e}")
+        finally:
+            with self._lock:
+                self._loading = False
+            self.ready.set()
+
+    def _sync(self):
+        """Apply the adds and removes other workers made since our index's version."""
+        with self._lock:
+            if self._loading or self._version is None:
+                return
+            since = self._version
+        conn = self._conn()
+        if conn.execute("SELECT version FROM alert_version").fetchone()[0] == since:
+            return
+        changes = conn.execute(
+            "SELECT version, alert_id, op FROM alert_changes WHERE version > ? ORDER BY version", (since,)
+        ).fetchall()
+        if not changes or changes[0][0] != since + 1:
+            # The log no longer reaches back to our version
+            self._start_load()
+            return
+        added = [alert_id for _, alert_id, op in changes if op == "add"]
+        rows = {}
+        if added:
+            marks = ",".join("?" * len(added))
+            for row in conn.execute(f"{_SELECT_WATCHES} WHERE id IN ({marks})", added):
+                rows[row[0]] = row
+        with self._lock:
+            if self._loading or self._version != since:
+                return                  # another thread got here first
+            for version, alert_id, op in changes:
+                if op == "add" and alert_id in rows and alert_id not in self._watches:
+                    watch = self._watches[alert_id] = Watch(*rows[alert_id])
+                    for key in _bucket_keys(watch):
+                        bucket = self._buckets.get(key)
+                        if bucket is None:
+                            bucket = self._buckets[key] = _Bucket()
+                        bucket.add(watch)
+                elif op == "remove" and alert_id in self._watches:
+                    watch = self._watches.pop(alert_id)
+                    for key in _bucket_keys(watch):
+                        bucket = self._buckets.get(key)
+                        if bucket is not None:
+                            bucket.remove(watch)
+                            if not bucket.watches:
+                                del self._buckets[key]
+            self._version = changes[-1][0]
+
+    def _matching(self, kind, target, trip_type, day, price):
+        """Watches on target covering day that price satisfies."""
+        with self._lock:
+            bucket = self._buckets.get((kind, target, trip_type, day))
+            if bucket is None:
+                return []
+            return bucket.at_or_above(price)
+
+    # ----- evaluation -----
+
+    def check_flights(self, origin, destination, date_str, flights, round_trip=False):
+        """Fire the watches on this route and date that the cheapest flight meets.
+
+        Returns:
+            Number of notifications sent
+        """
+        priced = [f for f in flights if f.available and f.price > 0]
+        if not priced:
+            return 0
+        self._sync()
+        best = min(priced, key=lambda f: f.price)
+        trip_type = "return" if round_trip else "oneway"
+        sent = 0
+        for watch in self._matching("flight", f"{origin}-{destination}", trip_type, date_str, best.price):
+            sent += self._fire(watch, date_str, best.price, best.to_dict())
+        return sent
+
+    def check_hotels(self, city, checkin, checkout, hotels):
+        """Fire the watches on these hotels (and on any hotel in city) they meet.
+
+        Returns:
+            Number of notifications sent
+        """
+        priced = [h for h in hotels if h.available and h.price_per_night > 0]
+        if not priced:
+            return 0
+        self._sync()
+        sent = 0
+        # One lookup per hotel for the watches on that hotel
+        for hotel in priced:
+            slug = hotel_slug(hotel.booking_url)
+            if slug:
+                for watch in self._matching("hotel", slug, "", checkin, hotel.price_per_night):
+                    sent += self._fire(watch, checkin, hotel.price_per_night, hotel.to_dict(), checkout)
+        # City-wide watches only need the cheapest hotel
+        best = min(priced, key=lambda h: h.price_per_night)
+        for watch in self._matching("hotel", city, "", checkin, best.price_per_night):
+            sent += self._fire(watch, checkin, best.price_per_night, best.to_dict(), checkout)
+        return sent
+
+    def _fire(self, watch, day, price, item, checkout=None):
+        # Claim the notification: only the first worker to see a new low sends it
+        cur = self._conn().execute(
+            "UPDATE alerts SET notified_price = ?, notified_at = ? "
+            "WHERE id = ? AND (notified_price IS NULL OR notified_price > ?)",
+            (price, time.time(), watch.id, price),
+        )
+        if cur.rowcount != 1:
+            return 0
+
+        notification = {
+            "alert_id": watch.id,
+            "kind": watch.kind,
+            "target": watch.target,
+            "trip_type": watch.trip_type,
+            "date": day,
+            "checkout": checkout,
+            "price": price,
+            "max_price": watch.max_price,
+            "contact": watch.contact,
+            "item": item,
+            "created_at": datetime.now().isoformat(),
+        }
+        self._append(json.dumps(notification, ensure_ascii=False) + "\n")
+        metrics.ALERTS_SENT.labels(watch.kind).inc()
+        return 1
+
+    def _append(self, line):
+        # One write() on an O_APPEND file: lines from several workers never interleave
+        fd = os.open(os.fspath(self.outbox_path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+
+def default_engine():
+    """Return the process-wide alert engine, creating it on first use."""
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = AlertEngine(DEFAULT_DB, DEFAULT_OUTBOX)
+        return _default_engine
+
+
+def set_default_engine(engine):
+    """Replace the process-wide engine (e.g. with one in a temp directory)."""
+    global _default_engine
+    with _default_engine_lock:
+        _default_engine = engine
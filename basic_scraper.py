@@ -5,74 +5,77 @@ This script demonstrates:
 - Making requests with Fetcher
 - CSS and XPath selectors
 - Extracting text, attributes, and links
-- Handling pagination
+- Handling pagination, with the next pages fetched while one is parsed
+  (see pagination.py)
+- Compiled card schemas (see cards.py)
 """
 
 from scrapling import Fetcher
 
+import cards
+import pagination
 
-def scrape_quotes():
-    """Scrape quotes from quotes.toscrape.com with pagination."""
-    fetcher = Fetcher()
+# One quote card, compiled once: text, author and tags in one walk per card
+QUOTE_CARD = cards.CardSchema("div.quote", {
+    "text": cards.Field("span.text", default=""),
+    "author": cards.Field("small.author", default=""),
+    "tags": cards.Field("a.tag", many=True),
+})
+
+
+def has_no_next(response):
+    """True on the last page: it has no "next" link."""
+    return not response.css("li.next a")
+
+
+def scrape_quotes(max_pages=3, prefetch=pagination.DEFAULT_PREFETCH):
+    """Scrape quotes from quotes.toscrape.com with pagination.
+
+    Args:
+        max_pages: Stop after this many pages (3 for the demo; None for all)
+        prefetch: Pages downloaded ahead of the one being parsed
+    """
     base_url = "https://quotes.toscrape.com"
 
     all_quotes = []
-    page = 1
-
-    while True:
-        url = f"{base_url}/page/{page}/"
-        print(f"\n--- Fetching page {page} ---")
-
-        response = fetcher.get(url)
-
-        if response.status != 200:
-            print(f"Failed to fetch page {page}: status {response.status}")
-            break
-
-        # Find all quote containers using CSS selector
-        quote_divs = response.css("div.quote")
-
-        if not quote_divs:
-            print("No more quotes found.")
-            break
-
-        for quote_div in quote_divs:
-            # Extract quote text (CSS selector)
-            text_elems = quote_div.css("span.text")
-            text = text_elems[0].text if text_elems else ""
-
-            # Extract author (CSS selector)
-            author_elems = quote_div.css("small.author")
-            author = author_elems[0].text if author_elems else ""
-
-            # Extract tags
-            tag_elems = quote_div.css("a.tag")
-            tags = [tag.text for tag in tag_elems]
-
-            quote_data = {
-                "text": text,
-                "author": author,
-                "tags": tags
-            }
-            all_quotes.append(quote_data)
-
-            # Print the quote
-            print(f'\n"{text[:50]}..."')
-            print(f"  - {author}")
-            print(f"  Tags: {', '.join(tags)}")
-
-        # Check for next page link
-        next_btn = response.css("li.next a")
-        if not next_btn:
-            print("\nReached last page.")
-            break
-
-        page += 1
-
-        # Limit to 3 pages for demo
-        if page > 3:
-            print("\nStopping at page 3 for demo purposes.")
-            break
+    failed = False
+    paginator = pagination.Paginator(
+        lambda page: f"{base_url}/page/{page}/",
+        is_last=has_no_next,
+        prefetch=prefetch,
+        max_pages=max_pages,
+    )
+
+    # Pages arrive in order; the ones after this one are already downloading
+    with paginator:
+        for page, response in paginator:
+            print(f"\n--- Page {page} ---")
+            if response.status != 200:
+                print(f"Failed to fetch page {page}: status {response.status}")
+                failed = True
+                break
+
+            # Every quote container (div.quote), read with the compiled schema
+            quotes = QUOTE_CARD.extract_all(response)
+
+            if not quotes:
+                print("No more quotes found.")
+                break
+
+            for quote_data in quotes:
+                text, author, tags = quote_data["text"], quote_data["author"], quote_data["tags"]
+                all_quotes.append(quote_data)
+
+                # Print the quote
+                print(f'\n"{text[:50]}..."')
+                print(f"  - {author}")
+                print(f"  Tags: {', '.join(tags)}")
+
+    # The paginator stops at the page without a next link, or at max_pages
+    if paginator.reached_end and not failed:
+        print("\nReached last page.")
+    elif not failed and max_pages is not None:
+        print(f"\nStopping at page {max_pages} for demo purposes.")
 
     print(f"\n=== Summary ===")
     print(f"Total quotes scraped: {len(all_quotes)}")
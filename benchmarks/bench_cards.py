@@ -0,0 +1,85 @@
+"""
+Card Extraction Benchmark - per-field css() calls vs. a compiled CardSchema
+
+Reads every product card of the books.toscrape.com catalogue fixtures
+(benchmarks/fixtures/books-page-<n>.html) the way price_tracker.py used to,
+with four card.css() queries per card, and with price_tracker.BOOK_CARD,
+and reports the time per page and per card for both. Pages are parsed once
+up front; only extraction is timed. Both must find the same titles, prices,
+ratings and URLs.
+
+Usage:
+    python benchmarks/bench_cards.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scrapling.parser import Selector
+
+import price_tracker
+from benchmarks import fixtures
+
+PAGES = ["books-page-1.html", "books-page-2.html"]
+REPEAT = 200
+
+
+def per_field(page):
+    """The old extraction loop: one css() query per field per card."""
+    books = []
+    for book in page.css("article.product_pod"):
+        title_elems = book.css("h3 a")
+        price_elems = book.css("p.price_color")
+        avail_elems = book.css("p.availability")
+        rating_elems = book.css("p.star-rating")
+        books.append({
+            "title": title_elems[0].attrib.get("title", "Unknown") if title_elems else "Unknown",
+            "price": float((price_elems[0].text if price_elems else "0").replace("£", "").strip()),
+            "availability": avail_elems[0].text.strip() if avail_elems else "Unknown",
+            "rating": (rating_elems[0].attrib.get("class", "") if rating_elems else "").replace("star-rating ", "").strip(),
+            "url": title_elems[0].attrib.get("href", "") if title_elems else "",
+        })
+    return books
+
+
+def compiled(page):
+    return price_tracker.BOOK_CARD.extract_all(page)
+
+
+def time_it(fn):
+    """Best-of-REPEAT wall time in milliseconds."""
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    print("=" * 50)
+    print("CARD EXTRACTION BENCHMARK")
+    print("=" * 50)
+
+    for name in PAGES:
+        page = Selector(fixtures.load(name))
+        old, new = per_field(page), compiled(page)
+        # Availability differs by design: the old .text missed the text after the icon
+        strip = lambda books: [{k: v for k, v in b.items() if k != "availability"} for b in books]
+        if strip(old) != strip(new):
+            sys.exit(f"{name}: compiled schema disagrees with per-field extraction")
+
+        cards = len(new)
+        print(f"\n{name} ({cards} cards)")
+        print(f"  {'method':<12}{'ms/page':>12}{'us/card':>12}")
+        results = {"per-field": time_it(lambda: per_field(page)), "compiled": time_it(lambda: compiled(page))}
+        for method, ms in results.items():
+            print(f"  {method:<12}{ms:>12.3f}{ms * 1000 / cards:>12.1f}")
+        print(f"  compiled is {results['per-field'] / results['compiled']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
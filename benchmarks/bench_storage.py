@@ -0,0 +1,135 @@
+"""
+Storage Benchmark - compact search codec vs. the old indent=2 JSON
+
+Builds synthetic searches of increasing size (bundles share flights and
+hotels the way create_bundles() does) and reports bytes on disk plus dump
+and load time for both formats.
+
+Usage:
+    python benchmarks/bench_storage.py
+"""
+
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import records
+import storage
+from records import Bundle, Flight, Hotel
+
+SIZES = [(10, 8), (100, 50), (1000, 300)]
+REPEAT = 20
+
+
+def build_search(n_flights, n_hotels):
+    """Build a search dict shaped like tripvibe_v2's bundles.json."""
+    flights = [
+        Flight(
+            airline="Singapore Airlines",
+            emoji="🇸🇬",
+            price=700 + i,
+            duration=f"{18 + i % 6}h 25m",
+            duration_hours=18 + i % 6,
+            depart="08:15",
+            arrive="19:40",
+            stops=1,
+            carbon=(18 + i % 6) * 45,
+            booking_url=f"https://www.skyscanner.com.sg/transport/flights/sin/nyca/260612/config/{i}",
+        )
+        for i in range(n_flights)
+    ]
+    hotels = [
+        Hotel(
+            name=f"Park Lane Hotel {i}",
+            price_total=600 + 10 * i,
+            price_per_night=200 + 3 * i,
+            stars=3 + i % 3,
+            score=f"{8.0 + (i % 15) / 10:.1f}",
+            reviews=500 + (i * 234) % 2000,
+            location="City Center",
+            booking_url=f"https://www.booking.com/hotel/us/park-lane-{i}.html?checkin=2026-06-12",
+        )
+        for i in range(n_hotels)
+    ]
+    bundles = [
+        Bundle(
+            flight=flight,
+            hotel=hotels[i % n_hotels],
+            origin="SIN",
+            destination="NYCA",
+            nights=3,
+            total_price=flight.price + hotels[i % n_hotels].price_total,
+            savings=50,
+            vibe_text="Best bang for your buck 💰",
+        )
+        for i, flight in enumerate(flights)
+    ]
+    return {
+        "bundles": bundles,
+        "origin": "SIN",
+        "destination": "NYCA",
+        "checkin": "2026-06-12",
+        "checkout": "2026-06-15",
+        "trip_type": "return",
+        "route_display": "Singapore ↔ New York",
+        "scraped_at": "2026-06-01T12:00:00",
+    }
+
+
+def time_it(fn):
+    """Best-of-REPEAT wall time in milliseconds."""
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench(n_flights, n_hotels, tmp):
+    data = build_search(n_flights, n_hotels)
+    legacy_path = tmp / "legacy.json"
+    compact_path = tmp / "compact.json"
+
+    def dump_legacy():
+        with open(legacy_path, "w") as f:
+            records.dump(data, f, indent=2)
+
+    def load_legacy():
+        with open(legacy_path) as f:
+            storage.decode_search(json.load(f))
+
+    results = {
+        "legacy": (time_it(dump_legacy), time_it(load_legacy), legacy_path.stat().st_size),
+        "compact": (
+            time_it(lambda: storage.dump_search(data, compact_path)),
+            time_it(lambda: storage.load_search(compact_path)),
+            compact_path.stat().st_size,
+        ),
+    }
+
+    print(f"\n{n_flights} bundles / {n_hotels} hotels")
+    print(f"  {'format':<10}{'bytes':>12}{'dump ms':>12}{'load ms':>12}")
+    for name, (dump_ms, load_ms, size) in results.items():
+        print(f"  {name:<10}{size:>12,}{dump_ms:>12.2f}{load_ms:>12.2f}")
+
+    ratio = results["legacy"][2] / results["compact"][2]
+    print(f"  compact is {ratio:.1f}x smaller")
+
+
+def main():
+    print("=" * 50)
+    print("STORAGE BENCHMARK")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_flights, n_hotels in SIZES:
+            bench(n_flights, n_hotels, Path(tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark Fixtures - Recorded and synthetic result pages
+
+The benchmark suite runs against HTML saved in benchmarks/fixtures/. Real
+pages can be dropped in there (or captured with the record fetch mode) using
+the naming scheme below; for anything missing, a deterministic synthetic page
+is generated that exercises the same regexes as the live markup: result
+links, prices in text, script/style noise, airline names, times, durations,
+hotel title cards and review scores.
+
+    skyscanner-<oneway|return>-<n>.html      n = itineraries on the page
+    booking-<n>.html                         n = hotel cards on the page
+    books-page-<n>.html                      books.toscrape.com catalogue page
+
+Usage:
+    python benchmarks/fixtures.py            # (re)generate missing fixtures
+"""
+
+import random
+from pathlib import Path
+
+FIXTURE_DIR = Path(__file__).parent / "fixtures"
+
+SKYSCANNER_SIZES = [10, 60, 250]
+BOOKING_SIZES = [25, 100, 400]
+
+AIRLINES = [
+    "Singapore Airlines", "Emirates", "Qatar Airways", "Cathay Pacific",
+    "ANA", "United", "Delta", "British Airways", "Lufthansa", "Turkish Airlines",
+    "Korean Air",
+]
+SCORE_WORDS = ["Superb", "Excellent", "Very Good", "Good", "Pleasant"]
+HOTEL_WORDS = ["Park", "Grand", "Plaza", "Central", "Harbour", "Garden", "Royal", "Lane", "Tower", "Suites"]
+
+# Inline JS bundles on the real pages are large and full of numbers that
+# look like prices; the parsers strip them first
+SCRIPT_NOISE = (
+    '<script>window.__INTERNAL__={"price":"$ 99999","ts":"12:34","ids":[%s]};</script>\n'
+)
+STYLE_NOISE = "<style>.c%d{width:%dpx;margin:%dpx}</style>\n"
+
+
+def _page(title, body, rng, noise_blocks):
+    noise = "".join(
+        SCRIPT_NOISE % ",".join(str(rng.randint(1000, 99999)) for _ in range(200))
+        + STYLE_NOISE % (i, rng.randint(1, 999), rng.randint(1, 99))
+        for i in range(noise_blocks)
+    )
+    return (
+        f"<!DOCTYPE html><html><head><title>{title}</title>{noise}</head>"
+        f"<body>{body}</body></html>"
+    )
+
+
+def skyscanner_page(n, round_trip, seed=0):
+    """Synthetic Skyscanner results page with n itinerary cards."""
+    rng = random.Random(seed * 1000 + n + (1 if round_trip else 0))
+    low, high = (1000, 8000) if round_trip else (400, 5000)
+    route = "sin/nyca/260612/260619" if round_trip else "sin/nyca/260612"
+    cards = []
+    for i in range(n):
+        airline = rng.choice(AIRLINES)
+        hours = rng.randint(16, 30)
+        cards.append(
+            f'<div class="FlightsResults_dayViewItems__{i}" data-testid="itinerary">'
+            f'<a href="/transport/flights/{route}/config/{rng.randint(10**8, 10**9)}">'
+            f'<span class="airline">{airline}</span>'
+            f'<span class="time">{rng.randint(0, 23):02d}:{rng.choice([0, 15, 30, 45]):02d}</span>'
+            f'<span class="time">{rng.randint(0, 23):02d}:{rng.choice([0, 15, 30, 45]):02d}</span>'
+            f'<span class="duration">{hours}h {rng.randint(0, 59)}m</span>'
+            f'<span class="stops">{rng.choice(["1 stop", "2 stops", "Direct"])}</span>'
+            f'<span class="price">$ {rng.randint(low, high):,}</span>'
+            f"</a></div>"
+        )
+    return _page("Skyscanner", "".join(cards), rng, noise_blocks=40 + n * 6)
+
+
+def booking_page(n, seed=0):
+    """Synthetic Booking.com results page with n property cards."""
+    rng = random.Random(seed * 1000 + n + 7)
+    cards = []
+    for i in range(n):
+        name = f"{rng.choice(HOTEL_WORDS)} {rng.choice(HOTEL_WORDS)} Hotel {i}"
+        slug = name.lower().replace(" ", "-")
+        score = f"{rng.randint(60, 97) / 10:.1f}"
+        cards.append(
+            f'<div data-testid="property-card">'
+            f'<a href="https://www.booking.com/hotel/us/{slug}.html?aid=304142&label=gen173">'
+            f'<div data-testid="title" class="fcab3ed991">{name}</div></a>'
+            f'<div data-testid="review-score"><div>{score}</div><div>{rng.choice(SCORE_WORDS)}</div></div>'
+            f'<span data-testid="price-and-discounted-price">S$ {rng.randint(450, 4500):,}</span>'
+            f'<span data-testid="distance">{rng.randint(1, 90) / 10} km from centre</span>'
+            f"</div>"
+        )
+    return _page("Booking.com", "".join(cards), rng, noise_blocks=20 + n * 3)
+
+
+def books_page(page, per_page=20, seed=0):
+    """Synthetic books.toscrape.com catalogue page."""
+    rng = random.Random(seed * 1000 + page + 13)
+    ratings = ["One", "Two", "Three", "Four", "Five"]
+    cards = []
+    for i in range(per_page):
+        title = f"Book {page}-{i} of {rng.choice(HOTEL_WORDS)}"
+        cards.append(
+            '<li class="col-xs-6 col-sm-4 col-md-3 col-lg-3"><article class="product_pod">'
+            f'<div class="image_container"><a href="catalogue/book-{page}-{i}/index.html">'
+            f'<img src="media/cache/{i}.jpg" alt="{title}" class="thumbnail"></a></div>'
+            f'<p class="star-rating {rng.choice(ratings)}"><i class="icon-star"></i></p>'
+            f'<h3><a href="catalogue/book-{page}-{i}/index.html" title="{title}">{title[:20]}...</a></h3>'
+            '<div class="product_price">'
+            f'<p class="price_color">£{rng.randint(1000, 6000) / 100:.2f}</p>'
+            '<p class="instock availability"><i class="icon-ok"></i>\n    In stock\n</p>'
+            "</div></article></li>"
+        )
+    next_link = '<li class="next"><a href="page-%d.html">next</a></li>' % (page + 1)
+    return _page("All products", f'<ol class="row">{"".join(cards)}</ol><ul class="pager">{next_link}</ul>', rng, 1)
+
+
+def ensure_fixtures():
+    """Generate any missing fixture files. Returns the fixture directory."""
+    FIXTURE_DIR.mkdir(exist_ok=True)
+    wanted = {}
+    for n in SKYSCANNER_SIZES:
+        wanted[f"skyscanner-oneway-{n}.html"] = lambda n=n: skyscanner_page(n, False)
+        wanted[f"skyscanner-return-{n}.html"] = lambda n=n: skyscanner_page(n, True)
+    for n in BOOKING_SIZES:
+        wanted[f"booking-{n}.html"] = lambda n=n: booking_page(n)
+    for page in (1, 2):
+        wanted[f"books-page-{page}.html"] = lambda page=page: books_page(page)
+
+    for name, build in wanted.items():
+        path = FIXTURE_DIR / name
+        if not path.exists():
+            path.write_text(build(), encoding="utf-8")
+    return FIXTURE_DIR
+
+
+def load(name):
+    """Return the HTML of a fixture, generating the set if needed."""
+    return (ensure_fixtures() / name).read_text(encoding="utf-8")
+
+
+if __name__ == "__main__":
+    directory = ensure_fixtures()
+    for path in sorted(directory.glob("*.html")):
+        print(f"{path.name:<32}{path.stat().st_size:>12,} bytes")
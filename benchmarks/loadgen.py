@@ -0,0 +1,230 @@
+"""
+TripVibe Load Generator - Concurrent virtual users against a running app
+
+Each virtual user is a thread that loops: pick a search, call the app's
+search endpoint (and sometimes the home page), wait the think time, repeat.
+At the end it reports throughput and p50/p95/p99 latency overall and per
+endpoint.
+
+Run the app in replay mode first so no request reaches the real sites
+(see replay.py):
+
+    TRIPVIBE_FETCH_MODE=replay TRIPVIBE_REPLAY_FALLBACK=1 \\
+        python serve.py tripvibe_v2 --workers 4
+
+Usage:
+    python benchmarks/loadgen.py http://127.0.0.1:5002 --users 20 --duration 60
+    python benchmarks/loadgen.py http://127.0.0.1:5001 --app tripvibe --searches 5
+    python benchmarks/loadgen.py http://127.0.0.1:5002 --index-ratio 0.3 --json
+
+--searches sets how many distinct searches the users draw from; fewer
+distinct searches means more cache hits and coalesced scrapes.
+"""
+
+import argparse
+import json
+import math
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+ROUTES = [
+    ("SIN", "NYCA"), ("SIN", "LHR"), ("SIN", "NRT"), ("SIN", "CDG"),
+    ("SIN", "BKK"), ("SIN", "DXB"), ("SIN", "LAX"), ("LHR", "NYCA"),
+]
+
+DAYS_AHEAD = (14, 120)          # departure dates drawn from this range
+NIGHTS = (2, 7)
+TRIP_TYPES = ["return", "return", "oneway"]   # return twice as likely
+
+SEARCH_PATHS = {
+    "dashboard": "/api/search",
+    "tripvibe": "/api/search",
+    "tripvibe_v2": "/api/bundle",
+}
+
+
+def distinct_searches(app):
+    """How many different searches build_searches() can draw for app."""
+    count = len(ROUTES) * (DAYS_AHEAD[1] - DAYS_AHEAD[0] + 1)
+    if app == "tripvibe_v2":
+        count *= (NIGHTS[1] - NIGHTS[0] + 1) * len(set(TRIP_TYPES))
+    return count
+
+
+def build_searches(app, count, seed=7):
+    """Return count distinct search query strings for app.
+
+    Raises:
+        ValueError: count is more than distinct_searches(app)
+    """
+    available = distinct_searches(app)
+    if count > available:
+        raise ValueError(f"{app} has only {available} distinct searches; asked for {count}")
+    rng = random.Random(seed)
+    searches = []
+    seen = set()
+    while len(searches) < count:
+        origin, destination = rng.choice(ROUTES)
+        depart = date.today() + timedelta(days=rng.randint(*DAYS_AHEAD))
+        nights = rng.randint(*NIGHTS)
+        if app == "tripvibe_v2":
+            params = {
+                "origin": origin,
+                "destination": destination,
+                "checkin": depart.isoformat(),
+                "checkout": (depart + timedelta(days=nights)).isoformat(),
+                "tripType": rng.choice(TRIP_TYPES),
+            }
+        else:
+            params = {"origin": origin, "destination": destination, "date": depart.isoformat()}
+        query = urlencode(params)
+        if query not in seen:
+            seen.add(query)
+            searches.append(f"{SEARCH_PATHS[app]}?{query}")
+    return searches
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Results:
+    """Thread-safe collection of (endpoint, latency_s, status, ok) samples."""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, latency, status, ok):
+        with self._lock:
+            self.samples.append((endpoint, latency, status, ok))
+
+
+def call(base_url, path, timeout):
+    """GET path; return (status, ok). API responses must say success: true."""
+    try:
+        with urllib.request.urlopen(base_url + path, timeout=timeout) as resp:
+            body = resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        return e.code, False
+    except (urllib.error.URLError, OSError):
+        return 0, False
+
+    if path.startswith("/api/"):
+        try:
+            return status, bool(json.loads(body).get("success"))
+        except ValueError:
+            return status, False
+    return status, status == 200
+
+
+def virtual_user(base_url, searches, args, deadline, results, seed):
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        if rng.random() < args.index_ratio:
+            path, endpoint = "/", "/"
+        else:
+            path = rng.choice(searches)
+            endpoint = path.split("?", 1)[0]
+
+        start = time.perf_counter()
+        status, ok = call(base_url, path, args.timeout)
+        results.add(endpoint, time.perf_counter() - start, status, ok)
+
+        if args.think:
+            time.sleep(rng.uniform(0, 2 * args.think))
+
+
+def summarise(samples, wall_seconds):
+    latencies = sorted(s[1] * 1000 for s in samples)
+    ok = sum(1 for s in samples if s[3])
+    statuses = {}
+    for s in samples:
+        statuses[str(s[2])] = statuses.get(str(s[2]), 0) + 1
+    return {
+        "requests": len(samples),
+        "ok": ok,
+        "failed": len(samples) - ok,
+        "statuses": statuses,
+        "throughput_rps": round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+        "mean_ms": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "max_ms": round(latencies[-1], 1) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a TripVibe app with concurrent virtual users")
+    parser.add_argument("base_url", help="e.g. http://127.0.0.1:5002")
+    parser.add_argument("--app", choices=sorted(SEARCH_PATHS), default="tripvibe_v2")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run")
+    parser.add_argument("--searches", type=int, default=20, help="Distinct searches to draw from")
+    parser.add_argument("--index-ratio", type=float, default=0.2, help="Share of requests to /")
+    parser.add_argument("--think", type=float, default=0.5, help="Mean think time between requests (s)")
+    parser.add_argument("--timeout", type=float, default=180)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip("/")
+    try:
+        searches = build_searches(args.app, args.searches)
+    except ValueError as e:
+        parser.error(str(e))
+    results = Results()
+
+    start = time.monotonic()
+    deadline = start + args.duration
+    users = [
+        threading.Thread(
+            target=virtual_user,
+            args=(base_url, searches, args, deadline, results, i),
+            daemon=True,
+        )
+        for i in range(args.users)
+    ]
+    for t in users:
+        t.start()
+    for t in users:
+        t.join()
+    # Requests in flight at the deadline finish late; count the real wall time
+    wall = time.monotonic() - start
+
+    report = {"overall": summarise(results.samples, wall), "endpoints": {}}
+    for endpoint in sorted({s[0] for s in results.samples}):
+        report["endpoints"][endpoint] = summarise(
+            [s for s in results.samples if s[0] == endpoint], wall,
+        )
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print("=" * 86)
+    print(f"TRIPVIBE LOAD TEST - {args.users} users, {wall:.0f}s, {args.searches} distinct searches")
+    print("=" * 86)
+    print(f"{'endpoint':<16}{'requests':>9}{'failed':>8}{'req/s':>9}"
+          f"{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    print("-" * 86)
+    rows = [("overall", report["overall"])] + list(report["endpoints"].items())
+    for name, r in rows:
+        print(f"{name:<16}{r['requests']:>9}{r['failed']:>8}{r['throughput_rps']:>9.2f}"
+              f"{r['p50_ms']:>11.1f}{r['p95_ms']:>11.1f}{r['p99_ms']:>11.1f}{r['max_ms']:>11.1f}")
+    print(f"\nStatus codes: {report['overall']['statuses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+TripVibe Benchmark Suite - Offline, fixture-driven
+
+Times each stage of a bundle search separately against saved result pages,
+so experiments don't spend the daily scraping budget:
+
+    parse_flights      Skyscanner page -> Flight records
+    parse_hotels       Booking.com page -> Hotel records
+    create_bundles     records -> Bundle records
+    serialize          storage.dumps_search + loads_search
+    render             tripvibe_v2 bundle page template
+    scrape_e2e         scrape_flights + scrape_hotels through a fixture-replay
+                       fetcher (pool, limiter and tracing included, no network)
+
+For every case it reports the median time, throughput and allocations
+(tracemalloc peak and blocks still alive afterwards), and compares against the stored
+baseline in benchmarks/baseline.json. The committed baseline was recorded
+from the generated fixtures on one development machine; re-save it on the
+machine you compare on before reading small changes into the column. "peak RSS" is how far the process's
+resident memory rose during one run (Linux; freed heap is returned to the OS
+first so earlier runs don't hide it) - for scrape_e2e, the memory one
+search needs, which is what sets how many searches a small host can run at
+once.
+
+Usage:
+    python benchmarks/run.py                    # run and compare to baseline
+    python benchmarks/run.py --save-baseline    # run and store as new baseline
+    python benchmarks/run.py --filter parse     # only cases whose name matches
+"""
+
+import argparse
+import ctypes
+import gc
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import alerts
+import browser_pool
+import hotel_index
+import places
+import price_windows
+import ratelimit
+import storage
+import tripvibe_v2
+from benchmarks import fixtures
+from flask import render_template_string
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE_FILE = Path(__file__).parent / "baseline.json"
+SEARCH_URL = "https://www.skyscanner.com.sg/transport/flights/sin/nyca/260612/?currency=SGD"
+HOTEL_URL = "https://www.booking.com/searchresults.html?ss=New+York&checkin=2026-06-12&checkout=2026-06-15"
+
+
+class FixtureResponse:
+    """The parts of a Scrapling response the scrapers use."""
+
+    def __init__(self, url, html, status=200, body=b""):
+        self.url = url
+        self.status = status
+        self.html_content = html
+        self.body = body
+
+
+class FixtureFetcher:
+    """Fetcher stub that serves saved pages by site instead of the network."""
+
+    def __init__(self, pages):
+        """
+        Args:
+            pages: {host substring: fixture file name}
+        """
+        self.pages = {host: fixtures.load(name).encode("utf-8") for host, name in pages.items()}
+
+    def fetch(self, url, page_action=None, **kwargs):
+        for host, body in self.pages.items():
+            if host in url:
+                if page_action is not None:
+                    page_action(None)
+                # Decoded per fetch, so each search holds its own page like a live one
+                return FixtureResponse(url, body.decode("utf-8"), body=body)
+        return FixtureResponse(url, "", status=404)
+
+
+def _status_kb(field):
+    # VmRSS / VmHWM from /proc (Linux), in KB
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _trim():
+    # Hand freed heap back to the OS (glibc), or earlier runs' free memory
+    # is reused and fn's peak never shows in RSS
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def peak_rss(fn):
+    """KB the resident set rose above its starting size while fn ran.
+
+    Linux resets the high-water mark through /proc/self/clear_refs, so the
+    setup before fn doesn't count. Elsewhere ru_maxrss is the best
+    available; it only moves once fn goes past every earlier peak.
+    """
+    gc.collect()
+    _trim()
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        start = _status_kb("VmRSS")
+        fn()
+        return max(0, _status_kb("VmHWM") - start)
+    except (OSError, TypeError):
+        if resource is None:
+            fn()
+            return 0
+        # ru_maxrss is KB on Linux, bytes on macOS
+        scale = 1024 if sys.platform == "darwin" else 1
+        start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        fn()
+        return max(0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start) / scale
+
+
+def measure(fn, repeat):
+    """Median wall time (s) over repeat runs, plus allocation stats of one run."""
+    fn()  # warm up regex caches, imports
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+
+    return {
+        "median_ms": statistics.median(times) * 1000,
+        "peak_kb": peak / 1024,
+        "retained_blocks": retained,
+    }
+
+
+def build_cases(repeat):
+    """Yield (name, fn, units, unit_name) for every benchmark case."""
+    checkin, checkout = "2026-06-12", "2026-06-15"
+
+    for n in fixtures.SKYSCANNER_SIZES:
+        for kind in ("oneway", "return"):
+            html = fixtures.load(f"skyscanner-{kind}-{n}.html")
+            round_trip = kind == "return"
+            yield (
+                f"parse_flights/{kind}-{n}",
+                lambda html=html, round_trip=round_trip: tripvibe_v2.parse_flights(html, SEARCH_URL, round_trip),
+                len(html) / 1e6, "MB",
+            )
+
+    for n in fixtures.BOOKING_SIZES:
+        html = fixtures.load(f"booking-{n}.html")
+        yield (
+            f"parse_hotels/{n}",
+            lambda html=html: tripvibe_v2.parse_hotels(html, HOTEL_URL, checkin, checkout),
+            len(html) / 1e6, "MB",
+        )
+
+    flights = tripvibe_v2.parse_flights(fixtures.load("skyscanner-return-250.html"), SEARCH_URL, True)
+    hotels = tripvibe_v2.parse_hotels(fixtures.load("booking-400.html"), HOTEL_URL, checkin, checkout)
+    yield (
+        "create_bundles",
+        lambda: tripvibe_v2.create_bundles(flights, hotels, "SIN", "NYCA", 3),
+        1, "searches",
+    )
+
+    bundles = tripvibe_v2.create_bundles(flights, hotels, "SIN", "NYCA", 3)
+    search = {
+        "bundles": bundles,
+        "origin": "SIN",
+        "destination": "NYCA",
+        "checkin": checkin,
+        "checkout": checkout,
+        "trip_type": "return",
+        "route_display": "Singapore ↔ New York",
+        "scraped_at": "2026-06-01T12:00:00",
+    }
+    yield (
+        "serialize",
+        lambda: storage.loads_search(storage.dumps_search(search)),
+        1, "searches",
+    )
+
+    def render():
+        with tripvibe_v2.app.test_request_context("/"):
+            render_template_string(
+                tripvibe_v2.HTML_TEMPLATE,
+                bundles=search["bundles"],
+                bundles_data=search,
+                trip_type="return",
+                route_display=search["route_display"],
+                booking_city=places.default_index().booking_city(search["destination"]),
+                default_checkin=checkin,
+                default_checkout=checkout,
+            )
+    yield ("render", render, 1, "pages")
+
+    def scrape_e2e():
+        tripvibe_v2.scrape_flights("SIN", "NYCA", checkin, checkout)
+        tripvibe_v2.scrape_hotels("NYCA", checkin, checkout)
+    yield ("scrape_e2e", scrape_e2e, 1, "searches")
+
+
+def install_replay(tmp_dir):
+    """Route every fetch to fixtures, lift the daily budget, keep hotels, alerts and price windows in tmp_dir."""
+    fetcher = FixtureFetcher({
+        "skyscanner": "skyscanner-return-60.html",
+        "booking": "booking-100.html",
+    })
+    browser_pool.set_default_pool(browser_pool.BrowserPool(
+        Path(tmp_dir) / "slots", size=4, fetcher_factory=lambda: fetcher,
+    ))
+    ratelimit.set_default_limiter(ratelimit.RateLimiter(
+        Path(tmp_dir) / "limits.db", limits={}, intervals={},
+    ))
+    hotel_index.set_default_index(hotel_index.HotelIndex(Path(tmp_dir) / "hotels.db"))
+    alerts.set_default_engine(alerts.AlertEngine(
+        Path(tmp_dir) / "alerts.db", Path(tmp_dir) / "alerts_outbox.jsonl",
+    ))
+    price_windows.set_default_windows(price_windows.PriceWindows(Path(tmp_dir) / "windows.db"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline TripVibe benchmarks")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--filter", default="")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    baseline = {}
+    if BASELINE_FILE.exists() and not args.save_baseline:
+        baseline = json.loads(BASELINE_FILE.read_text())
+
+    print("=" * 112)
+    print("TRIPVIBE BENCHMARKS")
+    print("=" * 112)
+    print(f"{'case':<30}{'median ms':>11}{'throughput':>22}{'peak KB':>11}{'peak RSS KB':>12}"
+          f"{'retained':>10}{'vs baseline':>14}")
+    print("-" * 112)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        install_replay(tmp)
+        for name, fn, units, unit_name in build_cases(args.repeat):
+            if args.filter not in name:
+                continue
+            stats = measure(fn, args.repeat)
+            stats["peak_rss_kb"] = peak_rss(fn)
+            results[name] = stats
+
+            throughput = units / (stats["median_ms"] / 1000) if stats["median_ms"] else 0
+            delta = ""
+            if name in baseline:
+                change = (stats["median_ms"] / baseline[name]["median_ms"] - 1) * 100
+                delta = f"{change:+.1f}%"
+            print(
+                f"{name:<30}{stats['median_ms']:>11.2f}{throughput:>11.1f} {unit_name + '/s':<10}"
+                f"{stats['peak_kb']:>11.0f}{stats['peak_rss_kb']:>12.0f}{stats['retained_blocks']:>10}{delta:>14}"
+            )
+
+    if args.save_baseline:
+        BASELINE_FILE.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaseline saved to {BASELINE_FILE}")
+
+
+if __name__ == "__main__":
+    main()
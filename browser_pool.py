@@ -0,0 +1,554 @@
+"""
+TripVibe Browser Pool - Cap Chromium instances across worker processes
+
+Every scrape launches a StealthyFetcher, which is a full Chromium process
+(a few hundred MB). With several workers behind one port, the number of
+browsers could grow with the number of concurrent searches on every worker.
+The pool hands out a fixed number of slots for the whole host:
+
+- On POSIX each slot is a lock file under DATA_DIR/browser_slots. flock()
+  is process-wide and released by the kernel if a worker crashes, so a dead
+  worker never leaks a slot.
+- Elsewhere it falls back to a per-process semaphore.
+
+Usage:
+    response = default_pool().fetch(url, solve_cloudflare=True)
+
+Set TRIPVIBE_BROWSERS to change the host-wide cap (default 2). All apps
+share the default slot directory, so the cap covers every app on the host.
+TRIPVIBE_FETCH_MODE=record|replay routes fetches through replay.py.
+TRIPVIBE_TABS=N runs fetches as tabs, N per browser, see tabs.py; the
+slots then count tabs, and a second set of TRIPVIBE_BROWSERS slots
+(browser_slots/browsers) counts the browsers the tabs run in.
+"""
+
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from scrapling import StealthyFetcher
+
+import metrics
+import ratelimit
+import replay
+import sessions
+import tabs
+import tracing
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_POOL_SIZE = int(os.environ.get("TRIPVIBE_BROWSERS", "2"))
+# Longest page kept for parsing (see page_html)
+MAX_HTML_CHARS = int(float(os.environ.get("TRIPVIBE_MAX_HTML_MB", "16")) * 1024 * 1024)
+DEFAULT_SLOT_DIR = Path(os.environ.get(
+    "TRIPVIBE_BROWSER_SLOTS",
+    Path(__file__).parent / "tripvibe_data" / "browser_slots",
+))
+
+# Result readiness per source (see wait_for_results): selector matches one
+# result card, deadline caps the wait after page load (seconds), settle is
+# how long the card count and XHR traffic must stay unchanged to call the
+# list complete
+READINESS = {
+    "skyscanner": {
+        "selector": '[class*="FlightsTicket_container"], [data-testid="itinerary"]',
+        "deadline": float(os.environ.get("TRIPVIBE_SKYSCANNER_READY", "15")),
+        "settle": 1.5,
+    },
+    "booking": {
+        "selector": '[data-testid="property-card"]',
+        "deadline": float(os.environ.get("TRIPVIBE_BOOKING_READY", "10")),
+        "settle": 1.0,
+    },
+}
+READY_POLL_INTERVAL = 0.25
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def configured_size():
+    """Slots default_pool() gets: tabs in tab mode, browsers otherwise."""
+    if tabs.DEFAULT_TABS > 1 and tabs.available():
+        return DEFAULT_POOL_SIZE * tabs.DEFAULT_TABS
+    return DEFAULT_POOL_SIZE
+
+
+# Report the cap before the first fetch creates the pool, not 0
+metrics.BROWSER_SLOTS_TOTAL.set(configured_size())
+
+
+class PoolTimeout(Exception):
+    """Raised when no browser slot frees up before the deadline."""
+
+
+class SlotFiles:
+    """A fixed number of host-wide slots, one lock file each.
+
+    Without flock() (Windows) the slots are only counted per process.
+    """
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+        self._local = threading.BoundedSemaphore(size)
+        if fcntl is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def try_acquire(self):
+        """Grab any free slot without waiting. Returns a token for release(), or None."""
+        if fcntl is None:
+            return -1 if self._local.acquire(blocking=False) else None
+        for i in range(self.size):
+            path = os.path.join(self.directory, f"slot-{i}.lock")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError:
+                os.close(fd)
+        return None
+
+    def release(self, token):
+        if fcntl is None:
+            self._local.release()
+            return
+        fcntl.flock(token, fcntl.LOCK_UN)
+        os.close(token)
+
+    def ask(self):
+        """Tell the slots' holders that someone is waiting for one."""
+        if fcntl is not None:
+            Path(self.directory, "wanted").touch()
+
+    def asked(self, within):
+        """Whether someone waited for a slot in the last `within` seconds."""
+        try:
+            return time.time() - os.stat(os.path.join(self.directory, "wanted")).st_mtime < within
+        except OSError:
+            return False
+
+
+class BrowserPool:
+    """Host-wide limit on concurrent StealthyFetcher browsers."""
+
+    def __init__(self, slot_dir, size=DEFAULT_POOL_SIZE, poll_interval=0.1,
+                 fetcher_factory=None, live=True, sessions=None):
+        """
+        Args:
+            slot_dir: Directory holding the slot lock files
+            size: Maximum browsers across all processes using slot_dir
+            poll_interval: Seconds between attempts when all slots are taken
+            fetcher_factory: Zero-arg callable returning an object with
+                fetch(url, **kwargs). Defaults to a headless StealthyFetcher;
+                benchmarks swap in a fixture-replay stub.
+            live: False when the fetcher never reaches the real sites
+                (replay mode); fetches then skip pacing and daily budgets.
+            sessions: SessionStore for reusing Cloudflare clearance, or None
+                to solve the challenge on every fetch
+        """
+        self.slot_dir = slot_dir
+        self.size = size
+        self.poll_interval = poll_interval
+        self.fetcher_factory = fetcher_factory or (lambda: StealthyFetcher(headless=True))
+        self.live = live
+        self.sessions = sessions
+        self._domain_sources = {}
+        self._local_sem = threading.BoundedSemaphore(size)
+        self._slots = SlotFiles(slot_dir, size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+
+    def _try_slot(self):
+        """Grab any free slot file. Returns an open fd or None."""
+        return self._slots.try_acquire()
+
+    @contextmanager
+    def slot(self, timeout=120):
+        """Hold one browser slot for the duration of the block."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self.waiting += 1
+        fd = None
+        try:
+            # Threads in this worker queue on the semaphore first, so only
+            # one flock() attempt per free slot is made per process
+            if not self._local_sem.acquire(timeout=timeout):
+                raise PoolTimeout(f"No browser slot free after {timeout}s")
+            try:
+                if fcntl is not None:
+                    fd = self._try_slot()
+                    while fd is None:
+                        if time.monotonic() > deadline:
+                            raise PoolTimeout(f"No browser slot free after {timeout}s")
+                        time.sleep(self.poll_interval)
+                        fd = self._try_slot()
+            except BaseException:
+                self._local_sem.release()
+                raise
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+        with self._lock:
+            self.in_use += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            if fd is not None:
+                self._slots.release(fd)
+            self._local_sem.release()
+
+    def fetch(self, url, source=None, budgeted=True, **kwargs):
+        """Fetch url with a StealthyFetcher while holding a slot.
+
+        Timing is split into slot wait, load (browser launch, Cloudflare and
+        navigation, up to the point the page is handed to page_action), the
+        caller's page_action if any (e.g. wait_for_results) and teardown
+        (closing the browser and building the response).
+
+        Args:
+            url: Page to fetch
+            source: Site name ("skyscanner", "booking"). When given, the
+                request is paced and counted against that site's daily
+                budget, and its latency and errors are recorded per source.
+                With solve_cloudflare=True it also reuses the domain's saved
+                session (see sessions.py) instead of solving again.
+            budgeted: False if the caller already spent this request's query
+                (e.g. on a plain-HTTP attempt at the same URL); it is still
+                recorded per source
+        """
+        if source is not None:
+            if self.live and budgeted:
+                ratelimit.default_limiter().acquire(source)
+            with metrics.SCRAPE_SECONDS.labels(source).time():
+                try:
+                    if self.sessions is not None and kwargs.get("solve_cloudflare"):
+                        response = self._fetch_with_session(url, source, kwargs)
+                    else:
+                        response = self.fetch(url, **kwargs)
+                except Exception:
+                    metrics.SCRAPE_ERRORS.labels(source).inc()
+                    raise
+            if response.status != 200:
+                metrics.SCRAPE_ERRORS.labels(source).inc()
+            return response
+
+        with tracing.span("browser.slot_wait"):
+            slot = self.slot()
+            slot.__enter__()
+        try:
+            start = time.perf_counter()
+            marks = []
+            user_action = kwargs.pop("page_action", None)
+
+            def timed(page):
+                marks.append(time.perf_counter())
+                try:
+                    return (yield from steps_of(user_action)(page)) if user_action else page
+                finally:
+                    marks.append(time.perf_counter())
+
+            fetcher = self.fetcher_factory()
+            response = fetcher.fetch(url, page_action=PageAction(timed), **kwargs)
+
+            end = time.perf_counter()
+            ready, acted = (marks[0], marks[1]) if len(marks) >= 2 else (end, end)
+            tracing.record("browser.load", (ready - start) * 1000)
+            if user_action:
+                tracing.record("browser.page_action", (acted - ready) * 1000)
+            tracing.record("browser.teardown", (end - acted) * 1000)
+            return response
+        finally:
+            slot.__exit__(None, None, None)
+
+    # ----- Cloudflare sessions -----
+
+    def _fetch_with_session(self, url, source, kwargs):
+        """Fetch with the domain's saved session; solve and save one if needed."""
+        domain = urlsplit(url).hostname
+        self._domain_sources[domain] = source
+
+        session = self.sessions.get(domain)
+        if session is not None:
+            try:
+                resume = self.sessions.fetch_kwargs(session)
+                restore = sessions.restore_steps(session["storage_state"])
+                if restore is not None:
+                    resume["page_setup"] = PageAction(restore)
+                response = self.fetch(url, **dict(kwargs, **resume))
+            except TypeError as e:
+                # Scrapling too old for cookies=; stop trying for this process
+                if "cookies" not in str(e):
+                    raise
+                print(f"Session reuse disabled: {e}")
+                self.sessions = None
+                return self.fetch(url, **kwargs)
+            if response.status == 200 and not sessions.looks_challenged(_head(response)):
+                metrics.BROWSER_SESSIONS.labels(source, "reused").inc()
+                return response
+            # Clearance expired early or was revoked: solve below
+            metrics.BROWSER_SESSIONS.labels(source, "rejected").inc()
+            self.sessions.invalidate(domain)
+
+        return self._solve_and_save(url, domain, source, kwargs)
+
+    def _solve_and_save(self, url, domain, source, kwargs):
+        """Fetch solving the challenge, and keep the session it produced."""
+        captured = []
+        user_action = kwargs.get("page_action")
+
+        def capture_then_act(page):
+            if page is not None:
+                state = yield from sessions.capture_steps(page)
+                if state is not None:
+                    captured.append(state)
+            return (yield from steps_of(user_action)(page)) if user_action else page
+
+        response = self.fetch(url, **dict(kwargs, solve_cloudflare=True, page_action=PageAction(capture_then_act)))
+        if captured and response.status == 200 and not sessions.looks_challenged(_head(response)):
+            self.sessions.put(domain, *captured[0])
+            metrics.BROWSER_SESSIONS.labels(source, "solved").inc()
+        return response
+
+    def refresh_session(self, domain):
+        """Solve domain's challenge again on its home page (refresher callback)."""
+        source = self._domain_sources.get(domain) or next(
+            (s for s in ratelimit.DAILY_LIMITS if s in domain), None
+        )
+        if source is not None and self.live:
+            ratelimit.default_limiter().acquire(source)
+        self._solve_and_save(f"https://{domain}/", domain, source or domain, {})
+
+
+# ----- page actions -----
+#
+# StealthyFetcher hands page_action a sync Playwright page; in tab mode
+# (tabs.py) it is an async page whose methods return awaitables. Our page
+# actions are written once as generators that yield each Playwright call:
+# the sync driver passes results straight back, the async driver awaits
+# them first.
+
+def _drive_sync(gen):
+    value = None
+    while True:
+        try:
+            # Sync Playwright calls already ran; their result is the value
+            value = gen.send(value)
+        except StopIteration as stop:
+            return stop.value
+
+
+async def _drive_async(gen):
+    send, value = gen.send, None
+    while True:
+        try:
+            op = send(value)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            value, send = (await op if inspect.isawaitable(op) else op), gen.send
+        except Exception as e:
+            value, send = e, gen.throw
+
+
+class PageAction:
+    """page_action usable with sync pages (call) and async pages (async_call)."""
+
+    def __init__(self, steps):
+        """
+        Args:
+            steps: Generator function taking the page; yields each
+                Playwright call and returns the action's result
+        """
+        self.steps = steps
+
+    def __call__(self, page):
+        return _drive_sync(self.steps(page))
+
+    async def async_call(self, page):
+        return await _drive_async(self.steps(page))
+
+
+def steps_of(action):
+    """Generator function for any page_action, to compose with yield from.
+
+    Plain functions are called as they are; they only get a usable page
+    with the sync fetcher.
+    """
+    if isinstance(action, PageAction):
+        return action.steps
+
+    def steps(page):
+        return action(page)
+        yield  # pragma: no cover - makes this a generator
+    return steps
+
+
+def wait_for_results(source, count):
+    """page_action that returns as soon as the result list is ready.
+
+    Result pages keep adding cards for a while after load, so a fixed wait
+    is either too short or wastes seconds. This polls the number of result
+    cards (the source's READINESS selector) and returns when:
+
+    - count cards are on the page ("enough"), or
+    - at least one card is there and neither the card count nor any
+      XHR/fetch traffic has changed for the source's settle time ("stable"), or
+    - the source's deadline passes ("deadline"), with whatever rendered.
+
+    The wait (from page load) is recorded per source and outcome in
+    tripvibe_time_to_result_seconds, and the wait for the first card in
+    tripvibe_time_to_first_result_seconds, so deadlines and settle times
+    can be tuned from /metrics. In replay mode there is no page and it
+    returns at once. Works with both the sync and the tab-mode (async) page.
+
+    Args:
+        source: Site name, a key of READINESS
+        count: Number of cards the parser wants
+    """
+    settings = READINESS[source]
+    selector = settings["selector"]
+    deadline_s = settings["deadline"]
+    settle = settings["settle"]
+
+    def steps(page):
+        if page is None:
+            return page
+
+        start = time.perf_counter()
+        # Search results arrive over XHR/fetch; any traffic means "not settled yet"
+        last_activity = [start]
+
+        def on_network(request):
+            if request.resource_type in ("xhr", "fetch"):
+                last_activity[0] = time.perf_counter()
+
+        events = ("request", "requestfinished", "requestfailed")
+        for event in events:
+            page.on(event, on_network)
+
+        outcome = "deadline"
+        first_seen = None
+        last_count, last_change = -1, start
+        try:
+            while True:
+                now = time.perf_counter()
+                try:
+                    n = yield page.evaluate("sel => document.querySelectorAll(sel).length", selector)
+                except Exception:
+                    n = 0  # mid-navigation (Cloudflare redirect); try again
+                if n != last_count:
+                    last_count, last_change = n, now
+                if n and first_seen is None:
+                    first_seen = now
+                    metrics.TIME_TO_FIRST_RESULT.labels(source).observe(now - start)
+
+                if n >= count:
+                    outcome = "enough"
+                    break
+                if n and now - max(last_change, last_activity[0]) >= settle:
+                    outcome = "stable"
+                    break
+                if now - start >= deadline_s:
+                    break
+                # Lets Playwright dispatch the network events between polls
+                yield page.wait_for_timeout(READY_POLL_INTERVAL * 1000)
+        finally:
+            for event in events:
+                page.remove_listener(event, on_network)
+
+        waited = time.perf_counter() - start
+        metrics.TIME_TO_RESULT.labels(source, outcome).observe(waited)
+        return page
+    return PageAction(steps)
+
+
+def default_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            # TRIPVIBE_TABS>1 runs fetches as tabs of a few browsers, see
+            # tabs.py; each browser holds one of TRIPVIBE_BROWSERS host-wide
+            # browser slots, so the workers together stay under the cap
+            host = tabs.host_from_env(
+                browser_slots=SlotFiles(DEFAULT_SLOT_DIR / "browsers", DEFAULT_POOL_SIZE),
+            )
+            size = configured_size()
+            # TRIPVIBE_FETCH_MODE=record/replay swaps the fetcher, see replay.py
+            fetcher = replay.fetcher_from_env(live_factory=(lambda: host) if host else None)
+            if fetcher is None:
+                pool = BrowserPool(
+                    DEFAULT_SLOT_DIR,
+                    size=size,
+                    fetcher_factory=(lambda: host) if host else None,
+                    sessions=sessions.default_store(),
+                )
+            else:
+                pool = BrowserPool(
+                    DEFAULT_SLOT_DIR,
+                    size=size,
+                    fetcher_factory=lambda: fetcher,
+                    live=fetcher.live,
+                    sessions=sessions.default_store() if fetcher.live else None,
+                )
+            if host is not None:
+                metrics.BROWSER_PROCESSES.set_function(lambda: host.open_browsers)
+            if pool.sessions is not None and os.environ.get("TRIPVIBE_SESSION_REFRESH", "1") != "0":
+                pool.sessions.start_refresher(pool.refresh_session)
+            metrics.BROWSER_SLOTS_IN_USE.set_function(lambda: pool.in_use)
+            metrics.BROWSER_SLOTS_TOTAL.set_function(lambda: pool.size)
+            metrics.BROWSER_QUEUE_DEPTH.set_function(lambda: pool.waiting)
+            _default_pool = pool
+        return _default_pool
+
+
+def _head(response, size=20000):
+    # Start of the page without serialising the whole DOM (html_content does)
+    body = getattr(response, "body", None)
+    if isinstance(body, bytes):
+        return body[:size].decode("utf-8", "replace")
+    return response.html_content[:size]
+
+
+def page_html(response):
+    """Take status, final URL and HTML from a response so it can be dropped.
+
+    A Scrapling response keeps its parsed DOM and raw body alive for as long
+    as it is referenced, several times the size of the HTML, and
+    html_content serialises the DOM again on every access. Scrapers read it
+    once here and drop the response before parsing:
+
+        response = default_pool().fetch(url, source="booking")
+        status, final_url, html = page_html(response)
+        del response
+
+    Pages longer than TRIPVIBE_MAX_HTML_MB (default 16) are cut there; the
+    result cards come first, and it bounds what one search can hold.
+
+    Returns:
+        (status, final_url, html)
+    """
+    html = response.html_content or ""
+    if len(html) > MAX_HTML_CHARS:
+        print(f"Page of {len(html) / 2**20:.1f} MB from {response.url} cut to {MAX_HTML_CHARS / 2**20:.0f} MB")
+        html = html[:MAX_HTML_CHARS]
+    return response.status, response.url, html
+
+
+def set_default_pool(pool):
+    """Replace the process-wide pool (e.g. with a fixture-replay pool)."""
+    global _default_pool
+    with _default_pool_lock:
+        _default_pool = pool
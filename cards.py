@@ -0,0 +1,262 @@
+"""
+Card Extraction - Compiled schemas for repeated result cards
+
+Catalogue pages are lists of near-identical cards (a book, a quote), and
+the scrapers used to read each field of each card with its own
+card.css("...") call: the selector is translated and compiled to XPath
+again and the card's subtree walked once per field. A CardSchema does that
+work once:
+
+- each field's CSS selector is compiled when the schema is built; simple
+  selectors (tag, .class, #id and [attr] / [attr=value] parts joined by
+  spaces, which covers what these scrapers use) become step matchers
+- extract() walks a card's subtree once: lxml's own iterator yields just
+  the elements whose tag ends one of the selectors, each is tested against
+  the fields ending in that tag, and the rest of a selector is checked on
+  the element's ancestors only when its last part matches; the walk stops
+  as soon as each single-valued field has its first match
+- other selectors, and fields given as XPath, are compiled once to lxml
+  XPath objects and evaluated per card (no re-parsing, but their own walk)
+
+Each field takes its value from the element's own text (like Scrapling's
+.text), all its text, or an attribute, then an optional transform.
+
+Usage:
+    BOOK = CardSchema("article.product_pod", {
+        "title": Field("h3 a", attr="title", default="Unknown"),
+        "price": Field("p.price_color", transform=parse_price, default=0.0),
+    })
+    books = BOOK.extract_all(response)     # [{"title": ..., "price": ...}, ...]
+    book = BOOK.extract(card)              # one Scrapling element or lxml element
+"""
+
+import re
+from functools import lru_cache
+
+from cssselect import HTMLTranslator
+from lxml import etree
+
+_COMPOUND = re.compile(
+    r"""(?P<tag>[a-zA-Z][\w-]*|\*)?(?P<parts>(?:[.#][\w-]+|\[[\w-]+(?:=(?:"[^"]*"|'[^']*'|[\w-]+))?\])*)$"""
+)
+_PART = re.compile(r"""([.#])([\w-]+)|\[([\w-]+)(=(?:"([^"]*)"|'([^']*)'|([\w-]+)))?\]""")
+
+_translator = HTMLTranslator()
+
+
+class _Step:
+    """One compound selector (div.a.b[x=y]) as a test on a single element."""
+
+    __slots__ = ("tag", "classes", "attrs")
+
+    def __init__(self, tag, classes, attrs):
+        self.tag = tag              # lower-case tag name, or None for any
+        self.classes = classes      # class names the element must all have
+        self.attrs = attrs          # (name, value or None for "present")
+
+    def matches(self, element, class_set):
+        if self.tag is not None and element.tag != self.tag:
+            return False
+        if self.classes and not self.classes <= class_set:
+            return False
+        for name, value in self.attrs:
+            actual = element.get(name)
+            if actual is None or value is not None and actual != value:
+                return False
+        return True
+
+
+@lru_cache(maxsize=None)
+def _compile_steps(css):
+    """(_Step, ...) for a descendant-only chain of simple compounds, or None.
+
+    Cached, so fields with the same selector share their steps.
+    """
+    steps = []
+    for compound in css.split():
+        m = _COMPOUND.match(compound)
+        if not m or not compound:
+            return None
+        tag = m.group("tag")
+        classes, attrs = set(), []
+        for kind, name, attr, equals, dq, sq, bare in _PART.findall(m.group("parts")):
+            if kind == ".":
+                classes.add(name)
+            elif kind == "#":
+                attrs.append(("id", name))
+            else:
+                attrs.append((attr, dq + sq + bare if equals else None))
+        steps.append(_Step(None if tag in (None, "*") else tag.lower(), frozenset(classes), attrs))
+    return tuple(steps) or None
+
+
+def _root(node):
+    # Scrapling elements wrap an lxml element; plain lxml elements pass through
+    return getattr(node, "_root", node)
+
+
+class Field:
+    """How to read one value from a card."""
+
+    __slots__ = ("css", "xpath", "attr", "all_text", "transform", "default", "many", "steps", "compiled")
+
+    def __init__(self, css=None, attr=None, all_text=False, transform=None, default=None, many=False, xpath=None):
+        """
+        Args:
+            css: Selector of the element, relative to the card (the card
+                itself can match its first part, as with card.css())
+            attr: Read this attribute instead of the text
+            all_text: Read all the element's text, children's included,
+                instead of only the text before its first child
+            transform: fn(raw string) -> value, applied to found values only
+            default: Value when no element (or attribute) is found
+            many: Read every match into a list instead of the first match
+            xpath: XPath relative to the card, instead of css
+        """
+        if (css is None) == (xpath is None):
+            raise ValueError("A field needs exactly one of css or xpath")
+        self.css = css
+        self.xpath = xpath
+        self.attr = attr
+        self.all_text = all_text
+        self.transform = transform
+        self.default = default
+        self.many = many
+        self.steps = _compile_steps(css) if css is not None else None
+        # Everything the walk can't match is compiled to XPath once
+        self.compiled = None
+        if self.steps is None:
+            self.compiled = etree.XPath(xpath if xpath is not None else _translator.css_to_xpath(css))
+
+    def read(self, element):
+        """The field's value from a matched element, or None if it has none."""
+        if isinstance(element, str):
+            raw = str(element)          # XPath text() or @attr result
+        elif self.attr is not None:
+            raw = element.get(self.attr)
+        elif self.all_text:
+            raw = "".join(element.itertext())
+        else:
+            raw = element.text or ""
+        if raw is None:
+            return None
+        return self.transform(raw) if self.transform else raw
+
+
+class CardSchema:
+    """Fields read from every card of a page in one walk of each card."""
+
+    def __init__(self, cards, fields):
+        """
+        Args:
+            cards: CSS selector of the cards on a page, or None if cards are
+                always passed in one at a time
+            fields: {name: Field}
+        """
+        self.fields = fields
+        self._cards = etree.XPath(_translator.css_to_xpath(cards)) if cards else None
+        self._compiled = [(name, field) for name, field in fields.items() if field.steps is None]
+
+        # Walked fields by the tag their selector ends in ("*" and the like
+        # go in _any_tag, and then every element is visited)
+        walked = [(name, field) for name, field in fields.items() if field.steps is not None]
+        self._by_tag = {}
+        self._any_tag = []
+        for name, field in walked:
+            tag = field.steps[-1].tag
+            if tag is None:
+                self._any_tag.append((name, field))
+            else:
+                self._by_tag.setdefault(tag, []).append((name, field))
+        for tag, candidates in self._by_tag.items():
+            candidates.extend(self._any_tag)
+        self._tags = () if self._any_tag else tuple(self._by_tag)
+        self._walked = bool(walked)
+        self._singles = sum(1 for _, field in walked if not field.many)
+        # Stop at the first match of each field unless some field wants all of them
+        self._stop_early = self._singles == len(walked)
+
+    def extract_all(self, page):
+        """Every card on page (a Scrapling response or lxml tree) as a dict."""
+        if self._cards is None:
+            raise ValueError("This schema has no cards selector; use extract() per card")
+        return [self.extract(card) for card in self._cards(_root(page))]
+
+    def extract(self, card):
+        """The fields of one card (a Scrapling element or lxml element)."""
+        root = _root(card)
+        found = {}
+        if self._walked:
+            self._walk(root, found)
+        for name, field in self._compiled:
+            values = []
+            for element in field.compiled(root):
+                value = field.read(element)
+                if value is not None:
+                    values.append(value)
+                    if not field.many:
+                        break
+            found[name] = values if field.many else (values[0] if values else None)
+
+        result = {}
+        for name, field in self.fields.items():
+            value = found.get(name)
+            if field.many:
+                result[name] = value or []
+            else:
+                result[name] = field.default if value is None else value
+        return result
+
+    def _walk(self, root, found):
+        # lxml yields only elements whose tag ends some walked selector, in
+        # document order; the earlier steps are checked right to left
+        # against the element's ancestors, up to the card
+        remaining = self._singles
+        for element in root.iter(*self._tags) if self._tags else root.iter():
+            candidates = self._by_tag.get(element.tag)
+            if candidates is None:
+                candidates = self._any_tag
+                if not candidates or not isinstance(element.tag, str):
+                    continue
+            class_set = None
+            checked, matched = None, False
+            for name, field in candidates:
+                if not field.many and name in found:
+                    continue
+                steps = field.steps
+                if steps is not checked:
+                    if class_set is None:
+                        class_set = frozenset((element.get("class") or "").split())
+                    checked = steps
+                    matched = steps[-1].matches(element, class_set) and _under(element, steps, root)
+                if not matched:
+                    continue
+                value = field.read(element)
+                if value is None:
+                    continue
+                if field.many:
+                    found.setdefault(name, []).append(value)
+                else:
+                    found[name] = value
+                    remaining -= 1
+                    if remaining == 0 and self._stop_early:
+                        return
+
+
+def _under(element, steps, root):
+    """Whether element's ancestors (the card included) match steps[:-1], innermost last."""
+    i = len(steps) - 2
+    if i < 0:
+        return True
+    if element is root:
+        return False
+    node = element.getparent()
+    while node is not None:
+        if steps[i].matches(node, frozenset((node.get("class") or "").split())):
+            i -= 1
+            if i < 0:
+                return True
+        if node is root:
+            return False
+        node = node.getparent()
+    return False
@@ -0,0 +1,283 @@
+"""
+TripVibe Currency - FX rates, price normalisation and Skyscanner markets
+
+Each scraper used to hard-code its own idea of the exchange rate (0.21 and
+0.74 USD per MYR/SGD in one place, 0.75 in another) and the bundle app
+assumed SGD everywhere. This module gives them one rate table:
+
+- rates are units per US dollar, loaded from a local JSON file
+  (TRIPVIBE_FX_RATES, default tripvibe_data/fx_rates.json) over built-in
+  defaults, so every currency below converts even with no file
+- the file is re-read when it changes (checked every few seconds), so a
+  cron job or another worker can drop in new rates without a restart
+- with TRIPVIBE_FX_URL set (any JSON feed shaped like {"base": "USD",
+  "rates": {...}}, e.g. open.er-api.com), rates older than TRIPVIBE_FX_TTL
+  are re-downloaded in a background thread and written to the file for
+  the other workers
+
+A search takes one Rates snapshot and converts with it: a conversion
+factor is computed once per currency pair and applied to the whole price
+list, so normalising a page of prices is one multiply per price.
+
+Skyscanner prices depend on the market (site) a search is run in, so the
+same flight can be cheaper from another market. MARKETS maps market codes
+to their site and currency for scrapers that compare markets.
+
+Usage:
+    rates = default_table().snapshot()
+    rates.convert(812, "SGD", "USD")                 # 601
+    rates.convert_all([812, 950, 1210], "MYR", "SGD")
+    detect("https://www.skyscanner.com.my/...")      # "MYR"
+"""
+
+import json
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import storage
+
+DATA_DIR = Path(__file__).parent / "tripvibe_data"
+DEFAULT_PATH = Path(os.environ.get("TRIPVIBE_FX_RATES", DATA_DIR / "fx_rates.json"))
+FX_URL = os.environ.get("TRIPVIBE_FX_URL", "")
+FX_TTL = float(os.environ.get("TRIPVIBE_FX_TTL", 12 * 3600))
+CHECK_INTERVAL = 5.0            # seconds between looks at the rates file
+RETRY_INTERVAL = 10 * 60        # seconds between download attempts
+FETCH_TIMEOUT = 10
+
+# Units per USD; used for any currency the rates file doesn't list
+DEFAULT_RATES = {
+    "USD": 1.0,
+    "SGD": 1.35,
+    "MYR": 4.7,
+    "EUR": 0.92,
+    "GBP": 0.79,
+    "AUD": 1.52,
+    "NZD": 1.65,
+    "CAD": 1.36,
+    "JPY": 150.0,
+    "KRW": 1350.0,
+    "CNY": 7.2,
+    "HKD": 7.8,
+    "TWD": 32.0,
+    "THB": 36.0,
+    "IDR": 15800.0,
+    "PHP": 56.0,
+    "VND": 25000.0,
+    "INR": 83.0,
+    "AED": 3.67,
+}
+
+# How prices are written for people
+SYMBOLS = {
+    "USD": "US$", "SGD": "S$", "MYR": "RM ", "EUR": "€", "GBP": "£",
+    "AUD": "A$", "NZD": "NZ$", "CAD": "C$", "JPY": "¥", "KRW": "₩",
+    "CNY": "CN¥", "HKD": "HK$", "TWD": "NT$", "THB": "฿", "IDR": "Rp ",
+    "PHP": "₱", "VND": "₫", "INR": "₹", "AED": "AED ",
+}
+
+# The symbol in front of prices on Skyscanner's pages; dollar markets all
+# show a bare "$" (S$ and US$ end in it too)
+PAGE_SYMBOLS = {
+    "USD": "$", "SGD": "$", "AUD": "$", "NZD": "$", "CAD": "$", "HKD": "$",
+    "TWD": "$", "MYR": "RM", "EUR": "€", "GBP": "£", "JPY": "¥", "KRW": "₩",
+    "CNY": "¥", "THB": "฿", "IDR": "Rp", "PHP": "₱", "VND": "₫", "INR": "₹",
+    "AED": "AED",
+}
+
+# Skyscanner market -> (site, currency its prices are shown in)
+MARKETS = {
+    "SG": ("www.skyscanner.com.sg", "SGD"),
+    "MY": ("www.skyscanner.com.my", "MYR"),
+    "US": ("www.skyscanner.com", "USD"),
+    "UK": ("www.skyscanner.net", "GBP"),
+    "AU": ("www.skyscanner.com.au", "AUD"),
+    "IN": ("www.skyscanner.co.in", "INR"),
+    "DE": ("www.skyscanner.de", "EUR"),
+    "JP": ("www.skyscanner.jp", "JPY"),
+}
+_MARKET_CURRENCY = {site: code for site, code in MARKETS.values()}
+
+_default_table = None
+_default_table_lock = threading.Lock()
+
+
+def detect(url, default="USD"):
+    """Currency of the prices on a page, from its URL.
+
+    An explicit currency/selected_currency query parameter wins; otherwise
+    the site's market decides (skyscanner.com.my -> MYR).
+    """
+    parts = urlsplit(url or "")
+    query = parse_qs(parts.query)
+    for name in ("currency", "selected_currency"):
+        if query.get(name):
+            return query[name][0].upper()
+    return _MARKET_CURRENCY.get(parts.hostname or "", default)
+
+
+def market_site(market):
+    """(site, currency) of a Skyscanner market code; ValueError if unknown."""
+    try:
+        return MARKETS[market.upper()]
+    except KeyError:
+        raise ValueError(f"Unknown market: {market}") from None
+
+
+class Rates:
+    """An immutable set of rates; take one per search and convert with it."""
+
+    __slots__ = ("rates", "as_of", "source")
+
+    def __init__(self, rates, as_of=None, source="built-in"):
+        """
+        Args:
+            rates: {currency: units per USD}
+            as_of: When the rates were published (ISO string), if known
+            source: Where they came from (file path, URL or "built-in")
+        """
+        self.rates = rates
+        self.as_of = as_of
+        self.source = source
+
+    def factor(self, from_currency, to_currency):
+        """Multiply an amount in from_currency by this to get to_currency."""
+        if from_currency == to_currency:
+            return 1.0
+        try:
+            return self.rates[to_currency] / self.rates[from_currency]
+        except KeyError as e:
+            raise ValueError(f"No exchange rate for {e.args[0]}") from None
+
+    def convert(self, amount, from_currency, to_currency):
+        """amount converted and rounded to a whole unit."""
+        return int(round(amount * self.factor(from_currency, to_currency)))
+
+    def convert_all(self, amounts, from_currency, to_currency):
+        """A list of amounts converted with one factor, in the same order."""
+        if from_currency == to_currency:
+            return list(amounts)
+        factor = self.factor(from_currency, to_currency)
+        return [int(round(amount * factor)) for amount in amounts]
+
+
+def _parse(payload, source):
+    """Rates from a feed or file payload, rebased to USD, over the defaults."""
+    rates = payload.get("rates") or {}
+    base = (payload.get("base") or payload.get("base_code") or "USD").upper()
+    rates = {code.upper(): float(rate) for code, rate in rates.items() if float(rate) > 0}
+    if base != "USD":
+        if "USD" not in rates:
+            raise ValueError(f"Rates based on {base} don't include USD")
+        usd = rates["USD"]
+        rates = {code: rate / usd for code, rate in rates.items()}
+        rates[base] = 1.0 / usd
+    merged = dict(DEFAULT_RATES)
+    merged.update(rates)
+    merged["USD"] = 1.0
+    as_of = payload.get("as_of") or payload.get("time_last_update_utc")
+    return Rates(merged, as_of, source)
+
+
+class FXTable:
+    """Rates from a local file, reloaded when it changes and refreshed when stale."""
+
+    def __init__(self, path, url=FX_URL, ttl=FX_TTL, check_interval=CHECK_INTERVAL):
+        """
+        Args:
+            path: JSON rates file ({"base": "USD", "rates": {...}, "as_of": ...})
+            url: Feed to download fresh rates from when the file is older
+                than ttl ("" to only ever read the file)
+            ttl: Seconds rates are trusted before a download is started
+            check_interval: Seconds between checks of the file's mtime
+        """
+        self.path = path
+        self.url = url
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._rates = Rates(dict(DEFAULT_RATES))
+        self._mtime = None
+        self._checked = 0.0
+        self._refreshing = False
+        self._next_download = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """The current Rates. Cheap: the file is only looked at every few seconds."""
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            self._checked = now
+            self._check()
+        return self._rates
+
+    def _check(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime != self._mtime:
+            self._load(mtime)
+        stale = mtime is None or time.time() - mtime > self.ttl
+        if stale and self.url:
+            self._refresh_in_background()
+
+    def _load(self, mtime):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._rates = _parse(json.load(f), os.fspath(self.path))
+        except (OSError, ValueError) as e:
+            # Keep the previous rates; a half-written or broken file isn't fatal
+            print(f"FX rates in {self.path} not loaded: {e}")
+        self._mtime = mtime
+
+    def _refresh_in_background(self):
+        with self._lock:
+            # One download at a time, and not again right after a failed one
+            if self._refreshing or time.monotonic() < self._next_download:
+                return
+            self._refreshing = True
+            self._next_download = time.monotonic() + RETRY_INTERVAL
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"FX rate refresh from {self.url} failed: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def refresh(self):
+        """Download rates from url now and save them to the file for every worker."""
+        with urllib.request.urlopen(self.url, timeout=FETCH_TIMEOUT) as resp:
+            rates = _parse(json.load(resp), self.url)
+        os.makedirs(os.path.dirname(os.fspath(self.path)), exist_ok=True)
+        storage.atomic_write(self.path, json.dumps({
+            "base": "USD",
+            "rates": rates.rates,
+            "as_of": rates.as_of or datetime.now().isoformat(),
+            "source": self.url,
+        }, indent=2))
+        self._checked = 0.0
+        return rates
+
+
+def default_table():
+    """Return the process-wide rate table, creating it on first use."""
+    global _default_table
+    with _default_table_lock:
+        if _default_table is None:
+            _default_table = FXTable(DEFAULT_PATH)
+        return _default_table
+
+
+def set_default_table(table):
+    """Replace the process-wide table (e.g. with one reading a test file)."""
+    global _default_table
+    with _default_table_lock:
+        _default_table = table
@@ -10,32 +10,23 @@ import os
 from datetime import datetime, timedelta
 from pathlib import Path
 from flask import Flask, render_template_string, request, jsonify
-from scrapling import StealthyFetcher
+
+import browser_pool
+import currency
+import metrics
+import places
+import price_windows
+import storage
+import tracing
 
 app = Flask(__name__)
+tracing.init_app(app)
+metrics.init_app(app)
+places.init_app(app)
 
 # Store results in memory and file
 RESULTS_FILE = Path(__file__).parent / "flight_results.json"
 
-# Common airport codes
-AIRPORTS = {
-    "SIN": "Singapore",
-    "NYCA": "New York (All)",
-    "JFK": "New York JFK",
-    "EWR": "Newark",
-    "LAX": "Los Angeles",
-    "SFO": "San Francisco",
-    "LHR": "London Heathrow",
-    "CDG": "Paris CDG",
-    "NRT": "Tokyo Narita",
-    "HND": "Tokyo Haneda",
-    "HKG": "Hong Kong",
-    "BKK": "Bangkok",
-    "DXB": "Dubai",
-    "SYD": "Sydney",
-    "ICN": "Seoul Incheon",
-}
-
 HTML_TEMPLATE = """
 <!DOCTYPE html>
 <html lang="en">
@@ -206,19 +197,11 @@ HTML_TEMPLATE = """
             <form class="search-form" id="searchForm">
                 <div class="form-group">
                     <label>From</label>
-                    <select name="origin" id="origin">
-                        {% for code, name in airports.items() %}
-                        <option value="{{ code }}" {% if code == 'SIN' %}selected{% endif %}>{{ code }} - {{ name }}</option>
-                        {% endfor %}
-                    </select>
+                    {{ place_picker('origin', 'SIN') }}
                 </div>
                 <div class="form-group">
                     <label>To</label>
-                    <select name="destination" id="destination">
-                        {% for code, name in airports.items() %}
-                        <option value="{{ code }}" {% if code == 'NYCA' %}selected{% endif %}>{{ code }} - {{ name }}</option>
-                        {% endfor %}
-                    </select>
+                    {{ place_picker('destination', 'NYCA') }}
                 </div>
                 <div class="form-group">
                     <label>Date</label>
@@ -308,6 +291,7 @@ HTML_TEMPLATE = """
         </div>
     </div>
 
+    {{ places_script() }}
     <script>
         document.getElementById('searchForm').addEventListener('submit', async (e) => {
             e.preventDefault();
@@ -352,6 +336,11 @@ HTML_TEMPLATE = """
 """
 
 
+# SGD fare window for routes without enough price history (see price_windows.py)
+FLIGHT_WINDOW = (400, 20000)
+
+
+@tracing.traced()
 def scrape_flights(origin, destination, date_str):
     """Scrape flight prices from Skyscanner."""
     # Convert date to Skyscanner format (YYMMDD)
@@ -361,29 +350,60 @@ def scrape_flights(origin, destination, date_str):
     # Force Singapore locale for SGD pricing
     url = f"https://www.skyscanner.com.sg/transport/flights/{origin.lower()}/{destination.lower()}/{sky_date}/?currency=SGD&locale=en-GB&market=SG"
 
-    fetcher = StealthyFetcher(headless=True)
-    response = fetcher.fetch(url, solve_cloudflare=True)
+    response = browser_pool.default_pool().fetch(
+        url,
+        source="skyscanner",
+        solve_cloudflare=True,
+        page_action=browser_pool.wait_for_results("skyscanner", 20),
+    )
 
-    if response.status != 200:
+    # Keep only the HTML; the response's DOM is freed before parsing
+    status, final_url, html = browser_pool.page_html(response)
+    del response
+    if status != 200:
         return None
 
-    html = response.html_content
+    # The route's learned fare window, once it has enough history
+    window = price_windows.default_windows().window(
+        price_windows.flight_key(origin, destination, False), FLIGHT_WINDOW,
+    )
+    results = parse_flights(html, final_url, origin, destination, date_str, window)
+    metrics.ITEMS_EXTRACTED.labels("skyscanner").observe(len(results["prices"]))
 
-    # Detect currency - default to SGD
-    if ".my" in response.url and "SGD" not in response.url:
-        currency, symbol, rate = "MYR", "RM ", 0.21
-    else:
-        # Singapore dollars
-        currency, symbol, rate = "SGD", "S$", 0.75
+    # Save to file
+    with tracing.span("store.put"):
+        storage.write_json(results, RESULTS_FILE)
+
+    return results
+
+
+@tracing.traced()
+def parse_flights(html, final_url, origin, destination, date_str, window=None):
+    """Build the results dict from a Skyscanner page.
+
+    Args:
+        html: Page HTML
+        final_url: URL after redirects, used to detect the currency
+        window: (low, high) SGD fare window (default FLIGHT_WINDOW); prices
+            from this page aren't fed back into the route's sketch, as the
+            whole page is scanned, scripts included
+    """
+    # Detect currency from the final URL - default to SGD
+    code = currency.detect(final_url, "SGD")
+    symbol = currency.SYMBOLS.get(code, code + " ")
+    rates = currency.default_table().snapshot()
+    rate = rates.factor(code, "USD")
 
     # Extract prices - Singapore site uses $ without S prefix
-    price_pattern = r'\$\s*([\d,]+)'
+    price_pattern = re.escape(currency.PAGE_SYMBOLS.get(code, code)) + r'\s*([\d,]+)'
     matches = re.findall(price_pattern, html)
+    # SGD fare window, in the page's currency
+    low, high = rates.convert_all(window or FLIGHT_WINDOW, "SGD", code)
     flight_prices = []
     for p in matches:
         try:
             val = int(p.replace(',', ''))
-            if 400 <= val <= 20000:  # SGD flight price range
+            if low <= val <= high:
                 flight_prices.append(val)
         except:
             pass
@@ -395,10 +415,10 @@ def scrape_flights(origin, destination, date_str):
         "Korean Air", "EVA Air", "China Airlines", "Air China", "Turkish Airlines",
         "Lufthansa", "British Airways", "American Airlines", "Asiana"
     ]
-    found_airlines = set()
-    for airline in airline_names:
-        if airline.lower() in html.lower():
-            found_airlines.add(airline)
+    # One lower-cased copy of the page, not one per airline
+    lowered = html.lower()
+    found_airlines = {airline for airline in airline_names if airline.lower() in lowered}
+    del lowered
 
     # Extract durations
     durations = re.findall(r'(\d{1,2}h\s*\d{0,2}m?)', html)
@@ -422,7 +442,7 @@ def scrape_flights(origin, destination, date_str):
     results = {
         "route": f"{origin} → {destination}",
         "date": date_str,
-        "currency": currency,
+        "currency": code,
         "currency_symbol": symbol,
         "usd_rate": rate,
         "prices": sorted_prices,
@@ -433,13 +453,10 @@ def scrape_flights(origin, destination, date_str):
         "scraped_at": datetime.now().isoformat()
     }
 
-    # Save to file
-    with open(RESULTS_FILE, "w") as f:
-        json.dump(results, f, indent=2)
-
     return results
 
 
+@tracing.traced("store.get")
 def load_results():
     """Load cached results if available."""
     if RESULTS_FILE.exists():
@@ -452,12 +469,12 @@ def load_results():
 def index():
     results = load_results()
     default_date = (datetime.now() + timedelta(days=90)).strftime("%Y-%m-%d")
-    return render_template_string(
-        HTML_TEMPLATE,
-        results=results,
-        airports=AIRPORTS,
-        default_date=default_date
-    )
+    with tracing.span("render"):
+        return render_template_string(
+            HTML_TEMPLATE,
+            results=results,
+            default_date=default_date
+        )
 
 
 @app.route("/api/search")
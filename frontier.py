@@ -0,0 +1,598 @@
+"""
+Crawl Frontier - Whole-site crawls with deduped URLs, per-host politeness and resume
+
+The tutorial scrapers walk one fixed listing. Crawling a whole catalogue
+(every books.toscrape.com category, every quotes.toscrape.com tag) means
+following links found on the pages themselves, and a Crawler does that
+through one pooled session (http_pool.HttpPool):
+
+- a priority queue of URLs per host: lower priority numbers are fetched
+  first (the next page of a listing before a new category), ties in the
+  order the URLs were found
+- a scalable Bloom filter of every URL ever queued, so a link seen on
+  every page (the category sidebar) is fetched once. It keeps a few bits
+  per URL whatever the URL's length, and grows by adding a filter twice
+  the size of the last, so its false-positive rate stays about
+  `error_rate` however many URLs the crawl finds. A false positive skips
+  a URL; it never fetches one twice
+- per host, at most `max_per_host` requests in flight and `crawl_delay`
+  seconds between request starts, however many hosts share the pool
+- a page that fails with a connection error, 429 or 5xx is queued again,
+  its host backed off, up to `max_attempts` tries; one that still fails is
+  kept in the checkpoint and retried when the crawl resumes
+- a checkpoint (queue, failed pages, Bloom filter, counters and how much
+  of the output file is written) saved atomically every `checkpoint_every` pages, at the
+  end and on Ctrl-C. A crawl started with the same checkpoint resumes where
+  it stopped: pages in flight when it was saved are queued again and
+  output written after it is dropped, so finished pages aren't fetched
+  again and no item is written twice
+
+A crawl's handler gets each 200 response and returns the links to follow
+and the items to keep; items are appended to a JSON-lines file.
+
+Usage:
+    python frontier.py books            # every category of books.toscrape.com
+    python frontier.py quotes           # every tag of quotes.toscrape.com
+    python frontier.py books --fresh    # ignore the checkpoint, start over
+
+    crawler = Crawler(handler, DATA_DIR / "crawl.json", DATA_DIR / "crawl.jsonl")
+    crawler.run(["https://books.toscrape.com/index.html"])
+"""
+
+import base64
+import hashlib
+import heapq
+import json
+import math
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import basic_scraper
+import price_tracker
+import storage
+from http_pool import HttpPool
+
+DATA_DIR = Path(__file__).parent / "data"
+CHECKPOINT_VERSION = 1
+
+DEFAULT_MAX_PER_HOST = 2
+DEFAULT_CRAWL_DELAY = 0.5       # seconds between request starts, per host
+DEFAULT_CHECKPOINT_EVERY = 50   # pages
+DEFAULT_MAX_ATTEMPTS = 3        # tries per page before it's left for a resume
+
+
+def normalize_url(url, base=None):
+    """The URL as it's deduped: absolute, no fragment, lower-case scheme and
+    host, no default port, "/" for an empty path.
+
+    Args:
+        url: URL or link as found on a page
+        base: URL of that page, for relative links
+    """
+    if base:
+        url = urljoin(base, url)
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+
+class _BloomSlice:
+    """One fixed-size Bloom filter, sized for capacity items at error_rate."""
+
+    def __init__(self, capacity, error_rate, bits=None, count=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Optimal sizing: m = -n ln p / (ln 2)^2 bits, k = log2(1/p) hashes
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(math.ceil(-math.log2(error_rate))))
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        self.count = count
+
+    def _positions(self, h1, h2):
+        # Double hashing: k positions from two 64-bit hashes
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def __contains__(self, hashed):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(*hashed))
+
+    def add(self, hashed):
+        bits = self.bits
+        for p in self._positions(*hashed):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class ScalableBloomFilter:
+    """Set membership for URLs in a few bits each, growing as items are added.
+
+    Filters are added as the last one fills: each holds twice the items of
+    the one before at half its error rate, so the combined false-positive
+    rate stays about error_rate (Almeida et al., "Scalable Bloom Filters").
+    Memory is the bits alone: a few bytes per URL at the default rate.
+    """
+
+    GROWTH = 2          # capacity multiplier per new filter
+    TIGHTENING = 0.5    # error-rate multiplier per new filter
+
+    def __init__(self, initial_capacity=10000, error_rate=1e-4):
+        """
+        Args:
+            initial_capacity: Items the first filter holds
+            error_rate: Chance that an unseen URL reads as seen
+        """
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self._slices = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        # An odd second hash never cycles back to the first position early
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    def _grow(self):
+        n = len(self._slices)
+        # error_rate * (1 - r) * r^n summed over n comes to error_rate
+        error = self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** n
+        self._slices.append(_BloomSlice(self.initial_capacity * self.GROWTH ** n, error))
+
+    def __contains__(self, item):
+        hashed = self._hash(item)
+        with self._lock:
+            return any(hashed in s for s in self._slices)
+
+    def add(self, item):
+        """Add item; returns True if it wasn't (as far as the filter knows) seen before."""
+        hashed = self._hash(item)
+        with self._lock:
+            if any(hashed in s for s in self._slices):
+                return False
+            if not self._slices or self._slices[-1].count >= self._slices[-1].capacity:
+                self._grow()
+            self._slices[-1].add(hashed)
+            return True
+
+    def __len__(self):
+        return sum(s.count for s in self._slices)
+
+    @property
+    def nbytes(self):
+        return sum(len(s.bits) for s in self._slices)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "initial_capacity": self.initial_capacity,
+                "error_rate": self.error_rate,
+                "slices": [
+                    [s.capacity, s.error_rate, s.count, base64.b64encode(s.bits).decode("ascii")]
+                    for s in self._slices
+                ],
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        bloom = cls(data["initial_capacity"], data["error_rate"])
+        for capacity, error_rate, count, bits in data["slices"]:
+            bloom._slices.append(_BloomSlice(capacity, error_rate, bytearray(base64.b64decode(bits)), count))
+        return bloom
+
+
+class Frontier:
+    """URLs waiting to be fetched, handed out by priority within each host's limits."""
+
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST, crawl_delay=DEFAULT_CRAWL_DELAY, seen=None,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Args:
+            max_per_host: Most requests in flight to one host
+            crawl_delay: Seconds between request starts to one host
+            seen: ScalableBloomFilter of URLs already queued (default: empty)
+            max_attempts: Tries per URL before done(retry=True) gives up on it
+        """
+        self.max_per_host = max(1, max_per_host)
+        self.crawl_delay = crawl_delay
+        self.max_attempts = max(1, max_attempts)
+        self.seen = seen if seen is not None else ScalableBloomFilter()
+        self._queues = {}               # host -> heap of [priority, seq, url, depth, attempts]
+        self._in_flight = {}            # host -> requests started, not done
+        self._leased = {}               # url -> entry, while its request is in flight
+        self._failed = {}               # url -> entry, out of attempts this run
+        self._next_slot = {}            # host -> monotonic time of its next start
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def add(self, url, priority=1, depth=0):
+        """Queue url unless it was queued before; returns True if it was queued."""
+        url = normalize_url(url)
+        if not self.seen.add(url):
+            return False
+        with self._lock:
+            self._push([priority, self._seq, url, depth, 0])
+            self._seq += 1
+        return True
+
+    def _push(self, entry):
+        heapq.heappush(self._queues.setdefault(host_of(entry[2]), []), entry)
+
+    def pop(self):
+        """The best-priority URL of any host free to take a request now.
+
+        Returns:
+            (url, priority, depth), or None if every host with queued URLs is
+            at its cap or inside its crawl delay
+        """
+        with self._lock:
+            now = time.monotonic()
+            best = None
+            for host, queue in self._queues.items():
+                if not queue or self._in_flight.get(host, 0) >= self.max_per_host:
+                    continue
+                if self._next_slot.get(host, 0.0) > now:
+                    continue
+                if best is None or queue[0] < self._queues[best][0]:
+                    best = host
+            if best is None:
+                return None
+            entry = heapq.heappop(self._queues[best])
+            self._in_flight[best] = self._in_flight.get(best, 0) + 1
+            self._next_slot[best] = now + self.crawl_delay
+            self._leased[entry[2]] = entry
+            priority, _, url, depth, _ = entry
+            return url, priority, depth
+
+    def done(self, url, retry=False, failed=False):
+        """Mark a popped url's request finished, freeing its host's slot.
+
+        Args:
+            url: URL as returned by pop()
+            retry: The request failed transiently; queue url again behind
+                the host's pages, backing the host off, unless it's out of
+                attempts
+            failed: The page failed for good in this run; keep it for the
+                checkpoint so a resumed crawl tries it again
+
+        Returns:
+            True if url was queued again
+        """
+        with self._lock:
+            entry = self._leased.pop(url, None)
+            host = host_of(url)
+            self._in_flight[host] -= 1
+            if entry is None or not (retry or failed):
+                return False
+            entry[4] += 1
+            if failed or entry[4] >= self.max_attempts:
+                self._failed[url] = entry
+                return False
+            entry[1] = self._seq
+            self._seq += 1
+            self._push(entry)
+            # Exponential backoff: the host is struggling, not just this page
+            backoff = max(self.crawl_delay, 1.0) * 2 ** (entry[4] - 1)
+            self._next_slot[host] = max(self._next_slot.get(host, 0.0), time.monotonic() + backoff)
+            return True
+
+    def wait_time(self):
+        """Seconds until some host with queued URLs may start a request.
+
+        None if every such host is at its cap (only a finished request frees
+        one) or nothing is queued.
+        """
+        with self._lock:
+            now = time.monotonic()
+            waits = [
+                max(0.0, self._next_slot.get(host, 0.0) - now)
+                for host, queue in self._queues.items()
+                if queue and self._in_flight.get(host, 0) < self.max_per_host
+            ]
+            return min(waits) if waits else None
+
+    def queued(self):
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._leased)
+
+    def failed(self):
+        """URLs out of attempts in this run, left for a resumed crawl."""
+        with self._lock:
+            return list(self._failed)
+
+    def __bool__(self):
+        return bool(self.queued() or self.in_flight())
+
+    def to_dict(self):
+        """Queue, failed pages and seen-URL filter; requests in flight are saved as queued."""
+        with self._lock:
+            entries = [entry for queue in self._queues.values() for entry in queue]
+            entries.extend(self._leased.values())
+            failed = list(self._failed.values())
+            seq = self._seq
+        return {
+            "queue": sorted(entries),
+            "failed": sorted(failed),
+            "seq": seq,
+            "seen": self.seen.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data, max_per_host=DEFAULT_MAX_PER_HOST, crawl_delay=DEFAULT_CRAWL_DELAY,
+                  max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """A frontier resumed from to_dict(); failed pages are queued again with fresh attempts."""
+        frontier = cls(max_per_host, crawl_delay, ScalableBloomFilter.from_dict(data["seen"]), max_attempts)
+        for entry in data["queue"]:
+            # Checkpoints from before retries have no attempt count
+            frontier._push((list(entry) + [0])[:5])
+        for entry in data.get("failed", []):
+            frontier._push(list(entry[:4]) + [0])
+        frontier._seq = data["seq"]
+        return frontier
+
+
+class Crawler:
+    """Fetches a Frontier's URLs through one HttpPool, checkpointing as it goes."""
+
+    def __init__(self, handler, checkpoint_path, output_path, max_per_host=DEFAULT_MAX_PER_HOST,
+                 crawl_delay=DEFAULT_CRAWL_DELAY, checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                 max_pages=None, pool=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Args:
+            handler: fn(url, response, depth) -> (links, items); links are
+                URLs or (url, priority) pairs, relative to url or absolute;
+                items are JSON-serialisable values for the output file
+            checkpoint_path: Where the crawl's state is saved and resumed from
+            output_path: JSON-lines file the items are appended to
+            max_per_host: Most requests in flight to one host
+            crawl_delay: Seconds between request starts to one host
+            checkpoint_every: Pages between checkpoints
+            max_pages: Stop (resumably) after fetching this many pages in
+                this run, or None for no limit
+            pool: HttpPool to fetch with (default: a new one, closed at the
+                end of run())
+            max_attempts: Tries per page on connection errors, 429 and 5xx
+                before it's left in the checkpoint for a resume
+        """
+        self.handler = handler
+        self.checkpoint_path = Path(checkpoint_path)
+        self.output_path = Path(output_path)
+        self.max_per_host = max_per_host
+        self.crawl_delay = crawl_delay
+        self.checkpoint_every = checkpoint_every
+        self.max_pages = max_pages
+        self.pool = pool
+        self.max_attempts = max_attempts
+        self.stats = {"fetched": 0, "failed": 0, "retried": 0, "items": 0, "skipped_links": 0}
+        self.frontier = None
+        self._output_bytes = 0
+
+    def _load(self):
+        """Resume from the checkpoint if there is one; returns True if it did."""
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if not state or state.get("version") != CHECKPOINT_VERSION:
+            self.frontier = Frontier(self.max_per_host, self.crawl_delay, max_attempts=self.max_attempts)
+            self._output_bytes = 0
+            return False
+        self.frontier = Frontier.from_dict(state["frontier"], self.max_per_host, self.crawl_delay, self.max_attempts)
+        self.stats.update(state["stats"])
+        # Pages that failed last time are queued again; they count if they fail again
+        self.stats["failed"] -= len(state["frontier"].get("failed", []))
+        self._output_bytes = state["output_bytes"]
+        return True
+
+    def checkpoint(self):
+        """Save the crawl's state; a crawl started from it resumes here."""
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "frontier": self.frontier.to_dict(),
+            "stats": self.stats,
+            "output_bytes": self._output_bytes,
+        }
+        storage.atomic_write(self.checkpoint_path, json.dumps(state, separators=(",", ":")))
+
+    def _open_output(self):
+        # Items written after the checkpoint came from pages queued again
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        output = open(self.output_path, "a+b")
+        output.truncate(self._output_bytes)
+        output.seek(0, 2)
+        return output
+
+    def _finish(self, url, error, retry):
+        """Hand a failed page back to the frontier: queued again, or kept for a resume."""
+        if self.frontier.done(url, retry=retry, failed=not retry):
+            print(f"Failed {url}: {error}; retrying")
+            self.stats["retried"] += 1
+        else:
+            print(f"Failed {url}: {error}")
+            self.stats["failed"] += 1
+
+    def _handle(self, url, depth, future, output):
+        """Handle a finished request and release url in the frontier."""
+        try:
+            response = future.result()
+        except Exception as e:
+            self._finish(url, e, retry=True)
+            return
+        if response.status != 200:
+            if response.status == 429 or response.status >= 500:
+                self._finish(url, f"status {response.status}", retry=True)
+            else:
+                # A 404 or 403 won't change on a retry
+                print(f"Failed {url}: status {response.status}")
+                self.stats["failed"] += 1
+                self.frontier.done(url)
+            return
+
+        try:
+            links, items = self.handler(url, response, depth)
+        except Exception as e:
+            # Kept for a resume, which may run a fixed handler
+            self._finish(url, f"parse error: {e}", retry=False)
+            return
+        self.frontier.done(url)
+        self.stats["fetched"] += 1
+        for link in links:
+            link, priority = link if isinstance(link, tuple) else (link, 1)
+            if not self.frontier.add(normalize_url(link, url), priority, depth + 1):
+                self.stats["skipped_links"] += 1
+        output.write("".join(
+            json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n" for item in items
+        ).encode("utf-8"))
+        self.stats["items"] += len(items)
+
+    def run(self, seeds, fresh=False):
+        """Crawl from seeds (or the checkpoint) until the frontier is empty.
+
+        Args:
+            seeds: URLs to start from; already-seen ones are ignored on resume
+            fresh: Ignore any checkpoint and start over
+
+        Returns:
+            The stats dict (pages fetched, retried and failed, items
+            written, links skipped as already seen)
+        """
+        if fresh or not self._load():
+            self.frontier = Frontier(self.max_per_host, self.crawl_delay, max_attempts=self.max_attempts)
+            self._output_bytes = 0
+        for seed in seeds:
+            self.frontier.add(seed, priority=0)
+
+        own_pool = self.pool is None
+        pool = self.pool or HttpPool(max_concurrency=self.max_per_host * 4)
+        pending = {}                    # Future -> (url, depth)
+        since_checkpoint = 0
+        started = 0
+        output = self._open_output()
+        try:
+            while self.frontier:
+                # Start everything the per-host limits allow right now
+                limited = self.max_pages is not None and started >= self.max_pages
+                while not limited:
+                    popped = self.frontier.pop()
+                    if popped is None:
+                        break
+                    url, _, depth = popped
+                    pending[pool.submit(url)] = (url, depth)
+                    started += 1
+                    limited = self.max_pages is not None and started >= self.max_pages
+                if not pending:
+                    if limited:
+                        break           # the rest stays queued in the checkpoint
+                    time.sleep(self.frontier.wait_time() or 0)
+                    continue
+
+                # Wake for a finished request, or when a host's delay is up
+                timeout = None if limited else self.frontier.wait_time()
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = pending.pop(future)
+                    self._handle(url, depth, future, output)
+                    # Output up to here belongs to finished pages only
+                    self._output_bytes = output.tell()
+                    since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_every:
+                    output.flush()
+                    self.checkpoint()
+                    since_checkpoint = 0
+        finally:
+            # Unfinished requests are cancelled and stay queued in the
+            # checkpoint; a page interrupted mid-write is cut on resume
+            for future in pending:
+                future.cancel()
+            output.close()
+            self.checkpoint()
+            if own_pool:
+                pool.close()
+        return self.stats
+
+
+# -- Catalogue crawls --
+
+BOOKS_SEED = "https://books.toscrape.com/index.html"
+QUOTES_SEED = "https://quotes.toscrape.com/"
+
+# Finish a listing before starting the next one
+NEXT_PAGE, NEW_LISTING = 0, 1
+
+
+def books_handler(url, response, depth):
+    """Category links from the sidebar; books and the next page from a category page."""
+    # Every page's sidebar lists every category; the filter keeps one of each
+    links = [(a.attrib.get("href", ""), NEW_LISTING) for a in response.css("div.side_categories ul li ul li a")]
+    items = []
+    if "/category/" in url:
+        headers = response.css("div.page-header h1")
+        category = headers[0].text.strip() if headers else ""
+        for book in price_tracker.BOOK_CARD.extract_all(response):
+            book["url"] = urljoin(url, book["url"])
+            book["category"] = category
+            items.append(book)
+        links += [(a.attrib.get("href", ""), NEXT_PAGE) for a in response.css("li.next a")]
+    return links, items
+
+
+_FIRST_TAG_PAGE = re.compile(r"(/tag/[^/]+/)page/1/$")
+
+
+def quotes_handler(url, response, depth):
+    """Tag links and the next page from every listing; a tag page's quotes."""
+    # /tag/x/page/1/ and /tag/x/ are the same page; queue one spelling
+    links = [(_FIRST_TAG_PAGE.sub(r"\1", a.attrib.get("href", "")), NEW_LISTING) for a in response.css("a.tag")]
+    links += [(a.attrib.get("href", ""), NEXT_PAGE) for a in response.css("li.next a")]
+    items = []
+    match = re.search(r"/tag/([^/]+)/", url)
+    if match:
+        for quote in basic_scraper.QUOTE_CARD.extract_all(response):
+            quote["tag"] = match.group(1)
+            items.append(quote)
+    return links, items
+
+
+CRAWLS = {
+    "books": (BOOKS_SEED, books_handler),
+    "quotes": (QUOTES_SEED, quotes_handler),
+}
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] not in CRAWLS:
+        sys.exit("Usage: python frontier.py books|quotes [--fresh]")
+    name = args[0]
+    seed, handler = CRAWLS[name]
+    crawler = Crawler(handler, DATA_DIR / f"crawl-{name}.json", DATA_DIR / f"crawl-{name}.jsonl")
+
+    start = time.perf_counter()
+    try:
+        stats = crawler.run([seed], fresh="--fresh" in args)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again to resume.")
+        stats = crawler.stats
+    print(f"\nFetched {stats['fetched']} pages ({stats['failed']} failed, {stats['retried']} retries), "
+          f"wrote {stats['items']} items, skipped {stats['skipped_links']} already-seen links "
+          f"in {time.perf_counter() - start:.1f}s")
+    print(f"Seen-URL filter: {len(crawler.frontier.seen)} URLs in {crawler.frontier.seen.nbytes} bytes")
+    print(f"Items: {crawler.output_path}")
@@ -0,0 +1,212 @@
+"""
+TripVibe Hotel Index - What we know about each Booking.com hotel, across searches
+
+The same New York or Tokyo hotels come back search after search; only their
+prices change. This index keeps every hotel seen, keyed by its Booking.com
+slug (country/name from /hotel/us/the-plaza.en-gb.html, so language
+variants and query strings map to the same hotel), in two parts:
+
+- static attributes (name, stars, score, reviews, location, page URL),
+  kept for days (static_ttl)
+- prices per stay (checkin, checkout), kept for minutes (price_ttl)
+
+The hotel parser takes known static attributes from here instead of reading
+them off the card, so they also stay the same from one search to the next,
+and everything it parses is recorded back. A price-only refresh needs
+nothing from the page but the price.
+
+Both tables live in the shared SQLite file, so every worker and every
+restart sees the same index.
+
+Usage:
+    index = default_index()
+    index.record(hotels, checkin, checkout)
+    attrs = index.static(hotel_slug(url))               # None if unknown/stale
+    price = index.price(slug, checkin, checkout)         # (total, per_night) or None
+    hotel = index.hotel(slug, checkin, checkout)         # Hotel if both are fresh
+"""
+
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from records import Hotel
+from shared_state import connect
+
+DEFAULT_DB = Path(__file__).parent / "tripvibe_data" / "shared.db"
+STATIC_TTL = 7 * 24 * 3600      # names, stars, scores barely change
+PRICE_TTL = 15 * 60             # same as the search cache
+PRUNE_INTERVAL = 3600           # seconds between dropping expired prices
+
+STATIC_FIELDS = ("name", "stars", "score", "reviews", "location", "url")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hotels (
+    slug TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    stars INTEGER NOT NULL,
+    score TEXT NOT NULL,
+    reviews INTEGER NOT NULL,
+    location TEXT NOT NULL,
+    url TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hotel_prices (
+    slug TEXT NOT NULL,
+    checkin TEXT NOT NULL,
+    checkout TEXT NOT NULL,
+    price_total INTEGER NOT NULL,
+    price_per_night INTEGER NOT NULL,
+    priced_at REAL NOT NULL,
+    PRIMARY KEY (slug, checkin, checkout)
+);
+"""
+
+_SLUG = re.compile(r'booking\.com/hotel/([a-z]{2})/([^/?#.]+)')
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def hotel_slug(url):
+    """Canonical "country/name" slug of a Booking.com hotel URL, or None."""
+    m = _SLUG.search(url or "")
+    return f"{m.group(1)}/{m.group(2)}" if m else None
+
+
+class HotelIndex:
+    """Static hotel attributes and stay prices, each with its own TTL."""
+
+    def __init__(self, db_path, static_ttl=STATIC_TTL, price_ttl=PRICE_TTL):
+        """
+        Args:
+            db_path: SQLite file shared by all workers
+            static_ttl: Seconds static attributes are trusted
+            price_ttl: Seconds a stay price is trusted
+        """
+        self.db_path = db_path
+        self.static_ttl = static_ttl
+        self.price_ttl = price_ttl
+        self._local = threading.local()
+        self._last_prune = 0.0
+
+        os.makedirs(os.path.dirname(os.fspath(db_path)), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def static(self, slug):
+        """Static attributes of slug as a dict, or None if unknown or stale."""
+        row = self._conn().execute(
+            "SELECT name, stars, score, reviews, location, url FROM hotels "
+            "WHERE slug = ? AND updated_at > ?",
+            (slug, time.time() - self.static_ttl),
+        ).fetchone()
+        return dict(zip(STATIC_FIELDS, row)) if row else None
+
+    def price(self, slug, checkin, checkout):
+        """(price_total, price_per_night) for the stay, or None if unknown or stale."""
+        row = self._conn().execute(
+            "SELECT price_total, price_per_night FROM hotel_prices "
+            "WHERE slug = ? AND checkin = ? AND checkout = ? AND priced_at > ?",
+            (slug, checkin, checkout, time.time() - self.price_ttl),
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def hotel(self, slug, checkin, checkout, booking_url=None):
+        """A Hotel built from the index alone, or None unless both parts are fresh."""
+        attrs = self.static(slug)
+        price = attrs and self.price(slug, checkin, checkout)
+        if not price:
+            return None
+        return Hotel(
+            name=attrs["name"],
+            price_total=price[0],
+            price_per_night=price[1],
+            stars=attrs["stars"],
+            score=attrs["score"],
+            reviews=attrs["reviews"],
+            location=attrs["location"],
+            booking_url=booking_url or attrs["url"],
+        )
+
+    def record(self, hotels, checkin, checkout):
+        """Save the hotels of one search; hotels without a hotel link are skipped.
+
+        Static attributes are written for new hotels and for ones whose entry
+        has gone stale; fresh ones are left as they are. Prices are always
+        replaced.
+        """
+        now = time.time()
+        rows = [(hotel_slug(h.booking_url), h) for h in hotels]
+        rows = [(slug, h) for slug, h in rows if slug]
+        if not rows:
+            return
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO hotels (slug, name, stars, score, reviews, location, url, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(slug) DO UPDATE SET name = excluded.name, stars = excluded.stars, "
+                "score = excluded.score, reviews = excluded.reviews, location = excluded.location, "
+                "url = excluded.url, updated_at = excluded.updated_at "
+                "WHERE hotels.updated_at <= ?",
+                [(slug, h.name, h.stars, h.score, h.reviews, h.location,
+                  h.booking_url.split("?", 1)[0], now, now - self.static_ttl)
+                 for slug, h in rows],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO hotel_prices "
+                "(slug, checkin, checkout, price_total, price_per_night, priced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(slug, checkin, checkout, h.price_total, h.price_per_night, now) for slug, h in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        if now - self._last_prune > PRUNE_INTERVAL:
+            self._last_prune = now
+            self.prune()
+
+    def update_price(self, slug, checkin, checkout, price_total, price_per_night):
+        """Save one freshly read price (e.g. from a price-only refresh)."""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO hotel_prices "
+            "(slug, checkin, checkout, price_total, price_per_night, priced_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (slug, checkin, checkout, price_total, price_per_night, time.time()),
+        )
+
+    def prune(self):
+        """Drop expired prices and static entries."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM hotel_prices WHERE priced_at <= ?", (now - self.price_ttl,))
+        conn.execute("DELETE FROM hotels WHERE updated_at <= ?", (now - self.static_ttl,))
+
+
+def default_index():
+    """Return the process-wide hotel index, creating it on first use."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = HotelIndex(DEFAULT_DB)
+        return _default_index
+
+
+def set_default_index(index):
+    """Replace the process-wide index (e.g. with one in a temp directory)."""
+    global _default_index
+    with _default_index_lock:
+        _default_index = index
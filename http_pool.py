@@ -0,0 +1,128 @@
+"""
+HTTP Pool - One pooled HTTP session for concurrent plain-HTTP fetches
+
+The tutorial scrapers fetch with Fetcher().get(): one request at a time,
+each on a fresh connection (TLS handshake included). An HttpPool keeps one
+Scrapling async session open instead - curl_cffi under the hood, so
+keep-alive connections are reused across requests - on an asyncio loop in
+a background thread, the way tabs.TabHost runs browsers:
+
+- submit(url) starts a request and returns a concurrent.futures.Future at
+  once, so the caller can parse one page while others download
+- cancelling that Future abandons the request on the loop (a page that's
+  no longer wanted stops using a connection)
+- get(url) is the blocking form, a drop-in for Fetcher().get(url)
+- at most max_concurrency requests are in flight; later ones wait on the
+  loop without holding a connection
+
+Responses are Scrapling responses, as from Fetcher().get(). Scrapling
+versions without FetcherSession fall back to Fetcher().get() on a thread
+pool: requests still overlap, but each opens its own connection.
+
+Usage:
+    with HttpPool(max_concurrency=4) as pool:
+        futures = [pool.submit(url) for url in urls]
+        pages = [future.result() for future in futures]
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scrapling import Fetcher
+
+try:
+    from scrapling.fetchers import FetcherSession
+except ImportError:  # older Scrapling without sessions
+    FetcherSession = None
+
+DEFAULT_CONCURRENCY = 8
+
+
+def available():
+    """True if this Scrapling has FetcherSession (needed for a pooled session)."""
+    return FetcherSession is not None
+
+
+class HttpPool:
+    """Plain-HTTP fetches through one shared session, started from any thread."""
+
+    def __init__(self, max_concurrency=DEFAULT_CONCURRENCY, session_factory=None, **session_kwargs):
+        """
+        Args:
+            max_concurrency: Most requests in flight at once
+            session_factory: Zero-arg callable returning an unentered
+                FetcherSession-like async context manager (default:
+                FetcherSession(**session_kwargs))
+            session_kwargs: FetcherSession options (timeout, retries,
+                headers, impersonate, ...)
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self._closed = False
+        self._executor = None
+
+        if session_factory is None and FetcherSession is None:
+            self._loop = None
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="http-pool")
+            return
+        self._factory = session_factory or (lambda: FetcherSession(**session_kwargs))
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="http-pool")
+        self._thread.start()
+        # Created on the loop: asyncio primitives belong to the loop they wait on
+        self._manager, self._session, self._slots = asyncio.run_coroutine_threadsafe(
+            self._open(), self._loop,
+        ).result()
+
+    async def _open(self):
+        manager = self._factory()
+        session = await manager.__aenter__()
+        return manager, session, asyncio.Semaphore(self.max_concurrency)
+
+    async def _get(self, url, kwargs):
+        async with self._slots:
+            return await self._session.get(url, **kwargs)
+
+    def submit(self, url, **kwargs):
+        """Start a GET of url; returns a Future of its response.
+
+        Future.cancel() abandons the request, whether it has started or not.
+        """
+        if self._closed:
+            raise RuntimeError("HttpPool is closed")
+        if self._executor is not None:
+            return self._executor.submit(lambda: Fetcher().get(url, **kwargs))
+        return asyncio.run_coroutine_threadsafe(self._get(url, kwargs), self._loop)
+
+    def get(self, url, **kwargs):
+        """GET url and wait for the response, like Fetcher().get(url)."""
+        return self.submit(url, **kwargs).result()
+
+    def close(self):
+        """Close the session; requests still in flight are cancelled."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            return
+
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._manager.__aexit__(None, None, None)
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
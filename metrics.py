@@ -0,0 +1,522 @@
+"""
+TripVibe Metrics - In-process counters, gauges and histograms
+
+A small Prometheus-style registry with no dependencies. Updating a metric
+is a dict lookup and an addition under a per-metric lock, so it is cheap
+enough for hot paths. init_app() serves everything at /metrics in the
+Prometheus text format.
+
+Under serve.py each worker process has its own registry. When
+TRIPVIBE_METRICS_DIR is set, every worker writes its values to
+<dir>/<pid>.json every few seconds, and /metrics on any worker merges the
+files of all live workers: counters and histograms are summed, gauges are
+summed or max'ed depending on the gauge. When a worker dies (serve.py
+restarts it), its counters and histograms are folded into <dir>/retired.json
+so the merged totals never go backwards, which Prometheus would read as a
+counter reset; its gauges are dropped.
+
+Usage:
+    SCRAPES = metrics.Counter("tripvibe_scrapes_total", "Scrapes run", ["source"])
+    SCRAPES.labels("skyscanner").inc()
+
+    with metrics.SCRAPE_SECONDS.labels("booking").time():
+        ...
+
+    metrics.init_app(app)
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Seconds; covers sub-millisecond parsing up to a slow browser scrape
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 20, 30, 60, 120, float("inf"),
+)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000, float("inf"))
+
+FLUSH_INTERVAL = 5.0
+RETIRED_FILE = "retired.json"   # counters and histograms of dead workers
+
+
+class Registry:
+    """Holds every metric of this process."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir = None
+        self._flusher = None
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+
+    def collect(self):
+        """Return this process's values as a JSON-serialisable dict."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.collect() for m in metrics}
+
+    # ----- multi-process -----
+
+    def enable_multiprocess(self, directory):
+        """Share values with the other workers through files in directory."""
+        os.makedirs(directory, exist_ok=True)
+        self.multiprocess_dir = directory
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def flush(self):
+        """Write this process's values to <dir>/<pid>.json atomically."""
+        if not self.multiprocess_dir:
+            return
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        tmp = path + ".part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.collect(), f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _gather(self):
+        """Collected values from every live worker (including this one)."""
+        own = self.collect()
+        if not self.multiprocess_dir:
+            return [own]
+
+        snapshots = [own]
+        dead = []
+        for filename in os.listdir(self.multiprocess_dir):
+            if not filename.endswith(".json") or not filename[:-5].isdigit():
+                continue
+            pid = int(filename[:-5])
+            if pid == os.getpid():
+                continue
+            path = os.path.join(self.multiprocess_dir, filename)
+            if not _pid_alive(pid):
+                dead.append(path)
+                continue
+            snapshot = _read_json(path)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        retired = self._retire(dead) if dead else _read_json(os.path.join(self.multiprocess_dir, RETIRED_FILE))
+        if retired is not None:
+            snapshots.append(retired)
+        return snapshots
+
+    @contextmanager
+    def _dir_locked(self):
+        # Two workers rendering at once must not both fold the same file
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(os.path.join(self.multiprocess_dir, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _retire(self, paths):
+        """Fold dead workers' counters and histograms into the retired file.
+
+        Returns:
+            The retired file's snapshot after folding
+        """
+        with self._lock:
+            cumulative = {name: m for name, m in self._metrics.items() if m.type in ("counter", "histogram")}
+        retired_path = os.path.join(self.multiprocess_dir, RETIRED_FILE)
+        with self._dir_locked():
+            retired = _read_json(retired_path) or {}
+            for path in paths:
+                # Gone if another worker folded it first
+                snapshot = _read_json(path)
+                if snapshot is not None:
+                    for name, metric in cumulative.items():
+                        if name in snapshot:
+                            merged = metric.merge([retired.get(name, []), snapshot[name]])
+                            retired[name] = [[list(k), v] for k, v in merged.items()]
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            tmp = retired_path + ".part"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(retired, f, separators=(",", ":"))
+            os.replace(tmp, retired_path)
+        return retired
+
+    # ----- exposition -----
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        snapshots = self._gather()
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+
+        lines = []
+        for metric in metrics:
+            merged = metric.merge([s[metric.name] for s in snapshots if metric.name in s])
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render(merged))
+        return "\n".join(lines) + "\n"
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    """Shared label handling. Subclasses define the child type."""
+
+    type = ""
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """Return the child for these label values, creating it if needed."""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def collect(self):
+        with self._lock:
+            return [[list(k), c.value()] for k, c in self._children.items()]
+
+    def merge(self, collected):
+        """Combine per-process [[labels, value], ...] lists."""
+        merged = {}
+        for samples in collected:
+            for labels, value in samples:
+                key = tuple(labels)
+                merged[key] = self._combine(merged[key], value) if key in merged else value
+        return merged
+
+    def render(self, merged):
+        for labels, value in sorted(merged.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self, lock):
+        self._value = 0.0
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def value(self):
+        return self._value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    @staticmethod
+    def _combine(a, b):
+        return a + b
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ("_value", "_fn", "_lock")
+
+    def __init__(self, lock):
+        self._value = 0.0
+        self._fn = None
+        self._lock = lock
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, fn):
+        """Sample fn() at collection time instead of storing a value."""
+        self._fn = fn
+
+    def value(self):
+        if self._fn is not None:
+            try:
+                return float(self._fn())
+            except Exception:
+                return float("nan")
+        return self._value
+
+
+class Gauge(_Metric):
+    """Value that goes up and down.
+
+    Args:
+        merge: "sum" to add values across workers (e.g. slots in use),
+            "max" for values every worker reports identically (e.g. a
+            shared budget).
+    """
+
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, merge="sum"):
+        self.merge_mode = merge
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _GaugeChild(self._lock)
+
+    def _combine(self, a, b):
+        return max(a, b) if self.merge_mode == "max" else a + b
+
+    def collect(self):
+        # Callback gauges must not run under our lock
+        with self._lock:
+            children = list(self._children.items())
+        return [[list(k), c.value()] for k, c in children]
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set_function(self, fn):
+        self._default.set_function(fn)
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_counts", "_sum", "_lock")
+
+    def __init__(self, buckets, lock):
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._lock = lock
+
+    def observe(self, value):
+        i = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def value(self):
+        return {"counts": list(self._counts), "sum": self._sum}
+
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets, self._lock)
+
+    @staticmethod
+    def _combine(a, b):
+        return {
+            "counts": [x + y for x, y in zip(a["counts"], b["counts"])],
+            "sum": a["sum"] + b["sum"],
+        }
+
+    def render(self, merged):
+        for labels, value in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, value["counts"]):
+                cumulative += count
+                label_str = _format_labels(self.labelnames, labels, ("le", _format_value(float(bound))))
+                yield f"{self.name}_bucket{label_str} {cumulative}"
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {_format_value(value['sum'])}"
+            yield f"{self.name}_count{label_str} {cumulative}"
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+# ----- TripVibe metrics -----
+
+SCRAPE_SECONDS = Histogram(
+    "tripvibe_scrape_seconds", "Wall time to fetch one result page in the browser", ["source"],
+)
+SCRAPE_ERRORS = Counter(
+    "tripvibe_scrape_errors_total", "Scrapes that returned a non-200 page or raised", ["source"],
+)
+ITEMS_EXTRACTED = Histogram(
+    "tripvibe_items_extracted", "Records extracted per result page", ["source"],
+    buckets=COUNT_BUCKETS,
+)
+TIME_TO_RESULT = Histogram(
+    "tripvibe_time_to_result_seconds",
+    "Wait after page load until results were ready, by outcome (enough, stable, deadline)",
+    ["source", "outcome"],
+)
+TIME_TO_FIRST_RESULT = Histogram(
+    "tripvibe_time_to_first_result_seconds", "Wait after page load until the first result card", ["source"],
+)
+CACHE_REQUESTS = Counter(
+    "tripvibe_cache_requests_total",
+    "Search cache lookups by result (hit, miss, stale, coalesced)", ["result"],
+)
+PRICE_REFRESHES = Counter(
+    "tripvibe_price_refreshes_total",
+    "Deep-link price refreshes by how the page was fetched (http, browser)", ["source", "path"],
+)
+ALERTS_SENT = Counter(
+    "tripvibe_alerts_sent_total", "Price alert notifications written to the outbox", ["kind"],
+)
+BROWSER_SLOTS_IN_USE = Gauge(
+    "tripvibe_browser_slots_in_use", "Browser slots currently held",
+)
+BROWSER_SLOTS_TOTAL = Gauge(
+    "tripvibe_browser_slots_total", "Host-wide browser slot cap", merge="max",
+)
+BROWSER_QUEUE_DEPTH = Gauge(
+    "tripvibe_browser_queue_depth", "Fetches waiting for a browser slot",
+)
+BROWSER_PROCESSES = Gauge(
+    "tripvibe_browser_processes", "Browsers open for tab-mode fetches",
+)
+BROWSER_SESSIONS = Counter(
+    "tripvibe_browser_sessions_total",
+    "Cloudflare sessions by result (reused, solved, rejected)", ["source", "result"],
+)
+RATE_LIMIT_REMAINING = Gauge(
+    "tripvibe_rate_limit_remaining", "Requests left in today's per-source budget", ["source"],
+    merge="max",
+)
+REQUEST_SECONDS = Histogram(
+    "tripvibe_request_seconds", "HTTP request latency", ["route", "method", "status"],
+)
+
+
+def init_app(app):
+    """Time every request of a Flask app and serve /metrics."""
+    from flask import Response, g, request
+
+    directory = os.environ.get("TRIPVIBE_METRICS_DIR")
+    if directory:
+        REGISTRY.enable_multiprocess(directory)
+
+    @app.before_request
+    def _start_timer():
+        g._tripvibe_request_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop("_tripvibe_request_start", None)
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        timer = REQUEST_SECONDS.labels(route, request.method, response.status_code)
+        if response.is_streamed:
+            # Time the whole body, not just the headers
+            response.call_on_close(lambda: timer.observe(time.perf_counter() - start))
+        else:
+            timer.observe(time.perf_counter() - start)
+        return response
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
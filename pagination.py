@@ -0,0 +1,157 @@
+"""
+Pagination - Pipelined, speculative page fetching for paginated listings
+
+A listing crawled page by page (fetch page N, parse it, look for a next
+link, only then request N+1) leaves the network idle while pages are
+parsed and the parser idle while pages download. A Paginator keeps
+`prefetch` pages in flight ahead of the page being read, through one
+pooled session (http_pool.HttpPool):
+
+- pages are yielded in order; while the caller reads page N, pages
+  N+1..N+prefetch are already downloading or downloaded
+- a page is terminal when it isn't a 200 or is_last(response) says no page
+  follows it (no "next" link). Each page is checked as soon as it arrives,
+  even out of order, so a terminal page ends the crawl early and every
+  request past it is cancelled
+- max_pages stops a crawl at a known length; a caller that stops iterating
+  early (break) cancels what's still in flight the same way
+
+Speculation costs at most `prefetch` requests past the last page, most of
+them cancelled before they're sent; pass max_pages when the page count is
+known up front.
+
+Usage:
+    with Paginator(lambda page: f"{base}/page/{page}/",
+                   is_last=lambda response: not response.css("li.next a")) as pages:
+        for page, response in pages:
+            parse(response)
+"""
+
+import threading
+from concurrent.futures import CancelledError
+
+from http_pool import HttpPool
+
+DEFAULT_PREFETCH = 4
+
+
+class Paginator:
+    """The pages of one paginated listing, fetched ahead of the reader."""
+
+    def __init__(self, url_for, is_last=None, prefetch=DEFAULT_PREFETCH, first_page=1, max_pages=None, pool=None):
+        """
+        Args:
+            url_for: fn(page number) -> URL of that page
+            is_last: fn(response) -> True if no page follows this one
+                (default: only a non-200 page ends the listing)
+            prefetch: Pages requested ahead of the one being read
+            first_page: Number of the first page
+            max_pages: Most pages to read, or None for no limit
+            pool: HttpPool to fetch with (default: a new one, closed with
+                this paginator)
+        """
+        self.url_for = url_for
+        self.is_last = is_last
+        self.prefetch = max(0, prefetch)
+        self.first_page = first_page
+        self.max_pages = max_pages
+        self._own_pool = pool is None
+        self.pool = pool or HttpPool(max_concurrency=self.prefetch + 1)
+
+        self.end = None                 # first terminal page seen, once one is
+        self.requested = 0
+        self.cancelled = 0
+        self._next = first_page         # next page to request
+        self._futures = {}              # page -> Future, for pages not yet read
+        self._terminal = {}             # page -> whether it ends the listing
+        self._lock = threading.Lock()
+
+    def _check(self, page, response):
+        """Whether page ends the listing; checked once per page."""
+        with self._lock:
+            if page in self._terminal:
+                return self._terminal[page]
+        terminal = response.status != 200 or bool(self.is_last and self.is_last(response))
+        with self._lock:
+            self._terminal[page] = terminal
+            if terminal and (self.end is None or page < self.end):
+                self.end = page
+                self._cancel_after(page)
+        return terminal
+
+    def _cancel_after(self, page):
+        # Called with the lock held
+        for later in [p for p in self._futures if p > page]:
+            if self._futures.pop(later).cancel():
+                self.cancelled += 1
+
+    def _arrived(self, page, future):
+        # Runs on the fetching thread as each page completes, in any order
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            self._check(page, future.result())
+        except Exception:
+            pass                        # the reader's own check raises it
+
+    def _fill(self, reading):
+        """Request pages up to reading + prefetch, within the known end."""
+        last = reading + self.prefetch
+        if self.max_pages is not None:
+            last = min(last, self.first_page + self.max_pages - 1)
+        while True:
+            with self._lock:
+                page = self._next
+                if page > last or self.end is not None and page > self.end:
+                    return
+                self._next += 1
+            future = self.pool.submit(self.url_for(page))
+            with self._lock:
+                self._futures[page] = future
+                self.requested += 1
+            future.add_done_callback(lambda f, page=page: self._arrived(page, f))
+
+    def __iter__(self):
+        """Yield (page number, response) in page order, ending after a terminal page."""
+        page = self.first_page
+        try:
+            while self.max_pages is None or page < self.first_page + self.max_pages:
+                with self._lock:
+                    if self.end is not None and page > self.end:
+                        return
+                self._fill(page)
+                with self._lock:
+                    future = self._futures.pop(page, None)
+                if future is None:
+                    return                  # cancelled: an earlier page ended it
+                try:
+                    response = future.result()
+                except CancelledError:
+                    return
+                yield page, response
+                if self._check(page, response):
+                    return
+                page += 1
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        """Abandon every page not read yet."""
+        with self._lock:
+            self._cancel_after(self.first_page - 1)
+
+    @property
+    def reached_end(self):
+        """True once the listing's terminal page has been seen."""
+        return self.end is not None
+
+    def close(self):
+        self.cancel()
+        if self._own_pool:
+            self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
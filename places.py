@@ -0,0 +1,437 @@
+"""
+TripVibe Places - Airport and city autocomplete
+
+The apps used to offer a dozen hand-written airports in a <select>. This
+module loads a bundled dataset of airports and multi-airport metro codes
+(places.tsv: code, kind, name, city, country, metro, Booking.com value,
+aliases) into a prefix index at startup:
+
+- every searchable term of a place (its code, name, city, each later word
+  of its name, and aliases such as NYC, Bombay or Saigon) is normalised
+  (lower case, accents and punctuation stripped) into one sorted list
+- a query is two bisects into that list, giving the run of terms that
+  start with it, then a ranking of the places in the run: exact matches,
+  then codes, then names and cities, then inner words, each in dataset
+  (prominence) order
+
+Lookups take microseconds for typed queries; one- and two-letter queries,
+whose runs are the longest, are memoised. The same data maps any code to
+its city name, flag and Booking.com search value (an airport uses its
+metro's), which the hotel scrapers use.
+
+init_app() adds GET /api/places?q=...&limit=... to an app and gives its
+templates place_picker() (a text field with a hidden code field) and
+places_script() (the debounced client that fills the suggestions).
+
+TRIPVIBE_PLACES points at another dataset in the same format; to add every
+scheduled-service airport from OurAirports' airports.csv:
+
+    python places.py --ourairports airports.csv >> places.tsv
+
+Usage:
+    index = default_index()
+    index.search("lon")                # [Place(LOND), Place(LHR), ...]
+    index.booking_city("LHR")          # "London"
+    index.city_name("NYCA")            # "New York"
+"""
+
+import csv
+import os
+import re
+import sys
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from urllib.parse import quote_plus
+
+from markupsafe import Markup, escape
+
+DEFAULT_PATH = Path(os.environ.get("TRIPVIBE_PLACES", Path(__file__).parent / "places.tsv"))
+SEARCH_LIMIT = 8
+MAX_LIMIT = 50
+MEMO_LENGTH = 2                 # memoise queries this short (their runs are longest)
+
+# Term kinds, best first; stored in the low bits of each index entry
+CODE, NAME, WORD = 0, 1, 2
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def normalize(text):
+    """Lower-case text without accents or punctuation ("São Paulo" -> "sao paulo")."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def flag(country):
+    """Flag emoji of a two-letter country code ("" if it isn't one)."""
+    if len(country) != 2 or not country.isalpha():
+        return ""
+    return "".join(chr(0x1F1E6 + ord(c) - ord("A")) for c in country.upper())
+
+
+class Place:
+    """One airport or metro code."""
+
+    __slots__ = ("code", "kind", "name", "city", "country", "metro", "booking", "aliases")
+
+    def __init__(self, code, kind, name, city, country, metro="", booking="", aliases=()):
+        self.code = code
+        self.kind = kind
+        self.name = name
+        self.city = city
+        self.country = country
+        self.metro = metro
+        self.booking = booking
+        self.aliases = tuple(aliases)
+
+    def __repr__(self):
+        return f"Place({self.code})"
+
+    @property
+    def flag(self):
+        return flag(self.country)
+
+    @property
+    def label(self):
+        """Text shown in the search field, e.g. "🇬🇧 London Heathrow (LHR)"."""
+        return f"{self.flag} {self.name} ({self.code})".strip()
+
+    def to_dict(self):
+        return {
+            "code": self.code,
+            "kind": self.kind,
+            "name": self.name,
+            "city": self.city,
+            "country": self.country,
+            "flag": self.flag,
+            "label": self.label,
+        }
+
+    def terms(self):
+        """(normalised term, term kind) pairs this place is found by."""
+        yield normalize(self.code), CODE
+        for alias in self.aliases:
+            # Short all-caps aliases are codes (NYC, LON); the rest are names
+            is_code = alias.isupper() and len(alias) <= 4 and " " not in alias
+            yield normalize(alias), CODE if is_code else NAME
+        for text in (self.name, self.city):
+            words = normalize(text).split()
+            if words:
+                yield " ".join(words), NAME
+            # "heathrow" finds "London Heathrow", "de gaulle" finds CDG
+            for i in range(1, len(words)):
+                yield " ".join(words[i:]), WORD
+
+
+def load(path=DEFAULT_PATH):
+    """Read places from a dataset file, in file (prominence) order."""
+    places = []
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = csv.DictReader((line for line in f if not line.startswith("#")), delimiter="\t")
+        for row in rows:
+            places.append(Place(
+                code=row["code"],
+                kind=row["kind"],
+                name=row["name"],
+                city=row["city"],
+                country=row["country"],
+                metro=row.get("metro") or "",
+                booking=row.get("booking") or "",
+                aliases=[a for a in (row.get("aliases") or "").split("|") if a],
+            ))
+    return places
+
+
+class PlaceIndex:
+    """Sorted-array prefix index over places."""
+
+    def __init__(self, places):
+        """
+        Args:
+            places: Places in prominence order (see load)
+        """
+        self.places = list(places)
+        self._by_code = {}
+        for place in self.places:
+            # First row wins: a code listed twice keeps its more prominent row
+            self._by_code.setdefault(place.code.upper(), place)
+
+        entries = set()
+        for i, place in enumerate(self.places):
+            for term, kind in place.terms():
+                if term:
+                    entries.add((term, i, kind))
+        entries = sorted(entries)
+        # Parallel arrays: the terms to bisect, and place * 4 + term kind
+        self._terms = [term for term, _, _ in entries]
+        self._entries = array("l", (i * 4 + kind for _, i, kind in entries))
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.places)
+
+    def get(self, code):
+        """The place with this code, or None."""
+        return self._by_code.get((code or "").upper())
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Places matching query as a prefix, best first."""
+        q = normalize(query or "")
+        if not q or limit < 1:
+            return []
+        # Memoised for the limits the API can ask for, so the memo stays bounded
+        memo = len(q) <= MEMO_LENGTH and limit <= MAX_LIMIT
+        if memo and (q, limit) in self._memo:
+            return self._memo[(q, limit)]
+
+        lo = bisect_left(self._terms, q)
+        hi = bisect_left(self._terms, q + "\uffff", lo)
+        best = {}
+        for j in range(lo, hi):
+            place, kind = divmod(self._entries[j], 4)
+            # An exact code or name beats prefixes; an exact inner word
+            # ("a" in "Faa'a") doesn't
+            key = (kind == WORD or self._terms[j] != q, kind, place)
+            if place not in best or key < best[place]:
+                best[place] = key
+        ranked = sorted(best.values())[:limit]
+        result = [self.places[key[2]] for key in ranked]
+
+        if memo:
+            self._memo[(q, limit)] = result
+        return result
+
+    # ----- per-code lookups -----
+
+    def city_name(self, code):
+        """City of a code ("LHR" -> "London"), or the code itself if unknown."""
+        place = self.get(code)
+        return place.city if place else code
+
+    def booking_city(self, code):
+        """Booking.com ss= value for a code's city ("LHR" -> "London").
+
+        Uses the place's own value, then its metro's, then its city name.
+        An unknown code is passed through (it may already be a city name).
+        """
+        place = self.get(code)
+        if place is None:
+            return code
+        if place.booking:
+            return place.booking
+        metro = self.get(place.metro)
+        if metro is not None and metro.booking:
+            return metro.booking
+        return quote_plus(place.city)
+
+    def label(self, code):
+        """Search-field text for a code, or the code itself if unknown."""
+        place = self.get(code)
+        return place.label if place else code
+
+
+def default_index():
+    """Return the process-wide place index, loading the dataset on first use."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = PlaceIndex(load(DEFAULT_PATH))
+        return _default_index
+
+
+# ----- Flask -----
+
+PICKER_HTML = (
+    '<div class="place-picker">'
+    '<input type="text" class="place-query" id="{field}Query" value="{label}" '
+    'autocomplete="off" spellcheck="false" role="combobox" aria-autocomplete="list" '
+    'aria-expanded="false" aria-controls="{field}Options">'
+    '<input type="hidden" name="{field}" id="{field}" value="{code}">'
+    '<ul class="place-options" id="{field}Options" role="listbox" hidden></ul>'
+    '</div>'
+)
+
+# Debounced: one request per pause in typing, the previous one aborted, and
+# answers cached per query so backspacing costs nothing
+PICKER_SCRIPT = """
+<style>
+    .place-picker { position: relative; }
+    .place-picker .place-query { width: 100%; }
+    .place-options {
+        position: absolute; z-index: 50; left: 0; right: 0; top: 100%;
+        margin: 4px 0 0; padding: 4px 0; list-style: none;
+        background: #1a1a2e; border: 1px solid rgba(255,255,255,0.15); border-radius: 10px;
+        max-height: 320px; overflow-y: auto; box-shadow: 0 12px 32px rgba(0,0,0,0.4);
+    }
+    .place-options li { padding: 8px 14px; cursor: pointer; color: #fff; font-size: 0.95em; }
+    .place-options li small { color: #8888a0; margin-left: 6px; }
+    .place-options li.active, .place-options li:hover { background: rgba(102,126,234,0.25); }
+</style>
+<script>
+(function () {
+    const DEBOUNCE_MS = 150;
+    const cache = new Map();
+
+    function setupPicker(picker) {
+        const query = picker.querySelector('.place-query');
+        const code = picker.querySelector('input[type=hidden]');
+        const list = picker.querySelector('.place-options');
+        let timer = null, controller = null, options = [], active = -1;
+        let chosenLabel = query.value;
+
+        function close() {
+            list.hidden = true;
+            query.setAttribute('aria-expanded', 'false');
+            active = -1;
+        }
+
+        function choose(place) {
+            code.value = place.code;
+            query.value = chosenLabel = place.label;
+            close();
+        }
+
+        function render(places) {
+            options = places;
+            active = places.length ? 0 : -1;
+            list.innerHTML = '';
+            places.forEach((place, i) => {
+                const li = document.createElement('li');
+                li.setAttribute('role', 'option');
+                li.textContent = place.label;
+                const where = document.createElement('small');
+                where.textContent = place.kind === 'metro' ? 'all airports' : place.city;
+                li.appendChild(where);
+                if (i === active) li.classList.add('active');
+                // mousedown fires before the field's blur
+                li.addEventListener('mousedown', (e) => { e.preventDefault(); choose(place); });
+                list.appendChild(li);
+            });
+            list.hidden = !places.length;
+            query.setAttribute('aria-expanded', places.length ? 'true' : 'false');
+        }
+
+        async function lookup(q) {
+            if (cache.has(q)) return render(cache.get(q));
+            if (controller) controller.abort();
+            controller = new AbortController();
+            try {
+                const response = await fetch('/api/places?q=' + encodeURIComponent(q), { signal: controller.signal });
+                const data = await response.json();
+                cache.set(q, data.places || []);
+                if (query.value.trim() === q) render(cache.get(q));
+            } catch (e) {
+                if (e.name !== 'AbortError') close();
+            }
+        }
+
+        query.addEventListener('input', () => {
+            clearTimeout(timer);
+            const q = query.value.trim();
+            if (!q) return close();
+            timer = setTimeout(() => lookup(q), DEBOUNCE_MS);
+        });
+        query.addEventListener('focus', () => query.select());
+        query.addEventListener('blur', () => {
+            // Typed but didn't pick: take the top suggestion, else restore the last choice
+            if (query.value !== chosenLabel && options.length && !list.hidden) choose(options[0]);
+            else query.value = chosenLabel;
+            close();
+        });
+        query.addEventListener('keydown', (e) => {
+            if (list.hidden) return;
+            if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                e.preventDefault();
+                active = (active + (e.key === 'ArrowDown' ? 1 : -1) + options.length) % options.length;
+                [...list.children].forEach((li, i) => li.classList.toggle('active', i === active));
+            } else if (e.key === 'Enter' && active >= 0) {
+                e.preventDefault();
+                choose(options[active]);
+            } else if (e.key === 'Escape') {
+                query.value = chosenLabel;
+                close();
+            }
+        });
+    }
+
+    document.querySelectorAll('.place-picker').forEach(setupPicker);
+})();
+</script>
+"""
+
+
+def place_picker(field, code):
+    """HTML for a place field: visible search box plus hidden code input named field."""
+    return Markup(PICKER_HTML.format(
+        field=escape(field), code=escape(code), label=escape(default_index().label(code)),
+    ))
+
+
+def places_script():
+    """The picker's CSS and debounced client; include once, after the form."""
+    return Markup(PICKER_SCRIPT)
+
+
+def init_app(app):
+    """Register GET /api/places and the template helpers on a Flask app."""
+    from flask import jsonify, request
+
+    # Load the dataset now rather than on the first keystroke
+    default_index()
+
+    @app.route("/api/places")
+    def api_places():
+        try:
+            limit = max(1, min(int(request.args.get("limit", SEARCH_LIMIT)), MAX_LIMIT))
+        except ValueError:
+            limit = SEARCH_LIMIT
+        places = default_index().search(request.args.get("q", ""), limit)
+        return jsonify({"places": [place.to_dict() for place in places]})
+
+    @app.context_processor
+    def place_helpers():
+        return {"place_picker": place_picker, "places_script": places_script}
+
+
+# ----- dataset import -----
+
+def from_ourairports(path, known=()):
+    """Dataset rows for OurAirports airports.csv entries with scheduled service.
+
+    Args:
+        path: OurAirports airports.csv
+        known: Codes already in the dataset, skipped
+
+    Returns:
+        Rows, large airports first so they rank above small ones
+    """
+    sizes = {"large_airport": 0, "medium_airport": 1, "small_airport": 2}
+    known = set(known)
+    rows = []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            code = row.get("iata_code", "")
+            if not code or code in known or row.get("scheduled_service") != "yes":
+                continue
+            if row.get("type") not in sizes:
+                continue
+            known.add(code)
+            city = row.get("municipality") or row["name"]
+            rows.append((sizes[row["type"]], [code, "airport", row["name"], city, row["iso_country"], "", "", ""]))
+    rows.sort(key=lambda r: r[0])
+    return [row for _, row in rows]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "--ourairports":
+        sys.exit("Usage: python places.py --ourairports airports.csv >> places.tsv")
+    existing = [place.code for place in load(DEFAULT_PATH)]
+    for row in from_ourairports(sys.argv[2], existing):
+        print("\t".join(field.replace("\t", " ") for field in row))
@@ -0,0 +1,341 @@
+"""
+Price History - Indexed reader for the price tracker's CSV
+
+price_tracker.py appends every run to data/book_prices.csv, so "what has
+this book cost?" used to mean reading the whole file. This module keeps two
+sidecar files next to the CSV and answers from them instead:
+
+- book_prices.idx: one fixed-size binary record per CSV row (byte offset
+  and length of the row, scrape time, price in pence, title id, the row of
+  that title's previous observation, and whether the price changed since
+  then), memory-mapped for reading
+- book_prices.idx.json: the titles (id, latest row, latest price), the
+  runs of rows scraped on each date, and how much of the CSV is indexed
+  (with its first and last indexed rows, to notice a replaced file)
+
+A title's history is a walk back along its chain of previous-row links,
+one record per observation, never touching other titles' rows; a date is
+a lookup in its list of row ranges. Both stay well under a millisecond
+however long the CSV grows. Opening a history (or calling refresh())
+indexes only the rows appended since the last time; a CSV that was
+truncated or replaced is indexed again from the start.
+
+Usage:
+    history = PriceHistory(PRICES_CSV)
+    history.history("A Light in the Attic")     # [(timestamp, 51.77), ...]
+    history.changes_on("2026-10-19")            # rows whose price moved
+
+    python price_history.py "A Light in the Attic"
+    python price_history.py --date 2026-10-19
+"""
+
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import storage
+
+DEFAULT_CSV = Path(__file__).parent / "data" / "book_prices.csv"
+INDEX_VERSION = 2
+
+# offset, scraped_at (epoch seconds), length, title id, previous row, pence, flags
+RECORD = struct.Struct("<QdIIIiI")
+NO_ROW = 0xFFFFFFFF
+CHANGED = 1                     # price differs from the title's previous row
+
+
+def _split_rows(data, start):
+    """(offset, row bytes) of each complete CSV row in data[start:].
+
+    A row ends at a newline outside quotes; a last row without its newline
+    is still being written and is left for the next refresh.
+    """
+    rows = []
+    pos = row_start = start
+    quotes = 0
+    while True:
+        end = data.find(b"\n", pos)
+        if end == -1:
+            return rows
+        quotes += data.count(b'"', pos, end)
+        pos = end + 1
+        if quotes % 2 == 0:
+            rows.append((row_start, data[row_start:pos]))
+            row_start = pos
+            quotes = 0
+
+
+def _parse(row):
+    return next(csv.reader([row.decode("utf-8")]))
+
+
+class PriceHistory:
+    """Title and date lookups over an append-only price CSV, via its sidecar index."""
+
+    def __init__(self, csv_path=DEFAULT_CSV):
+        """
+        Args:
+            csv_path: The price tracker's CSV; the index files sit next to it
+        """
+        self.csv_path = Path(csv_path)
+        self.records_path = self.csv_path.with_suffix(".idx")
+        self.meta_path = self.csv_path.with_suffix(".idx.json")
+        self._csv_map = None
+        self._records_map = None
+        self._load_meta()
+        self.refresh()
+
+    # -- index maintenance --
+
+    def _load_meta(self):
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if not meta or meta.get("version") != INDEX_VERSION:
+            self._reset()
+            return
+        self.meta = meta
+        self._names = [None] * len(meta["titles"])
+        for title, (title_id, _, _) in meta["titles"].items():
+            self._names[title_id] = title
+
+    def _reset(self):
+        self.meta = {"version": INDEX_VERSION, "indexed_bytes": 0, "head": "", "last_row": "",
+                     "fields": [], "rows": 0, "titles": {}, "dates": []}
+        self._names = []
+
+    def refresh(self):
+        """Index rows appended to the CSV since the last refresh.
+
+        Returns:
+            Number of rows added to the index (all of them if it was rebuilt)
+        """
+        try:
+            f = open(self.csv_path, "rb")
+        except OSError:
+            f = None                    # deleted: index it as empty
+        try:
+            size = os.fstat(f.fileno()).st_size if f else 0
+            head = f.readline().decode("utf-8", "replace") if f else ""
+            meta = self.meta
+            # A shorter file (emptied or deleted included), or one whose
+            # first row or last indexed row changed, was replaced: index it
+            # from the start
+            replaced = size < meta["indexed_bytes"] or head != meta["head"]
+            if not replaced and f and meta["last_row"]:
+                last_row = meta["last_row"].encode("utf-8")
+                f.seek(meta["indexed_bytes"] - len(last_row))
+                replaced = f.read(len(last_row)) != last_row
+            if not replaced and size == meta["indexed_bytes"] and self._records_map is not None:
+                return 0
+
+            self._close_maps()
+            before = meta["rows"]
+            if replaced:
+                self._reset()
+                meta = self.meta
+                meta["head"] = head
+                before = 0
+            # Only the part not indexed yet is read
+            tail = b""
+            if f:
+                f.seek(meta["indexed_bytes"])
+                tail = f.read()
+        finally:
+            if f:
+                f.close()
+
+        # Records beyond the committed count are from an interrupted refresh
+        mode = "r+b" if self.records_path.exists() else "w+b"
+        with open(self.records_path, mode) as records:
+            records.truncate(meta["rows"] * RECORD.size)
+            records.seek(0, os.SEEK_END)
+            self._index(tail, meta["indexed_bytes"], records)
+
+        storage.atomic_write(self.meta_path, json.dumps(meta, ensure_ascii=False, separators=(",", ":")))
+        self._open_maps()
+        return meta["rows"] - before
+
+    def _index(self, data, base, records):
+        """Index the complete rows in data, which starts at byte base of the CSV."""
+        meta = self.meta
+        start = 0
+        if not meta["fields"]:
+            header = data.find(b"\n")
+            if header == -1:
+                return
+            meta["fields"] = _parse(data[:header + 1])
+            meta["last_row"] = data[:header + 1].decode("utf-8")
+            start = header + 1
+        fields = meta["fields"]
+        title_col, price_col, time_col = (fields.index(name) for name in ("title", "price", "scraped_at"))
+
+        titles = meta["titles"]
+        dates = meta["dates"]
+        row_number = meta["rows"]
+        out = bytearray()
+        end = start
+        rows = _split_rows(data, start)
+        if rows:
+            # Checked on the next refresh to tell an appended file from a replaced one
+            meta["last_row"] = rows[-1][1].decode("utf-8")
+        for offset, row in rows:
+            end = offset + len(row)
+            offset += base
+            values = _parse(row)
+            if len(values) != len(fields):
+                continue
+            title, scraped_at = values[title_col], values[time_col]
+            try:
+                pence = int(round(float(values[price_col]) * 100))
+                when = datetime.fromisoformat(scraped_at)
+            except ValueError:
+                continue
+
+            entry = titles.get(title)
+            if entry is None:
+                entry = titles[title] = [len(self._names), NO_ROW, pence]
+                self._names.append(title)
+            title_id, previous, last_pence = entry
+            flags = CHANGED if previous != NO_ROW and pence != last_pence else 0
+            out += RECORD.pack(offset, when.timestamp(), len(row), title_id, previous, pence, flags)
+            entry[1], entry[2] = row_number, pence
+
+            # Extend the date's current run of rows, or start a new one
+            day = scraped_at[:10]
+            if dates and dates[-1][0] == day and dates[-1][2] == row_number:
+                dates[-1][2] += 1
+            else:
+                dates.append([day, row_number, row_number + 1])
+            row_number += 1
+
+        records.write(out)
+        meta["rows"] = row_number
+        meta["indexed_bytes"] = base + end
+
+    def _open_maps(self):
+        if self.meta["rows"]:
+            with open(self.csv_path, "rb") as f:
+                self._csv_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            with open(self.records_path, "rb") as f:
+                self._records_map = mmap.mmap(f.fileno(), self.meta["rows"] * RECORD.size, access=mmap.ACCESS_READ)
+        else:
+            self._csv_map = None
+            self._records_map = b""
+
+    def _close_maps(self):
+        for m in (self._csv_map, self._records_map):
+            if isinstance(m, mmap.mmap):
+                m.close()
+        self._csv_map = self._records_map = None
+
+    def close(self):
+        self._close_maps()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    # -- lookups --
+
+    def _record(self, row_number):
+        return RECORD.unpack_from(self._records_map, row_number * RECORD.size)
+
+    def row(self, row_number):
+        """The CSV row as a dict (price as a float), read from the mapped file."""
+        offset, _, length, _, _, _, _ = self._record(row_number)
+        values = _parse(self._csv_map[offset:offset + length])
+        row = dict(zip(self.meta["fields"], values))
+        row["price"] = float(row["price"])
+        return row
+
+    def _chain(self, title):
+        entry = self.meta["titles"].get(title)
+        row_number = entry[1] if entry else NO_ROW
+        chain = []
+        while row_number != NO_ROW:
+            chain.append(row_number)
+            row_number = self._record(row_number)[4]
+        chain.reverse()
+        return chain
+
+    def history(self, title):
+        """[(scraped_at epoch seconds, price)] for title, oldest first; [] if unknown.
+
+        Read from the index alone; rows() gives the full CSV rows.
+        """
+        result = []
+        for row_number in self._chain(title):
+            _, when, _, _, _, pence, _ = self._record(row_number)
+            result.append((when, pence / 100))
+        return result
+
+    def rows(self, title):
+        """Every CSV row of title, oldest first."""
+        return [self.row(row_number) for row_number in self._chain(title)]
+
+    def latest(self, title):
+        """The title's most recent price, or None if it was never seen."""
+        entry = self.meta["titles"].get(title)
+        return entry[2] / 100 if entry else None
+
+    def titles(self):
+        return list(self._names)
+
+    def dates(self):
+        """Dates (YYYY-MM-DD) with rows, in file order, each once."""
+        return list(dict.fromkeys(day for day, _, _ in self.meta["dates"]))
+
+    def _on(self, date):
+        for day, start, end in self.meta["dates"]:
+            if day == date:
+                yield from range(start, end)
+
+    def on_date(self, date):
+        """Every CSV row scraped on date (YYYY-MM-DD), in file order."""
+        return [self.row(row_number) for row_number in self._on(date)]
+
+    def changes_on(self, date):
+        """Rows scraped on date whose price differs from the title's previous row.
+
+        Each row gets old_price, the price it changed from.
+        """
+        changes = []
+        for row_number in self._on(date):
+            _, _, _, _, previous, _, flags = self._record(row_number)
+            if flags & CHANGED:
+                row = self.row(row_number)
+                row["old_price"] = self._record(previous)[5] / 100
+                changes.append(row)
+        return changes
+
+
+def update_index(csv_path=DEFAULT_CSV):
+    """Bring csv_path's sidecar index up to date; returns the rows indexed."""
+    with PriceHistory(csv_path) as history:
+        return len(history)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] == "--date" and len(args) != 2:
+        sys.exit('Usage: python price_history.py "Book title" | --date YYYY-MM-DD')
+    with PriceHistory() as history:
+        if args[0] == "--date":
+            for row in history.changes_on(args[1]):
+                print(f"{row['old_price']:>8.2f} -> {row['price']:>8.2f}  {row['title']}")
+        else:
+            for when, price in history.history(args[0]):
+                print(f"{datetime.fromtimestamp(when).isoformat(timespec='seconds')}  {price:.2f}")
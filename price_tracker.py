@@ -5,6 +5,8 @@ This script demonstrates:
 - Scraping product prices from books.toscrape.com
 - Storing data in CSV format
 - Comparing prices over time
+- Looking up a book's price history (see price_history.py)
+- Reading every field of a product card in one pass (see cards.py)
 - Basic alerting (console output)
 """
 
@@ -16,12 +18,38 @@ from pathlib import Path
 
 from scrapling import Fetcher
 
+import cards
+import price_history
+import storage
+
 # Data storage paths
 DATA_DIR = Path(__file__).parent / "data"
 PRICES_CSV = DATA_DIR / "book_prices.csv"
 PRICES_JSON = DATA_DIR / "book_prices.json"
 
 
+def parse_price(text):
+    """'£51.77' -> 51.77"""
+    return float(text.replace("£", "").strip())
+
+
+def parse_rating(class_attr):
+    """'star-rating Three' -> 'Three'"""
+    return class_attr.replace("star-rating ", "").strip()
+
+
+# One product card; compiled once, each card read in a single walk
+BOOK_CARD = cards.CardSchema("article.product_pod", {
+    "title": cards.Field("h3 a", attr="title", default="Unknown"),
+    "price": cards.Field("p.price_color", transform=parse_price, default=0.0),
+    # The text sits after the <i> icon, so read all of it
+    "availability": cards.Field("p.availability", all_text=True, transform=str.strip, default="Unknown"),
+    "rating": cards.Field("p.star-rating", attr="class", transform=parse_rating, default=""),
+    # Relative URL
+    "url": cards.Field("h3 a", attr="href", default=""),
+})
+
+
 def ensure_data_dir():
     """Create data directory if it doesn't exist."""
     DATA_DIR.mkdir(exist_ok=True)
@@ -47,38 +75,9 @@ def scrape_book_prices(max_pages=2):
             print(f"Failed to fetch page {page}")
             continue
 
-        books = response.css("article.product_pod")
-
-        for book in books:
-            # Extract title
-            title_elems = book.css("h3 a")
-            title = title_elems[0].attrib.get("title", "Unknown") if title_elems else "Unknown"
-
-            # Extract relative URL
-            href = title_elems[0].attrib.get("href", "") if title_elems else ""
-
-            # Extract price (remove £ symbol)
-            price_elems = book.css("p.price_color")
-            price_text = price_elems[0].text if price_elems else "0"
-            price = float(price_text.replace("£", "").strip())
-
-            # Extract availability
-            avail_elems = book.css("p.availability")
-            availability = avail_elems[0].text.strip() if avail_elems else "Unknown"
-
-            # Extract star rating
-            rating_elems = book.css("p.star-rating")
-            rating_class = rating_elems[0].attrib.get("class", "") if rating_elems else ""
-            rating = rating_class.replace("star-rating ", "").strip()
-
-            book_data = {
-                "title": title,
-                "price": price,
-                "availability": availability,
-                "rating": rating,
-                "url": href,
-                "scraped_at": datetime.now().isoformat()
-            }
+        # Title, price, availability, rating and URL of every card
+        for book_data in BOOK_CARD.extract_all(response):
+            book_data["scraped_at"] = datetime.now().isoformat()
             all_books.append(book_data)
 
     print(f"Scraped {len(all_books)} books")
@@ -114,7 +113,9 @@ def save_prices_csv(books):
         for book in books:
             writer.writerow({k: book[k] for k in fieldnames})
 
-    print(f"Saved {len(books)} records to {PRICES_CSV}")
+    # Index the new rows so history lookups don't scan the whole file
+    rows = price_history.update_index(PRICES_CSV)
+    print(f"Saved {len(books)} records to {PRICES_CSV} ({rows} indexed)")
 
 
 def save_prices_json(books):
@@ -127,8 +128,7 @@ def save_prices_json(books):
         "books": books
     }
 
-    with open(PRICES_JSON, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    storage.write_json(data, PRICES_JSON)
 
     print(f"Saved {len(books)} records to {PRICES_JSON}")
 
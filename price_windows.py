@@ -0,0 +1,408 @@
+"""
+TripVibe Price Windows - Per-route plausibility bounds learned from past prices
+
+The extractors keep only prices inside a window, to tell fares from the
+other "$123" numbers on a page. The windows used to be constants (400-5000
+one-way, 1000-8000 return, 150-1500 a night), which drop real fares on
+short routes like SIN→BKK and let noise through on long ones. Now each
+route (flight origin-destination and trip type, hotel city) keeps a KLL
+quantile sketch of the prices seen on its pages, and its window is
+
+    [quantile(LOW_Q) * LOW_MARGIN, quantile(HIGH_Q) * HIGH_MARGIN]
+
+Until a route has MIN_SAMPLES prices the caller's constant window is used
+(cold start). Once the route's own window is trusted, sketches are fed
+only the prices that became records, i.e. those inside that window, never
+the taxes, bag fees and discount banners around them: learning from every
+number on the page let the window widen to admit that noise once it was
+more than a few percent of the page. During cold start the constant
+window may be wrong for the route (SIN→BKK one-way fares sit below its
+400), so the sketch learns instead from the densest cluster of the page's
+prices in the wide sanity range: the fares of a results page sit within
+a small factor of each other, the scattered fees and banners don't. A
+route whose fares are all outside the constant window still gets its own
+window after MIN_SAMPLES prices.
+
+A KLL sketch answers any quantile within about 1-2% rank error in a
+bounded number of stored values (a few hundred at the default k),
+however many prices it has seen, and two sketches merge into one. Each
+worker collects new prices in a small local sketch and merges it into the
+route's shared sketch in tripvibe_data/shared.db every FLUSH_INTERVAL
+seconds, so every worker learns from every search. A background thread
+flushes routes that have gone quiet, and the rest is flushed when the
+process exits.
+
+Prices are in the apps' display currency (SGD); hotel windows are per
+night.
+
+Usage:
+    windows = default_windows()
+    low, high = windows.window("flight:SIN-BKK:oneway", (400, 5000))
+    windows.observe("flight:SIN-BKK:oneway", prices_of_records)
+"""
+
+import atexit
+import json
+import math
+import os
+import random
+import threading
+import time
+from pathlib import Path
+
+from shared_state import connect
+
+DEFAULT_DB = Path(__file__).parent / "tripvibe_data" / "shared.db"
+
+SKETCH_K = 128                  # KLL accuracy/size parameter
+MIN_SAMPLES = 200               # prices before a route's own window is trusted
+LOW_Q, HIGH_Q = 0.05, 0.95
+LOW_MARGIN, HIGH_MARGIN = 0.5, 2.0
+FLUSH_INTERVAL = 30             # seconds between merges into the shared sketch
+VIEW_TTL = 60                   # seconds a worker trusts its copy of the shared sketch
+
+# Prices outside these never reach a sketch (display currency)
+FLIGHT_SANITY = (30, 50000)
+HOTEL_NIGHT_SANITY = (15, 20000)
+CLUSTER_SPREAD = 4              # highest/lowest price of a cold-start cluster
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_sketches (
+    key TEXT PRIMARY KEY,
+    sketch TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_default_windows = None
+_default_windows_lock = threading.Lock()
+
+
+def flight_key(origin, destination, round_trip):
+    return f"flight:{origin}-{destination}:{'return' if round_trip else 'oneway'}"
+
+
+def hotel_key(city):
+    return f"hotel:{city}"
+
+
+def densest_cluster(prices, spread=CLUSTER_SPREAD):
+    """The largest run of prices within a factor of spread of each other.
+
+    Ties go to the cheaper run. Used to pick a page's fares out of its
+    other numbers while a route has no window of its own.
+    """
+    prices = sorted(p for p in prices if p > 0)
+    best_start, best_end = 0, 0
+    start = 0
+    for end, price in enumerate(prices):
+        while price > prices[start] * spread:
+            start += 1
+        if end + 1 - start > best_end - best_start:
+            best_start, best_end = start, end + 1
+    return prices[best_start:best_end]
+
+
+class KLLSketch:
+    """KLL streaming quantile sketch (Karnin, Lang, Liberty 2016).
+
+    Values live in levels ("compactors"); a value at level h stands for
+    2**h observed values. When the sketch is full, the lowest full level is
+    sorted and every other value (odd or even positions, at random) moves
+    up a level. Capacities shrink geometrically towards the lower levels,
+    so the total stays around 3 * k values.
+    """
+
+    __slots__ = ("k", "n", "levels")
+
+    C = 2 / 3
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.n = 0
+        self.levels = [[]]
+
+    def _capacity(self, h):
+        depth = len(self.levels) - h - 1
+        return max(2, int(math.ceil(self.k * self.C ** depth)))
+
+    def _size(self):
+        return sum(len(level) for level in self.levels)
+
+    def _max_size(self):
+        return sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def update(self, value):
+        self.levels[0].append(value)
+        self.n += 1
+        if len(self.levels[0]) >= self._capacity(0) and self._size() >= self._max_size():
+            self._compress()
+
+    def extend(self, values):
+        for value in values:
+            self.update(value)
+
+    def _compress(self):
+        while self._size() >= self._max_size():
+            for h, level in enumerate(self.levels):
+                if len(level) >= self._capacity(h):
+                    if h + 1 == len(self.levels):
+                        self.levels.append([])
+                    level.sort()
+                    # An odd value out stays at this level
+                    keep = [level.pop()] if len(level) % 2 else []
+                    self.levels[h + 1].extend(level[random.getrandbits(1)::2])
+                    self.levels[h] = keep
+                    break
+            else:
+                return
+
+    def merge(self, other):
+        """Add other's values to this sketch (other is unchanged)."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, level in enumerate(other.levels):
+            self.levels[h].extend(level)
+        self.n += other.n
+        self._compress()
+
+    def quantiles(self, qs):
+        """Approximate value at each rank fraction in qs (None if empty)."""
+        weighted = sorted((value, 1 << h) for h, level in enumerate(self.levels) for value in level)
+        total = sum(weight for _, weight in weighted)
+        if not total:
+            return [None for _ in qs]
+        results = []
+        for q in qs:
+            target = q * total
+            seen = 0
+            value = weighted[-1][0]
+            for v, weight in weighted:
+                seen += weight
+                if seen >= target:
+                    value = v
+                    break
+            results.append(value)
+        return results
+
+    def to_json(self):
+        return json.dumps({"k": self.k, "n": self.n, "levels": self.levels}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        sketch = cls(data["k"])
+        sketch.n = data["n"]
+        sketch.levels = data["levels"] or [[]]
+        return sketch
+
+
+class _Route:
+    """One route's shared sketch as last read, plus prices not yet merged in."""
+
+    __slots__ = ("shared", "read_at", "pending", "flushed_at", "bounds")
+
+    def __init__(self):
+        self.shared = None
+        self.read_at = 0.0
+        self.pending = KLLSketch()
+        self.flushed_at = time.monotonic()
+        self.bounds = None
+
+
+class PriceWindows:
+    """Per-route price sketches shared by every worker, and the windows they give."""
+
+    def __init__(self, db_path, min_samples=MIN_SAMPLES, flush_interval=FLUSH_INTERVAL):
+        """
+        Args:
+            db_path: SQLite file shared by all workers
+            min_samples: Prices a route needs before its own window is used
+            flush_interval: Seconds between merges of local prices into the
+                shared sketch
+        """
+        self.db_path = db_path
+        self.min_samples = min_samples
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+        os.makedirs(os.path.dirname(os.fspath(db_path)), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def _route(self, key):
+        with self._lock:
+            route = self._routes.get(key)
+            if route is None:
+                route = self._routes[key] = _Route()
+            return route
+
+    def _read(self, key):
+        row = self._conn().execute("SELECT sketch FROM price_sketches WHERE key = ?", (key,)).fetchone()
+        return KLLSketch.from_json(row[0]) if row else KLLSketch()
+
+    def window(self, key, default):
+        """(low, high) prices plausible for key, or default until it has enough data."""
+        route = self._route(key)
+        now = time.monotonic()
+        if route.shared is None or now - route.read_at > VIEW_TTL:
+            shared = self._read(key)
+            with self._lock:
+                route.shared, route.read_at, route.bounds = shared, now, None
+        with self._lock:
+            if route.bounds is None:
+                route.bounds = self._bounds(route, default)
+            bounds = route.bounds
+            due = self._due(route)
+        if due:
+            self._flush_quietly(key)
+        return bounds if bounds is not None else default
+
+    def _due(self, route):
+        # Called with the lock held
+        return route.pending.n and time.monotonic() - route.flushed_at >= self.flush_interval
+
+    def _flush_quietly(self, key=None, due_only=False):
+        # From lookups and the background thread: a failed merge keeps the
+        # prices for the next try and never fails a search
+        try:
+            self.flush(key, due_only)
+        except Exception as e:
+            print(f"Price sketch flush failed: {e}")
+
+    def _bounds(self, route, default):
+        if route.shared.n + route.pending.n < self.min_samples:
+            return None
+        sketch = KLLSketch(route.shared.k)
+        sketch.merge(route.shared)
+        sketch.merge(route.pending)
+        low, high = sketch.quantiles((LOW_Q, HIGH_Q))
+        return int(low * LOW_MARGIN), int(math.ceil(high * HIGH_MARGIN))
+
+    def observe(self, key, prices, candidates=None):
+        """Record prices seen for key (display currency; per night for hotels).
+
+        Args:
+            key: Route key (flight_key, hotel_key)
+            prices: The prices the page's records were drawn from, i.e.
+                those inside the route's current window
+            candidates: Every price on the page in the sanity range; while
+                the route is in cold start their densest cluster is
+                recorded instead of prices, so a wrong constant window
+                can't keep the route from learning its own
+        """
+        route = self._route(key)
+        if candidates:
+            if route.shared is None:
+                shared = self._read(key)
+                with self._lock:
+                    if route.shared is None:
+                        route.shared, route.read_at = shared, time.monotonic()
+            with self._lock:
+                cold = route.shared.n + route.pending.n < self.min_samples
+            if cold:
+                prices = densest_cluster(candidates)
+        if not prices:
+            return
+        with self._lock:
+            route.pending.extend(prices)
+            route.bounds = None
+            due = self._due(route)
+        if due:
+            self.flush(key)
+
+    def flush(self, key=None, due_only=False):
+        """Merge local prices into the shared sketches.
+
+        Args:
+            key: Route to flush, or None for every route
+            due_only: Only routes not flushed for flush_interval seconds
+        """
+        with self._lock:
+            keys = [key] if key is not None else list(self._routes)
+        for key in keys:
+            route = self._route(key)
+            with self._lock:
+                if due_only and not self._due(route):
+                    continue
+                pending, route.pending = route.pending, KLLSketch()
+                route.flushed_at = time.monotonic()
+            if not pending.n:
+                continue
+
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                shared = self._read(key)
+                shared.merge(pending)
+                conn.execute(
+                    "INSERT OR REPLACE INTO price_sketches (key, sketch, updated_at) VALUES (?, ?, ?)",
+                    (key, shared.to_json(), time.time()),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                # Keep the prices for the next flush
+                with self._lock:
+                    pending.merge(route.pending)
+                    route.pending = pending
+                raise
+            with self._lock:
+                route.shared, route.read_at, route.bounds = shared, time.monotonic(), None
+
+    def start_flusher(self):
+        """Flush routes with prices pending for flush_interval, in a daemon thread.
+
+        Without it a route's prices wait for its next lookup; at exit they
+        are flushed either way (see default_windows).
+        """
+        if self._flusher is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.flush_interval)
+                self._flush_quietly(due_only=True)
+
+        self._flusher = threading.Thread(target=loop, daemon=True, name="price-windows")
+        self._flusher.start()
+
+
+def default_windows():
+    """Return the process-wide price windows, creating them on first use."""
+    global _default_windows
+    with _default_windows_lock:
+        if _default_windows is None:
+            windows = PriceWindows(DEFAULT_DB)
+            windows.start_flusher()
+            # Prices still pending when the worker stops aren't lost
+            atexit.register(windows._flush_quietly)
+            _default_windows = windows
+        return _default_windows
+
+
+def flush_default():
+    """Merge the process-wide windows' pending prices, if they were ever created.
+
+    For exits that skip atexit (serve.py's workers end with os._exit()).
+    """
+    with _default_windows_lock:
+        windows = _default_windows
+    if windows is not None:
+        windows._flush_quietly()
+
+
+def set_default_windows(windows):
+    """Replace the process-wide windows (e.g. with ones in a temp directory)."""
+    global _default_windows
+    with _default_windows_lock:
+        _default_windows = windows
@@ -0,0 +1,160 @@
+"""
+TripVibe Rate Limiter - Per-source pacing and daily query counts
+
+The README's scraping notes put Skyscanner at roughly 100-500 queries/day
+and Booking.com at 100-300 before detection kicks in. This module:
+
+- keeps a minimum interval between requests to the same source
+- counts each day's queries per source against a daily budget, for
+  /metrics (tripvibe_rate_limit_remaining); going over it is reported,
+  not refused
+
+Both are kept in the shared SQLite file and updated in one transaction per
+request, so every worker process counts against the same budget and N
+workers together still send one request per interval.
+
+Usage:
+    limiter = default_limiter()
+    limiter.acquire("skyscanner")       # blocks for pacing, counts one query
+    limiter.remaining("booking")
+"""
+
+import os
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+import metrics
+from shared_state import connect
+
+DAILY_LIMITS = {
+    "skyscanner": int(os.environ.get("TRIPVIBE_SKYSCANNER_DAILY", "300")),
+    "booking": int(os.environ.get("TRIPVIBE_BOOKING_DAILY", "200")),
+}
+MIN_INTERVALS = {
+    "skyscanner": 2.0,
+    "booking": 1.0,
+}
+DEFAULT_DB = Path(__file__).parent / "tripvibe_data" / "shared.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_budget (
+    source TEXT NOT NULL,
+    day TEXT NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (source, day)
+);
+CREATE TABLE IF NOT EXISTS rate_pacing (
+    source TEXT PRIMARY KEY,
+    next_slot REAL NOT NULL         -- wall-clock time of the next request's start
+);
+"""
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Paces requests per source and counts them against a daily budget (report-only)."""
+
+    def __init__(self, db_path, limits=None, intervals=None):
+        self.db_path = db_path
+        self.limits = dict(DAILY_LIMITS if limits is None else limits)
+        self.intervals = dict(MIN_INTERVALS if intervals is None else intervals)
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.fspath(db_path)), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def remaining(self, source):
+        """Queries left today for source (None if the source is unlimited)."""
+        limit = self.limits.get(source)
+        if limit is None:
+            return None
+        row = self._conn().execute(
+            "SELECT used FROM rate_budget WHERE source = ? AND day = ?",
+            (source, date.today().isoformat()),
+        ).fetchone()
+        return max(0, limit - (row[0] if row else 0))
+
+    def _reserve(self, source):
+        """Count one of today's queries and take the next request slot.
+
+        Both happen in one transaction on the shared file, so workers don't
+        lose counts or start requests closer than the interval.
+
+        Returns:
+            Wall-clock time the request may start at
+        """
+        limit = self.limits.get(source)
+        interval = self.intervals.get(source, 0)
+        now = time.time()
+        if limit is None and not interval:
+            return now
+        day = date.today().isoformat()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if limit is not None:
+                row = conn.execute(
+                    "SELECT used FROM rate_budget WHERE source = ? AND day = ?", (source, day)
+                ).fetchone()
+                used = row[0] if row else 0
+                if used == limit:
+                    # Reported once a day; the request still goes ahead
+                    print(f"Daily budget for {source} used up ({limit} queries)")
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_budget (source, day, used) VALUES (?, ?, ?)",
+                    (source, day, used + 1),
+                )
+            slot = now
+            if interval:
+                row = conn.execute(
+                    "SELECT next_slot FROM rate_pacing WHERE source = ?", (source,)
+                ).fetchone()
+                slot = max(now, row[0] if row else 0.0)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_pacing (source, next_slot) VALUES (?, ?)",
+                    (source, slot + interval),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return slot
+
+    def acquire(self, source):
+        """Wait for this source's next request slot and count one query."""
+        slot = self._reserve(source)
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def default_limiter():
+    """Return the process-wide limiter, creating it on first use."""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            limiter = RateLimiter(DEFAULT_DB)
+            for source in limiter.limits:
+                metrics.RATE_LIMIT_REMAINING.labels(source).set_function(
+                    lambda source=source: limiter.remaining(source)
+                )
+            _default_limiter = limiter
+        return _default_limiter
+
+
+def set_default_limiter(limiter):
+    """Replace the process-wide limiter (e.g. an unlimited one for benchmarks)."""
+    global _default_limiter
+    with _default_limiter_lock:
+        _default_limiter = limiter
@@ -0,0 +1,189 @@
+"""
+TripVibe Records - Compact flight, hotel and bundle types
+
+Scraped flights and hotels used to travel through the apps as dicts with
+10+ string keys each. These record classes use __slots__ so every instance
+is a fixed-size struct instead of a per-object hash table, and they know how
+to turn themselves into plain dicts (for JSON and templates) or positional
+rows (for compact storage).
+
+Usage:
+    flight = Flight(airline="Emirates", price=812, duration="19h 5m")
+    flight.to_dict()            # {"airline": "Emirates", "price": 812, ...}
+    Flight.from_row(flight.to_row()) == flight
+
+    app.json = RecordJSONProvider(app)  # jsonify/tojson accept records
+"""
+
+import json
+from operator import attrgetter
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class Record:
+    """Base class for slot-backed records.
+
+    Subclasses declare FIELDS (the slot names, in storage order) and
+    DEFAULTS (values for fields that may be omitted).
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+    DEFAULTS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # attrgetter with several names returns a tuple in one C call
+        cls._row_getter = attrgetter(*cls.FIELDS)
+
+    def __init__(self, **kwargs):
+        for name in self.FIELDS:
+            if name in kwargs:
+                value = kwargs.pop(name)
+            elif name in self.DEFAULTS:
+                value = self.DEFAULTS[name]
+            else:
+                raise TypeError(f"{type(self).__name__} missing field '{name}'")
+            setattr(self, name, value)
+
+        if kwargs:
+            raise TypeError(f"{type(self).__name__} got unknown fields: {', '.join(kwargs)}")
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({values})"
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._row_getter(self) == other._row_getter(other)
+
+    __hash__ = None
+
+    def to_dict(self):
+        """Return the record as a plain dict (shallow)."""
+        return dict(zip(self.FIELDS, self._row_getter(self)))
+
+    def to_row(self):
+        """Return field values as a list, in FIELDS order."""
+        return list(self._row_getter(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a dict, ignoring unknown keys."""
+        return cls(**{name: data[name] for name in cls.FIELDS if name in data})
+
+    @classmethod
+    def from_row(cls, row):
+        """Build a record from a positional row produced by to_row().
+
+        A shorter row (stored before fields were added) takes DEFAULTS for
+        the missing trailing fields; a longer one, or a missing field
+        without a default, raises TypeError.
+        """
+        if len(row) > len(cls.FIELDS):
+            raise TypeError(f"{cls.__name__} row has {len(row)} values, expected {len(cls.FIELDS)}")
+        record = cls.__new__(cls)
+        for name, value in zip(cls.FIELDS, row):
+            setattr(record, name, value)
+        for name in cls.FIELDS[len(row):]:
+            if name not in cls.DEFAULTS:
+                raise TypeError(f"{cls.__name__} row is missing field '{name}'")
+            setattr(record, name, cls.DEFAULTS[name])
+        return record
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """JSON provider that lets jsonify/tojson serialise records."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+
+class Flight(Record):
+    """A single flight option scraped from Skyscanner."""
+
+    __slots__ = (
+        "airline", "emoji", "price", "duration", "duration_hours",
+        "depart", "arrive", "stops", "carbon", "booking_url", "available",
+    )
+    FIELDS = __slots__
+    DEFAULTS = {
+        "emoji": "✈️",
+        "duration": "20h",
+        "duration_hours": 20,
+        "depart": "08:00",
+        "arrive": "18:00",
+        "stops": 1,
+        "carbon": 0,
+        "booking_url": "",
+        "available": True,
+    }
+
+
+class Hotel(Record):
+    """A single hotel option scraped from Booking.com."""
+
+    __slots__ = (
+        "name", "price_total", "price_per_night", "stars", "score",
+        "reviews", "location", "booking_url", "available",
+    )
+    FIELDS = __slots__
+    DEFAULTS = {
+        "stars": 3,
+        "score": "8.0",
+        "reviews": 0,
+        "location": "City Center",
+        "booking_url": "",
+        "available": True,
+    }
+
+
+class Bundle(Record):
+    """A flight + hotel combo. Holds references, not copies, of both."""
+
+    __slots__ = (
+        "flight", "hotel", "origin", "destination", "nights",
+        "total_price", "savings", "vibe_text",
+    )
+    FIELDS = __slots__
+    DEFAULTS = {
+        "savings": 0,
+        "vibe_text": "",
+    }
+
+    def to_dict(self):
+        data = super().to_dict()
+        data["flight"] = self.flight.to_dict()
+        data["hotel"] = self.hotel.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        bundle = super().from_dict(data)
+        if isinstance(bundle.flight, dict):
+            bundle.flight = Flight.from_dict(bundle.flight)
+        if isinstance(bundle.hotel, dict):
+            bundle.hotel = Hotel.from_dict(bundle.hotel)
+        return bundle
+
+
+def encode_default(obj):
+    """json.dump(default=...) hook that serialises records."""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, **kwargs):
+    """json.dumps that understands records."""
+    return json.dumps(obj, default=encode_default, **kwargs)
+
+
+def dump(obj, fp, **kwargs):
+    """json.dump that understands records."""
+    json.dump(obj, fp, default=encode_default, **kwargs)
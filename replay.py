@@ -0,0 +1,280 @@
+"""
+TripVibe Replay - Record, replay or pass through browser fetches
+
+Load testing /api/bundle against the real sites would burn the daily query
+budget in minutes and get us blocked. This module sits under the browser
+pool, where StealthyFetcher is created, and has three modes:
+
+- passthrough   normal StealthyFetcher (the default)
+- record        StealthyFetcher, and every response is also saved to disk
+- replay        saved responses are served with synthetic latency; no
+                browser is launched and no request leaves the host
+
+Recordings are keyed by the URL with its query parameters sorted, so
+?a=1&b=2 and ?b=2&a=1 are the same entry. Fetch options (solve_cloudflare
+and friends) change how a page is fetched, not what it is, so they are
+stored with the entry but are not part of the key.
+
+Each recording is one HAR-style JSON file: the request, the response
+(status, final URL, headers, HTML) and how long the live fetch took, split
+into load (up to page_action) and teardown like the pool's timing spans.
+In replay mode the page handed to page_action is None.
+
+Configuration (read by browser_pool.default_pool()):
+    TRIPVIBE_FETCH_MODE         passthrough | record | replay
+    TRIPVIBE_RECORDINGS         directory of recordings
+                                (default tripvibe_data/recordings)
+    TRIPVIBE_REPLAY_LATENCY     recorded     - sleep as long as the live fetch did (default)
+                                recorded*0.5 - scaled recorded time
+                                2.5          - fixed seconds
+                                1-4          - uniform between 1 and 4 seconds
+                                0            - no delay
+    TRIPVIBE_REPLAY_FALLBACK    1 = on a miss, serve another recording of the
+                                same site instead of a 404, so a load test
+                                can use searches that were never recorded
+
+Usage:
+    TRIPVIBE_FETCH_MODE=record python tripvibe_v2.py     # click through some searches
+    TRIPVIBE_FETCH_MODE=replay TRIPVIBE_REPLAY_FALLBACK=1 python serve.py tripvibe_v2 --workers 4
+    python benchmarks/loadgen.py http://127.0.0.1:5002 --users 20 --duration 60
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from scrapling import StealthyFetcher
+
+import browser_pool
+import storage
+
+MODES = ("passthrough", "record", "replay")
+DEFAULT_DIR = Path(__file__).parent / "tripvibe_data" / "recordings"
+
+
+def request_key(url):
+    """Normalise url into a recording key: lower-case host, sorted query."""
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, query, ""))
+
+
+def _file_name(key):
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + ".json"
+
+
+def parse_latency(spec):
+    """Turn a TRIPVIBE_REPLAY_LATENCY value into fn(entry) -> seconds.
+
+    Args:
+        spec: "recorded", "recorded*<scale>", "<seconds>" or "<min>-<max>"
+    """
+    spec = (spec or "recorded").strip()
+    if spec.startswith("recorded"):
+        scale = float(spec.partition("*")[2] or 1)
+        return lambda entry: entry["timings"]["total_ms"] / 1000 * scale
+    if "-" in spec:
+        low, high = (float(x) for x in spec.split("-", 1))
+        return lambda entry: random.uniform(low, high)
+    seconds = float(spec)
+    return lambda entry: seconds
+
+
+class ReplayResponse:
+    """The parts of a Scrapling response the scrapers use."""
+
+    def __init__(self, url, html, status=200, headers=None):
+        self.url = url
+        self.status = status
+        self.html_content = html
+        self.headers = headers or {}
+
+
+class RecordingStore:
+    """Directory of recorded responses, one JSON file per key."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._entries = {}          # key -> entry, loaded lazily
+        self._by_host = {}          # host -> [key, ...] for fallback
+        self._lock = threading.Lock()
+        self._indexed = False
+
+    def _index(self):
+        # Reads every file once per process, only when fallback needs it
+        with self._lock:
+            if self._indexed:
+                return
+            for path in sorted(self.directory.glob("*.json")):
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        key = json.load(f)["request"]["key"]
+                except (OSError, ValueError, KeyError):
+                    continue
+                self._by_host.setdefault(urlsplit(key).netloc, []).append(key)
+            self._indexed = True
+
+    def get(self, key):
+        """Return the entry for key, or None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        try:
+            with open(self.directory / _file_name(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def nearest(self, key):
+        """Some other recording of the same host, picked stably by key."""
+        self._index()
+        candidates = self._by_host.get(urlsplit(key).netloc)
+        if not candidates:
+            return None
+        digest = int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16)
+        return self.get(candidates[digest % len(candidates)])
+
+    def put(self, entry):
+        key = entry["request"]["key"]
+        storage.atomic_write(
+            self.directory / _file_name(key),
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")),
+        )
+        with self._lock:
+            self._entries[key] = entry
+            hosts = self._by_host.setdefault(urlsplit(key).netloc, [])
+            if key not in hosts:
+                hosts.append(key)
+
+
+class ReplayFetcher:
+    """Fetcher with the StealthyFetcher.fetch() signature and a mode switch.
+
+    One instance serves every fetch of a process: the pool's
+    fetcher_factory returns it each time.
+    """
+
+    def __init__(self, mode="passthrough", directory=DEFAULT_DIR, latency="recorded",
+                 fallback=False, live_factory=None):
+        """
+        Args:
+            mode: "passthrough", "record" or "replay"
+            directory: Where recordings are read from / written to
+            latency: Replay delay spec, see parse_latency()
+            fallback: In replay mode, serve another recording of the same
+                host when the URL was never recorded
+            live_factory: Zero-arg callable returning the real fetcher
+                (default: headless StealthyFetcher)
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown fetch mode {mode!r}, expected one of {MODES}")
+        self.mode = mode
+        self.store = RecordingStore(directory) if mode != "passthrough" else None
+        self.latency = parse_latency(latency)
+        self.fallback = fallback
+        self.live_factory = live_factory or (lambda: StealthyFetcher(headless=True))
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def live(self):
+        """True if fetches reach the real site (and so count against budgets)."""
+        return self.mode != "replay"
+
+    def fetch(self, url, page_action=None, **kwargs):
+        if self.mode == "replay":
+            return self._replay(url, page_action)
+        if self.mode == "record":
+            return self._record(url, page_action, kwargs)
+        return self.live_factory().fetch(url, page_action=page_action, **kwargs)
+
+    def _record(self, url, page_action, kwargs):
+        start = time.perf_counter()
+        loaded = []
+
+        def timed_steps(page):
+            loaded.append(time.perf_counter())
+            if page_action is None:
+                return page
+            return (yield from browser_pool.steps_of(page_action)(page))
+
+        # A PageAction, so tab-mode (async) fetchers can still drive page_action
+        timed_action = browser_pool.PageAction(timed_steps)
+        response = self.live_factory().fetch(url, page_action=timed_action, **kwargs)
+        end = time.perf_counter()
+        ready = loaded[0] if loaded else end
+
+        self.store.put({
+            "request": {
+                "key": request_key(url),
+                "url": url,
+                # Only plain values; callbacks can't be saved and don't change the page
+                "options": {k: v for k, v in kwargs.items()
+                            if isinstance(v, (str, int, float, bool, type(None)))},
+            },
+            "response": {
+                "status": response.status,
+                "url": getattr(response, "url", url),
+                "headers": dict(getattr(response, "headers", None) or {}),
+                "html": response.html_content,
+            },
+            "timings": {
+                "load_ms": round((ready - start) * 1000, 1),
+                "total_ms": round((end - start) * 1000, 1),
+            },
+            "recorded_at": datetime.now().isoformat(),
+        })
+        return response
+
+    def _replay(self, url, page_action):
+        key = request_key(url)
+        entry = self.store.get(key)
+        if entry is None and self.fallback:
+            entry = self.store.nearest(key)
+        if entry is None:
+            self.misses += 1
+            if page_action is not None:
+                page_action(None)
+            return ReplayResponse(url, "", status=404)
+        self.hits += 1
+
+        # Split the delay like the live fetch: load, page_action, teardown
+        delay = max(0.0, self.latency(entry))
+        timings = entry["timings"]
+        load_share = timings["load_ms"] / timings["total_ms"] if timings["total_ms"] else 1.0
+        time.sleep(delay * load_share)
+        if page_action is not None:
+            page_action(None)
+        time.sleep(delay * (1 - load_share))
+
+        recorded = entry["response"]
+        # Serve under the requested URL so links built from it stay consistent
+        return ReplayResponse(url, recorded["html"], recorded["status"], recorded["headers"])
+
+
+def fetcher_from_env(live_factory=None):
+    """ReplayFetcher configured from the environment, or None for passthrough.
+
+    Args:
+        live_factory: Passed to ReplayFetcher (e.g. the tab host in tab mode)
+    """
+    mode = os.environ.get("TRIPVIBE_FETCH_MODE", "passthrough")
+    if mode == "passthrough":
+        return None
+    return ReplayFetcher(
+        mode=mode,
+        directory=os.environ.get("TRIPVIBE_RECORDINGS", DEFAULT_DIR),
+        latency=os.environ.get("TRIPVIBE_REPLAY_LATENCY", "recorded"),
+        fallback=os.environ.get("TRIPVIBE_REPLAY_FALLBACK") == "1",
+        live_factory=live_factory,
+    )
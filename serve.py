@@ -0,0 +1,147 @@
+"""
+TripVibe Multi-Worker Server
+
+Runs one of the Flask apps as N worker processes sharing a single listening
+socket (pre-fork). Scraping and bundle building are CPU-bound in places, so
+one process serialises them on the GIL; with several workers they run in
+parallel. Workers share:
+
+- the search cache and single-flight leases (SQLite WAL, shared_state.py)
+- the latest search snapshot (atomic files, storage.SnapshotStore)
+- a host-wide cap on Chromium instances (browser_pool.py)
+- metrics: each worker publishes to TRIPVIBE_METRICS_DIR, /metrics merges them
+
+The parent process only supervises: it restarts workers that exit and stops
+them all on Ctrl+C / SIGTERM. POSIX only (uses os.fork).
+
+Usage:
+    python serve.py tripvibe_v2 --workers 4 --port 5002
+    TRIPVIBE_BROWSERS=3 python serve.py tripvibe --workers 2 --port 5001
+
+Any WSGI pre-fork server works too, e.g. `gunicorn -w 4 tripvibe_v2:app`,
+since no worker keeps state the others need.
+"""
+
+import argparse
+import importlib
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+import metrics
+import price_windows
+
+DEFAULT_PORTS = {"dashboard": 5000, "tripvibe": 5001, "tripvibe_v2": 5002}
+
+
+def run_worker(app_module, sock):
+    """Serve requests on the inherited socket until told to stop."""
+    module = importlib.import_module(app_module)
+    server = make_server(
+        sock.getsockname()[0],
+        sock.getsockname()[1],
+        module.app,
+        threaded=True,
+        fd=sock.fileno(),
+    )
+    # shutdown() waits for serve_forever() to return, so it can't run on the
+    # thread that's serving: the handler only starts a thread that calls it
+    signal.signal(
+        signal.SIGTERM,
+        lambda *_: threading.Thread(target=server.shutdown, daemon=True).start(),
+    )
+    server.serve_forever()
+
+
+def spawn(app_module, sock):
+    """Fork one worker and return its pid."""
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            run_worker(app_module, sock)
+        finally:
+            # os._exit() skips atexit: save what the worker only holds in
+            # memory (pending route prices, metrics since the last write)
+            price_windows.flush_default()
+            try:
+                metrics.REGISTRY.flush()
+            except OSError:
+                pass
+            os._exit(0)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a TripVibe app with several worker processes")
+    parser.add_argument("app", choices=sorted(DEFAULT_PORTS), help="App module to serve")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None)
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        print("serve.py needs os.fork(); on Windows run the app directly.")
+        sys.exit(1)
+
+    port = args.port or DEFAULT_PORTS[args.app]
+
+    # Workers publish their metrics here so /metrics on any of them covers all
+    metrics_dir = os.environ.setdefault(
+        "TRIPVIBE_METRICS_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "tripvibe_data", "metrics", args.app),
+    )
+    if os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            os.unlink(os.path.join(metrics_dir, name))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    print("=" * 50)
+    print(f"TRIPVIBE SERVER - {args.app}")
+    print("=" * 50)
+    print(f"\nServing on http://{args.host}:{port} with {args.workers} workers")
+    print("Press Ctrl+C to stop\n")
+
+    workers = {spawn(args.app, sock) for _ in range(args.workers)}
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited (status {status}), restarting")
+            time.sleep(1)  # avoid a tight crash loop
+            workers.add(spawn(args.app, sock))
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+TripVibe Sessions - Reuse Cloudflare clearance across fetches and restarts
+
+Every scrape starts a fresh browser, so every search used to solve the
+Cloudflare challenge again (solve_cloudflare=True), often the slowest part
+of the fetch. After a fetch that solved it, the browser pool saves the
+domain's session here:
+
+- cookies (cf_clearance and the site's own)
+- storage state (cookies + localStorage, as Playwright reports it)
+- fingerprint (user agent, platform, language, screen, timezone);
+  clearance is tied to the user agent, so reuse sends the same one
+
+The next fetch to that domain starts with those cookies, the saved
+localStorage, and the same user agent, locale and timezone, and skips the
+solve. Platform and screen are kept for reference only: the stealth browser
+sets those itself. In tab mode (tabs.py) the browsers are shared, so only
+the cookies, localStorage and User-Agent header carry over. Sessions live in the shared SQLite file, so every worker
+and every restart uses them, until the earliest clearance cookie expires
+(or the default TTL if the site sets none). A refresher thread re-solves
+sessions that are about to expire, so interactive searches don't pay for
+it; only one worker on the host refreshes a given domain at a time. Only
+domains a fetch used within REFRESH_ACTIVE are refreshed, so an idle server
+stops launching browsers; a failed refresh backs off (doubling up to
+REFRESH_BACKOFF_MAX), and sessions that have already expired are deleted.
+
+Usage:
+    store = default_store()
+    session = store.get("www.skyscanner.com.sg")      # None if missing/expired
+    store.put(domain, cookies, storage_state, fingerprint)
+    store.invalidate(domain)                          # clearance was rejected
+
+TRIPVIBE_SESSION_REFRESH=0 turns the background refresher off.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from shared_state import connect
+
+DEFAULT_DB = Path(__file__).parent / "tripvibe_data" / "shared.db"
+DEFAULT_TTL = 30 * 60           # when no clearance cookie says otherwise
+REFRESH_MARGIN = 5 * 60         # re-solve this long before expiry
+REFRESH_INTERVAL = 60           # seconds between refresher checks
+REFRESH_ACTIVE = 2 * 60 * 60    # only refresh domains used this recently
+REFRESH_LEASE = 120             # seconds one worker holds a domain's refresh
+REFRESH_BACKOFF_MAX = 60 * 60   # longest wait after failed refreshes
+
+# Cookies whose expiry bounds the session
+CLEARANCE_COOKIES = ("cf_clearance", "__cf_bm")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    domain TEXT PRIMARY KEY,
+    cookies TEXT NOT NULL,
+    storage_state TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    refreshing_until REAL NOT NULL DEFAULT 0,
+    used_at REAL NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Columns added since the table was first created, for older shared.db files
+MIGRATIONS = {
+    "used_at": "ALTER TABLE sessions ADD COLUMN used_at REAL NOT NULL DEFAULT 0",
+    "failures": "ALTER TABLE sessions ADD COLUMN failures INTEGER NOT NULL DEFAULT 0",
+}
+
+# Read in the page after load; the user agent must match on reuse
+FINGERPRINT_JS = """() => ({
+    user_agent: navigator.userAgent,
+    platform: navigator.platform,
+    language: navigator.language,
+    screen: [screen.width, screen.height],
+    timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+})"""
+
+# Init script putting saved localStorage back before the site's scripts run;
+# keys the page has already set again are left alone
+RESTORE_JS = """(origins => {
+    const items = origins[location.origin];
+    if (!items) return;
+    for (const [name, value] of items) {
+        try {
+            if (localStorage.getItem(name) === null) localStorage.setItem(name, value);
+        } catch (e) {}
+    }
+})(%s)"""
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def capture_steps(page):
+    """Read cookies, storage state and fingerprint from a live page.
+
+    A browser_pool.PageAction step generator (works on sync and async pages).
+
+    Returns:
+        (cookies, storage_state, fingerprint), or None if the page has gone
+    """
+    try:
+        storage_state = yield page.context.storage_state()
+        fingerprint = yield page.evaluate(FINGERPRINT_JS)
+    except Exception:
+        return None
+    return storage_state.get("cookies", []), storage_state, fingerprint
+
+
+def restore_steps(storage_state):
+    """page_setup step generator restoring storage_state's localStorage.
+
+    A browser_pool.PageAction step generator like capture_steps(); None if
+    there is nothing to restore.
+    """
+    origins = {
+        o["origin"]: [(item["name"], item["value"]) for item in o.get("localStorage", ())]
+        for o in storage_state.get("origins", ()) if o.get("localStorage")
+    }
+    if not origins:
+        return None
+    script = RESTORE_JS % json.dumps(origins)
+
+    def steps(page):
+        yield page.add_init_script(script=script)
+    return steps
+
+
+def looks_challenged(html):
+    """True if html is a Cloudflare interstitial rather than the real page."""
+    head = html[:20000]
+    return "challenge-platform" in head or "<title>Just a moment" in head
+
+
+class SessionStore:
+    """Per-domain browser sessions shared by every worker on the host."""
+
+    def __init__(self, db_path, default_ttl=DEFAULT_TTL, refresh_margin=REFRESH_MARGIN):
+        """
+        Args:
+            db_path: SQLite file shared by all workers
+            default_ttl: Session lifetime when no clearance cookie has an expiry
+            refresh_margin: expiring() reports sessions this close to expiry
+        """
+        self.db_path = db_path
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self._local = threading.local()
+        self._refresher = None
+
+        os.makedirs(os.path.dirname(os.fspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                try:
+                    conn.execute(statement)
+                except sqlite3.OperationalError:
+                    pass                # another worker added it first
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def get(self, domain):
+        """Return the domain's session dict, or None if missing/expired."""
+        row = self._conn().execute(
+            "SELECT cookies, storage_state, fingerprint, expires_at FROM sessions "
+            "WHERE domain = ? AND expires_at > ?",
+            (domain, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        # A fetch is about to use it: keep it refreshed (one write a minute at most)
+        now = time.time()
+        self._conn().execute(
+            "UPDATE sessions SET used_at = ? WHERE domain = ? AND used_at < ?",
+            (now, domain, now - REFRESH_INTERVAL),
+        )
+        return {
+            "domain": domain,
+            "cookies": json.loads(row[0]),
+            "storage_state": json.loads(row[1]),
+            "fingerprint": json.loads(row[2]),
+            "expires_at": row[3],
+        }
+
+    def _expiry(self, cookies):
+        now = time.time()
+        expiries = [
+            c["expires"] for c in cookies
+            if c.get("name") in CLEARANCE_COOKIES and c.get("expires", -1) > now
+        ]
+        return min(expiries) if expiries else now + self.default_ttl
+
+    def put(self, domain, cookies, storage_state, fingerprint):
+        """Save a freshly solved session; returns its expiry time.
+
+        A refresh keeps the domain's last use; a new session counts as used.
+        """
+        expires_at = self._expiry(cookies)
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO sessions "
+            "(domain, cookies, storage_state, fingerprint, created_at, expires_at, refreshing_until, used_at, failures) "
+            "VALUES (?, ?, ?, ?, ?, ?, 0, ?, 0) "
+            "ON CONFLICT (domain) DO UPDATE SET cookies = excluded.cookies, "
+            "storage_state = excluded.storage_state, fingerprint = excluded.fingerprint, "
+            "created_at = excluded.created_at, expires_at = excluded.expires_at, "
+            "refreshing_until = 0, failures = 0",
+            (domain, json.dumps(cookies), json.dumps(storage_state),
+             json.dumps(fingerprint), now, expires_at, now),
+        )
+        return expires_at
+
+    def invalidate(self, domain):
+        """Drop a session the site no longer accepts."""
+        self._conn().execute("DELETE FROM sessions WHERE domain = ?", (domain,))
+
+    def expiring(self):
+        """Domains used within REFRESH_ACTIVE whose still-valid session expires within refresh_margin."""
+        now = time.time()
+        rows = self._conn().execute(
+            "SELECT domain FROM sessions WHERE expires_at > ? AND expires_at <= ? "
+            "AND used_at >= ? AND refreshing_until < ?",
+            (now, now + self.refresh_margin, now - REFRESH_ACTIVE, now),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def prune(self):
+        """Delete sessions that have expired; returns how many."""
+        cur = self._conn().execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+        return cur.rowcount
+
+    def refresh_failed(self, domain):
+        """Hold off refreshing domain, twice as long after each failure in a row."""
+        self._conn().execute(
+            "UPDATE sessions SET failures = failures + 1, "
+            "refreshing_until = ? + MIN(?, ? * (1 << MIN(failures, 20))) WHERE domain = ?",
+            (time.time(), REFRESH_BACKOFF_MAX, REFRESH_LEASE, domain),
+        )
+
+    def _renewed_since(self, domain, since):
+        row = self._conn().execute(
+            "SELECT 1 FROM sessions WHERE domain = ? AND created_at >= ?", (domain, since),
+        ).fetchone()
+        return row is not None
+
+    def claim_refresh(self, domain, lease=REFRESH_LEASE):
+        """Mark domain as being refreshed by us. False if another worker is."""
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE sessions SET refreshing_until = ? WHERE domain = ? AND refreshing_until < ?",
+            (now + lease, domain, now),
+        )
+        return cur.rowcount == 1
+
+    @staticmethod
+    def fetch_kwargs(session):
+        """StealthyFetcher arguments that resume session instead of solving.
+
+        localStorage goes back through page_setup (see restore_steps()),
+        which the browser pool adds.
+        """
+        kwargs = {"cookies": session["cookies"], "solve_cloudflare": False}
+        fingerprint = session["fingerprint"]
+        if fingerprint.get("user_agent"):
+            kwargs["useragent"] = fingerprint["user_agent"]
+            kwargs["extra_headers"] = {"User-Agent": fingerprint["user_agent"]}
+        if fingerprint.get("language"):
+            kwargs["locale"] = fingerprint["language"]
+        if fingerprint.get("timezone"):
+            kwargs["timezone_id"] = fingerprint["timezone"]
+        return kwargs
+
+    # ----- background refresh -----
+
+    def start_refresher(self, refresh, interval=REFRESH_INTERVAL):
+        """Re-solve expiring sessions of recently used domains in a daemon thread.
+
+        Expired sessions are deleted on each check; a refresh that raises or
+        doesn't save a new session backs the domain off (refresh_failed).
+
+        Args:
+            refresh: fn(domain) that fetches the domain with a fresh solve
+                (BrowserPool.refresh_session)
+            interval: Seconds between checks
+        """
+        if self._refresher is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.prune()
+                    domains = self.expiring()
+                except Exception as e:
+                    print(f"Session refresh check failed: {e}")
+                    continue
+                for domain in domains:
+                    if not self.claim_refresh(domain):
+                        continue
+                    started = time.time()
+                    try:
+                        refresh(domain)
+                        renewed = self._renewed_since(domain, started)
+                    except Exception as e:
+                        # Keep the old session; searches solve on their own if it lapses
+                        print(f"Session refresh for {domain} failed: {e}")
+                        renewed = False
+                    if not renewed:
+                        self.refresh_failed(domain)
+
+        self._refresher = threading.Thread(target=loop, daemon=True)
+        self._refresher.start()
+
+
+def default_store():
+    """Return the process-wide session store, creating it on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SessionStore(DEFAULT_DB)
+        return _default_store
@@ -0,0 +1,255 @@
+"""
+TripVibe Shared State - Search cache and single-flight registry
+
+When the apps run as several worker processes (see serve.py), anything kept
+in a module-level dict is private to one worker and lost on restart. This
+module keeps the search cache and the in-flight search registry in a SQLite
+database in WAL mode, so every worker on the host sees the same entries and
+readers never block the writer.
+
+- Cache entries are text (the compact storage format) with an expiry time.
+- A lease marks "someone is already scraping this search". Other workers
+  asking for the same search wait for that result instead of launching a
+  second browser. The holder renews it while the search runs, however long
+  that takes; it only expires when the holder dies.
+- A search that found nothing is cached too, for a minute, so the workers
+  that waited on it don't each scrape it again.
+
+Usage:
+    cache = SharedCache(DATA_DIR / "shared.db", ttl=900)
+    data = cache.get_or_compute(key, lambda: run_search(...))
+
+    # Partial results as they come (only the lease holder sees them)
+    for kind, value in cache.get_or_stream(key, lambda: iter_search(...)):
+        ...
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+import storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Cached in place of a None result (no encoded value is empty)
+NEGATIVE = ""
+
+
+def connect(path):
+    """Open a SQLite connection tuned for many processes on one host."""
+    conn = sqlite3.connect(os.fspath(path), timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    return conn
+
+
+class SharedCache:
+    """TTL cache + single-flight leases backed by a shared SQLite file."""
+
+    def __init__(self, path, ttl=900, lease_ttl=120, poll_interval=0.25, negative_ttl=60):
+        """
+        Args:
+            path: SQLite file shared by all workers
+            ttl: Seconds a cached search stays fresh
+            lease_ttl: Seconds before an abandoned lease (crashed worker) expires;
+                a live holder renews it every lease_ttl / 3
+            poll_interval: Seconds between checks while waiting on another worker
+            negative_ttl: Seconds a None result stays cached
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lease_ttl = lease_ttl
+        self.negative_ttl = negative_ttl
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+
+    def _conn(self):
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _owner():
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    # ----- cache -----
+
+    def get(self, key):
+        """Return the cached text for key, or None if missing/expired/negative."""
+        value, fresh = self._lookup(key)
+        return value if fresh and value != NEGATIVE else None
+
+    def _lookup(self, key):
+        """Return (value, fresh); value is None if there is no entry at all."""
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None, False
+        return row[0], row[1] > time.time()
+
+    def put(self, key, value, ttl=None):
+        """Store text under key for ttl seconds."""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, expires_at),
+        )
+
+    def purge(self):
+        """Delete expired cache entries and leases."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+
+    # ----- single-flight -----
+
+    def acquire(self, key):
+        """Try to become the one worker computing key. Returns True on success."""
+        now = time.time()
+        owner = self._owner()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT owner, expires_at FROM leases WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now and row[0] != owner:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner, now + self.lease_ttl),
+            )
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release(self, key):
+        """Drop our lease on key."""
+        self._conn().execute(
+            "DELETE FROM leases WHERE key = ? AND owner = ?", (key, self._owner())
+        )
+
+    def renew(self, key, owner):
+        """Push back the expiry of owner's lease on key. False if it was lost."""
+        cursor = self._conn().execute(
+            "UPDATE leases SET expires_at = ? WHERE key = ? AND owner = ?",
+            (time.time() + self.lease_ttl, key, owner),
+        )
+        return cursor.rowcount > 0
+
+    def _keep_alive(self, key):
+        """Renew our lease on key from a daemon thread until the returned Event is set."""
+        owner = self._owner()
+        done = threading.Event()
+
+        def loop():
+            while not done.wait(self.lease_ttl / 3):
+                try:
+                    if not self.renew(key, owner):
+                        return
+                except sqlite3.Error as e:
+                    print(f"Lease renewal for {key} failed: {e}")
+
+        threading.Thread(target=loop, name="lease-renewal", daemon=True).start()
+        return done
+
+    def in_flight(self):
+        """Number of searches currently being computed by any worker."""
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM leases WHERE expires_at > ?", (time.time(),)
+        ).fetchone()
+        return row[0]
+
+    def get_or_compute(self, key, compute, encode=storage.dumps_search,
+                       decode=storage.loads_search):
+        """Return the cached value for key, computing it at most once per host.
+
+        If another worker holds the lease, wait for its result. If that
+        worker dies, its lease expires and this call takes over.
+
+        Args:
+            key: Cache key
+            compute: Zero-arg callable; a None result is cached for negative_ttl
+            encode: Value -> text for storage
+            decode: Text -> value
+        """
+        value = None
+        for kind, value in self.get_or_stream(key, lambda: [("result", compute())], encode, decode):
+            pass
+        return value
+
+    def get_or_stream(self, key, produce, encode=storage.dumps_search,
+                      decode=storage.loads_search):
+        """get_or_compute() for a computation that has partial results.
+
+        Yields (kind, value) pairs. The worker holding the lease passes on
+        everything produce() yields; on a cache hit, or after waiting on
+        another worker, only the final ("result", value) is yielded.
+
+        Args:
+            key: Cache key
+            produce: Zero-arg callable returning an iterable of (kind, value),
+                ending with ("result", value); a None result is cached for
+                negative_ttl
+            encode: Value -> text for storage
+            decode: Text -> value
+        """
+        waited = False
+        while True:
+            cached, fresh = self._lookup(key)
+            if fresh:
+                metrics.CACHE_REQUESTS.labels("coalesced" if waited else "hit").inc()
+                yield "result", None if cached == NEGATIVE else decode(cached)
+                return
+
+            if self.acquire(key):
+                keep_alive = self._keep_alive(key)
+                try:
+                    # Someone may have finished between our get() and acquire()
+                    cached, fresh = self._lookup(key)
+                    if fresh:
+                        metrics.CACHE_REQUESTS.labels("coalesced" if waited else "hit").inc()
+                        yield "result", None if cached == NEGATIVE else decode(cached)
+                        return
+                    metrics.CACHE_REQUESTS.labels("stale" if cached is not None else "miss").inc()
+                    for kind, value in produce():
+                        if kind == "result":
+                            if value is None:
+                                self.put(key, NEGATIVE, ttl=self.negative_ttl)
+                            else:
+                                self.put(key, encode(value))
+                        yield kind, value
+                    return
+                finally:
+                    # Also runs if the consumer stops early (client went away)
+                    keep_alive.set()
+                    self.release(key)
+
+            waited = True
+            time.sleep(self.poll_interval)
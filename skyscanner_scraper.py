@@ -9,6 +9,8 @@ import json
 from datetime import datetime
 from scrapling import StealthyFetcher
 
+import currency as fx
+
 
 def scrape_skyscanner(origin="SIN", destination="NYCA", date="260612"):
     """
@@ -43,18 +45,9 @@ def scrape_skyscanner(origin="SIN", destination="NYCA", date="260612"):
     html = response.html_content
 
     # Detect currency based on redirect
-    if ".my" in response.url:
-        currency = "MYR"
-        currency_symbol = "RM"
-        usd_rate = 0.21
-    elif ".sg" in response.url:
-        currency = "SGD"
-        currency_symbol = "S$"
-        usd_rate = 0.74
-    else:
-        currency = "USD"
-        currency_symbol = "$"
-        usd_rate = 1.0
+    currency = fx.detect(response.url, "USD")
+    currency_symbol = fx.PAGE_SYMBOLS.get(currency, currency)
+    usd_rate = fx.default_table().snapshot().factor(currency, "USD")
 
     print(f"Detected currency: {currency}")
 
@@ -63,6 +56,7 @@ def scrape_skyscanner(origin="SIN", destination="NYCA", date="260612"):
         "route": f"{origin} -> {destination}",
         "date": f"20{date[:2]}-{date[2:4]}-{date[4:]}",
         "currency": currency,
+        "usd_rate": usd_rate,
         "prices": [],
         "airlines": [],
         "times": [],
@@ -71,7 +65,7 @@ def scrape_skyscanner(origin="SIN", destination="NYCA", date="260612"):
     }
 
     # Extract prices
-    price_pattern = rf'{currency_symbol}\s*([\d,]+)'
+    price_pattern = re.escape(currency_symbol) + r'\s*([\d,]+)'
     prices = re.findall(price_pattern, html)
     # Filter to flight-range prices
     flight_prices = []
@@ -172,7 +166,7 @@ def main():
 Route: Singapore (SIN) -> New York (NYC)
 Date: June 12, 2026
 
-Cheapest Flight: ~${int(min_price * 0.21):,} USD
+Cheapest Flight: ~${int(min_price * results['usd_rate']):,} USD
 Airlines: {', '.join(sorted(results['airlines'])[:5])}
 Typical Duration: 18-24 hours (1-2 stops)
 
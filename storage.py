@@ -0,0 +1,321 @@
+"""
+TripVibe Storage - Compact codec for saved searches
+
+Saved searches used to be written with json.dump(..., indent=2), and every
+bundle carried a full copy of its flight and hotel, so the same hotel was
+serialised once per bundle it appeared in. This codec:
+
+- stores each distinct flight/hotel once, as a positional row
+- replaces bundle.flight/bundle.hotel with integer references
+- writes minified JSON (no indentation, no ASCII-escaping of emoji)
+
+The decoder rebuilds records with from_row(), so bundles that shared a hotel
+before saving share the same Hotel object after loading. Files written by
+the old pretty-printed format are still readable.
+
+All writes go to a temp file in the same directory and are renamed over the
+target, so a reader sees either the previous complete file or the new one,
+never a truncated one. SnapshotStore adds a revision counter and keeps the
+last complete snapshot in memory so readers don't hit the disk or take a lock.
+
+Usage:
+    dump_search(data, DATA_DIR / "bundles.json")
+    data = load_search(DATA_DIR / "bundles.json")
+
+    store = SnapshotStore(DATA_DIR / "bundles.json")
+    store.put(data)
+    store.get()                 # latest complete snapshot, or None
+
+    # Human-readable copy for debugging
+    python storage.py export tripvibe_data/bundles.json bundles.pretty.json
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import records
+from records import Bundle, Flight, Hotel
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only ordered within a process
+    fcntl = None
+
+FORMAT_NAME = "tripvibe-search"
+FORMAT_VERSION = 1
+
+# Minified output: no spaces after separators, emoji kept as UTF-8
+_COMPACT = {"separators": (",", ":"), "ensure_ascii": False}
+
+_RECORD_TYPES = {
+    "flights": Flight,
+    "hotels": Hotel,
+}
+
+
+class _Interner:
+    """Assigns each distinct record object a stable row index."""
+
+    def __init__(self):
+        self.rows = []
+        self._index = {}
+
+    def ref(self, record):
+        key = id(record)
+        idx = self._index.get(key)
+        if idx is None:
+            idx = len(self.rows)
+            self._index[key] = idx
+            self.rows.append(record.to_row())
+        return idx
+
+
+def encode_search(data):
+    """Encode a search dict into the compact, de-duplicated structure.
+
+    Top-level lists of Bundle, Flight or Hotel records are replaced with
+    references into shared flight/hotel tables. Everything else is kept
+    as-is.
+
+    Args:
+        data: Search dict, e.g. {"bundles": [Bundle, ...], "origin": "SIN"}
+
+    Returns:
+        A JSON-serialisable dict.
+    """
+    flights = _Interner()
+    hotels = _Interner()
+    interners = {Flight: flights, Hotel: hotels}
+    body = {}
+
+    for key, value in data.items():
+        if isinstance(value, list) and value and isinstance(value[0], records.Record):
+            kind = type(value[0])
+            if kind is Bundle:
+                bundle_fields = Bundle.FIELDS[2:]
+                body[key] = {"$bundles": [
+                    [flights.ref(b.flight), hotels.ref(b.hotel)]
+                    + [getattr(b, name) for name in bundle_fields]
+                    for b in value
+                ]}
+            else:
+                interner = interners[kind]
+                body[key] = {"$" + kind.__name__.lower() + "s": [interner.ref(r) for r in value]}
+        else:
+            body[key] = value
+
+    return {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "fields": {
+            "flight": list(Flight.FIELDS),
+            "hotel": list(Hotel.FIELDS),
+            "bundle": list(Bundle.FIELDS),
+        },
+        "flights": flights.rows,
+        "hotels": hotels.rows,
+        "data": body,
+    }
+
+
+def _decode_rows(cls, fields, rows):
+    """Rebuild records, tolerating a field list that differs from FIELDS."""
+    if tuple(fields) == cls.FIELDS:
+        return [cls.from_row(row) for row in rows]
+    return [cls.from_dict(dict(zip(fields, row))) for row in rows]
+
+
+def decode_search(payload):
+    """Inverse of encode_search(). Also accepts the legacy nested format."""
+    if payload.get("format") != FORMAT_NAME:
+        return _decode_legacy(payload)
+
+    fields = payload["fields"]
+    flights = _decode_rows(Flight, fields["flight"], payload["flights"])
+    hotels = _decode_rows(Hotel, fields["hotel"], payload["hotels"])
+    bundle_fields = fields["bundle"]
+
+    data = {}
+    for key, value in payload["data"].items():
+        if isinstance(value, dict) and len(value) == 1:
+            (tag, refs), = value.items()
+            if tag == "$bundles":
+                rows = [[flights[row[0]], hotels[row[1]]] + row[2:] for row in refs]
+                data[key] = _decode_rows(Bundle, bundle_fields, rows)
+                continue
+            if tag == "$flights":
+                data[key] = [flights[i] for i in refs]
+                continue
+            if tag == "$hotels":
+                data[key] = [hotels[i] for i in refs]
+                continue
+        data[key] = value
+    return data
+
+
+def _decode_legacy(payload):
+    """Decode a pretty-printed file written before this codec existed."""
+    data = dict(payload)
+    if isinstance(data.get("bundles"), list):
+        data["bundles"] = [Bundle.from_dict(b) for b in data["bundles"]]
+    for key, cls in _RECORD_TYPES.items():
+        if isinstance(data.get(key), list):
+            data[key] = [cls.from_dict(r) for r in data[key]]
+    return data
+
+
+def dumps_search(data):
+    """Serialise a search dict to a compact string."""
+    return json.dumps(encode_search(data), **_COMPACT)
+
+
+def loads_search(text):
+    """Deserialise a string produced by dumps_search()."""
+    return decode_search(json.loads(text))
+
+
+def atomic_write(path, text):
+    """Write text to path via temp file + rename.
+
+    The temp file lives in the target directory so os.replace() is a
+    same-filesystem rename, which is atomic on POSIX and Windows.
+    """
+    path = os.fspath(path)
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def dump_search(data, path):
+    """Write a search dict to path in the compact format."""
+    atomic_write(path, dumps_search(data))
+
+
+def load_search(path):
+    """Read a search written by dump_search() (or the legacy format)."""
+    with open(path, encoding="utf-8") as f:
+        return loads_search(f.read())
+
+
+def write_json(obj, path):
+    """Write plain JSON minified (for data that has no records in it)."""
+    atomic_write(path, records.dumps(obj, **_COMPACT))
+
+
+Snapshot = namedtuple("Snapshot", ["revision", "data", "stat_key"])
+
+
+def _stat_key(path):
+    """Identity of the file currently at path; changes on every replace."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class SnapshotStore:
+    """Versioned search store with lock-free reads.
+
+    Writers serialise the search, stamp it with the next revision number and
+    atomically replace the file. Readers call get(), which returns the
+    in-memory snapshot and only re-reads the file when another process has
+    replaced it (detected with one stat() call). Snapshots are shared
+    between callers and must be treated as read-only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._snapshot = None
+        self._write_lock = threading.Lock()
+
+    def current(self):
+        """Return the latest Snapshot, reloading if the file changed."""
+        snapshot = self._snapshot
+        key = _stat_key(self.path)
+        if key is None:
+            return snapshot
+        if snapshot is not None and snapshot.stat_key == key:
+            return snapshot
+
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except (FileNotFoundError, ValueError):
+            # Replaced or removed between stat() and open(); keep what we have
+            return snapshot
+
+        snapshot = Snapshot(payload.get("revision", 0), decode_search(payload), key)
+        self._snapshot = snapshot
+        return snapshot
+
+    def get(self):
+        """Return the latest search dict, or None if nothing is stored."""
+        snapshot = self.current()
+        return snapshot.data if snapshot else None
+
+    @property
+    def revision(self):
+        snapshot = self.current()
+        return snapshot.revision if snapshot else 0
+
+    @contextmanager
+    def _locked(self):
+        # The thread lock orders this process's writers; the flock() on a
+        # sidecar file orders them against other workers' writers
+        with self._write_lock:
+            if fcntl is None:
+                yield
+                return
+            fd = os.open(f"{os.fspath(self.path)}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def put(self, data):
+        """Atomically store a new search and return its revision.
+
+        Revisions increase across every process writing the same file: the
+        latest revision is read and the next one written under a file lock.
+        """
+        payload = encode_search(data)
+        with self._locked():
+            revision = self.revision + 1
+            payload["revision"] = revision
+            atomic_write(self.path, json.dumps(payload, **_COMPACT))
+            self._snapshot = Snapshot(revision, data, _stat_key(self.path))
+        return revision
+
+
+def export_json(data, path):
+    """Write a search as expanded, pretty-printed JSON for debugging."""
+    with open(path, "w", encoding="utf-8") as f:
+        records.dump(data, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "export":
+        print("Usage: python storage.py export <stored-search> <output.json>")
+        sys.exit(1)
+
+    export_json(load_search(sys.argv[2]), sys.argv[3])
+    print(f"Exported {sys.argv[2]} -> {sys.argv[3]}")
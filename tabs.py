@@ -0,0 +1,308 @@
+"""
+TripVibe Tabs - Many concurrent scrapes in a few browser processes
+
+By default every fetch launches its own Chromium (StealthyFetcher), a few
+hundred MB each, so the browser slot cap is also the cap on concurrent
+searches. In tab mode each worker keeps a small number of browsers open and
+runs every fetch as a separate tab (page) of one of them:
+
+- Tabs of one browser share its process and context, so a tab costs tens of
+  MB instead of a whole browser.
+- Each fetch gets its own tab, closed when the fetch ends. A tab that
+  crashes, hangs past fetch_timeout or raises only fails its own fetch.
+- After a failed fetch the browser is probed by opening a blank tab. If the
+  probe fails the browser is gone: it is discarded and the next fetch
+  launches a new one, so the other tabs' fetches are the only other losses.
+- Browsers idle for idle_close seconds are closed to give the memory back.
+- Each browser holds a host-wide browser slot (browser_pool.SlotFiles) for
+  as long as it runs, so all workers together open at most TRIPVIBE_BROWSERS
+  browsers. A worker waiting for one asks the others to close their idle
+  browsers early.
+
+The browsers run on an asyncio loop in a background thread (Scrapling's
+AsyncStealthySession); fetch() blocks the calling request thread like
+StealthyFetcher.fetch() does, so the scrapers don't change. Page actions
+written as browser_pool.PageAction work on both kinds of page.
+
+Configuration (read by browser_pool.default_pool()):
+    TRIPVIBE_TABS           tabs per browser; 1 (default) keeps one browser
+                            per fetch
+    TRIPVIBE_TAB_BROWSERS   most browsers per worker in tab mode (default 1)
+
+With tab mode on, TRIPVIBE_BROWSERS still caps the browsers on the host, and
+the fetch slots count tabs: the host-wide cap on concurrent fetches becomes
+TRIPVIBE_BROWSERS * TRIPVIBE_TABS.
+
+Usage:
+    host = TabHost(browsers=1, tabs=8)
+    response = host.fetch(url, page_action=wait_for_results("booking", 8))
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+
+try:
+    from scrapling.fetchers import AsyncStealthySession
+except ImportError:  # older Scrapling without async sessions
+    AsyncStealthySession = None
+
+DEFAULT_TABS = int(os.environ.get("TRIPVIBE_TABS", "1"))
+DEFAULT_BROWSERS = int(os.environ.get("TRIPVIBE_TAB_BROWSERS", "1"))
+FETCH_TIMEOUT = 120             # seconds before a tab's fetch is abandoned
+IDLE_CLOSE = 120                # close a browser unused this long
+PROBE_TIMEOUT = 10              # seconds for the health probe after a failure
+SLOT_POLL = 0.1                 # seconds between tries for a browser slot
+IDLE_CHECK = 2                  # seconds between idle-browser checks
+ASKED_GRACE = 1                 # idle seconds before a browser another worker
+                                # is waiting for is closed
+
+
+def available():
+    """True if this Scrapling has async sessions (needed for tab mode)."""
+    return AsyncStealthySession is not None
+
+
+def _async_action(page_action):
+    # The async session awaits page_action(page) with an async page
+    if page_action is None:
+        return None
+    if hasattr(page_action, "async_call"):
+        return page_action.async_call
+
+    async def call(page):
+        # Plain functions get the async page; they must await its methods
+        result = page_action(page)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+    return call
+
+
+class _Browser:
+    """One browser process and the number of tabs currently open in it."""
+
+    def __init__(self, session, slot=None):
+        self.session = session
+        self.slot = slot                # host-wide browser slot token
+        self.open_tabs = 0
+        self.last_used = time.monotonic()
+
+
+class TabHost:
+    """Fetcher with the StealthyFetcher.fetch() signature that runs fetches as tabs.
+
+    One instance serves every fetch of a process: the pool's
+    fetcher_factory returns it each time.
+    """
+
+    def __init__(self, browsers=DEFAULT_BROWSERS, tabs=DEFAULT_TABS, session_factory=None,
+                 fetch_timeout=FETCH_TIMEOUT, idle_close=IDLE_CLOSE, browser_slots=None):
+        """
+        Args:
+            browsers: Most browser processes this worker opens
+            tabs: Most concurrent tabs per browser
+            session_factory: Zero-arg callable returning an unstarted async
+                session (default: headless AsyncStealthySession with tabs pages)
+            fetch_timeout: Seconds before a fetch fails and its tab is closed
+            idle_close: Close browsers unused for this many seconds
+            browser_slots: browser_pool.SlotFiles shared by every worker;
+                each open browser holds one (default: no host-wide cap)
+        """
+        if session_factory is None:
+            if AsyncStealthySession is None:
+                raise RuntimeError("Tab mode needs a Scrapling version with AsyncStealthySession")
+            session_factory = lambda: AsyncStealthySession(headless=True, max_pages=tabs)
+        self.max_browsers = max(1, browsers)
+        self.tabs = max(1, tabs)
+        self.session_factory = session_factory
+        self.fetch_timeout = fetch_timeout
+        self.idle_close = idle_close
+        self.browser_slots = browser_slots
+
+        self._browsers = []
+        self._launching = 0             # browsers being started, not yet in _browsers
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        # Created on the loop: asyncio primitives belong to the loop they wait on
+        self._changed = asyncio.run_coroutine_threadsafe(self._make_condition(), self._loop).result()
+        asyncio.run_coroutine_threadsafe(self._close_idle(), self._loop)
+
+    @property
+    def live(self):
+        return True
+
+    @property
+    def open_browsers(self):
+        return len(self._browsers)
+
+    async def _make_condition(self):
+        return asyncio.Condition()
+
+    def fetch(self, url, page_action=None, **kwargs):
+        """Fetch url in a tab; blocks until done like StealthyFetcher.fetch()."""
+        future = asyncio.run_coroutine_threadsafe(
+            self._fetch(url, page_action, kwargs), self._loop,
+        )
+        return future.result()
+
+    # ----- on the loop thread -----
+
+    async def _acquire(self):
+        """Pick the least busy browser with a free tab, launching one if allowed."""
+        while True:
+            async with self._changed:
+                while True:
+                    free = [b for b in self._browsers if b.open_tabs < self.tabs]
+                    if free:
+                        browser = min(free, key=lambda b: b.open_tabs)
+                        browser.open_tabs += 1
+                        browser.last_used = time.monotonic()
+                        return browser
+                    if len(self._browsers) + self._launching < self.max_browsers:
+                        self._launching += 1
+                        break
+                    # Only reached if more fetches arrive than the slots allow
+                    await self._changed.wait()
+
+            # Launched outside the condition: other fetches keep using (and
+            # releasing) the open browsers meanwhile
+            try:
+                browser = await self._launch()
+            finally:
+                async with self._changed:
+                    self._launching -= 1
+                    self._changed.notify_all()
+            if browser is None:
+                continue                # a tab freed up while waiting for a slot
+            async with self._changed:
+                self._browsers.append(browser)
+                browser.open_tabs += 1
+                browser.last_used = time.monotonic()
+                # Its other tabs are free for the fetches waiting above
+                self._changed.notify_all()
+                return browser
+
+    async def _launch(self):
+        """Start a browser in a host-wide browser slot.
+
+        Returns None instead if one of this worker's browsers got a free tab
+        while the slots were all taken.
+        """
+        slot = None
+        if self.browser_slots is not None:
+            deadline = time.monotonic() + self.fetch_timeout
+            while True:
+                slot = self.browser_slots.try_acquire()
+                if slot is not None:
+                    break
+                if any(b.open_tabs < self.tabs for b in self._browsers):
+                    return None
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"No browser slot free on this host after {self.fetch_timeout}s")
+                # Other workers close their idle browsers when asked
+                self.browser_slots.ask()
+                await asyncio.sleep(SLOT_POLL)
+        try:
+            session = self.session_factory()
+            await session.start()
+        except BaseException:
+            if slot is not None:
+                self.browser_slots.release(slot)
+            raise
+        return _Browser(session, slot)
+
+    async def _close(self, browser):
+        """Close a browser already removed from _browsers and free its slot."""
+        try:
+            await browser.session.close()
+        except Exception:
+            pass
+        finally:
+            if browser.slot is not None:
+                self.browser_slots.release(browser.slot)
+                browser.slot = None
+
+    async def _release(self, browser):
+        async with self._changed:
+            browser.open_tabs -= 1
+            browser.last_used = time.monotonic()
+            self._changed.notify()
+
+    async def _fetch(self, url, page_action, kwargs):
+        kwargs = dict(kwargs)
+        # Sessions set cookies on the shared context, not per fetch; they
+        # are per-domain, so the other tabs of this browser can share them
+        cookies = kwargs.pop("cookies", None)
+        # Browser-wide options can't change per tab; the session's
+        # User-Agent still goes out as a header (extra_headers)
+        for option in ("useragent", "locale", "timezone_id"):
+            kwargs.pop(option, None)
+        if kwargs.get("page_setup") is not None:
+            kwargs["page_setup"] = _async_action(kwargs["page_setup"])
+
+        browser = await self._acquire()
+        try:
+            if cookies:
+                await browser.session.context.add_cookies(cookies)
+            return await asyncio.wait_for(
+                browser.session.fetch(url, page_action=_async_action(page_action), **kwargs),
+                self.fetch_timeout,
+            )
+        except Exception:
+            # A tab failed; only drop the browser if the browser itself is gone
+            if not await self._healthy(browser):
+                await self._discard(browser)
+            raise
+        finally:
+            await self._release(browser)
+
+    async def _healthy(self, browser):
+        try:
+            page = await asyncio.wait_for(browser.session.context.new_page(), PROBE_TIMEOUT)
+            await page.close()
+            return True
+        except Exception:
+            return False
+
+    async def _discard(self, browser):
+        async with self._changed:
+            if browser in self._browsers:
+                self._browsers.remove(browser)
+            self._changed.notify_all()
+        # Tabs still open in it fail with it; the next fetch launches a new one
+        print("Tab browser died; discarding it")
+        await self._close(browser)
+
+    async def _close_idle(self):
+        while True:
+            await asyncio.sleep(min(IDLE_CHECK, self.idle_close))
+            now = time.monotonic()
+            # Another worker waiting for a browser slot gets ours sooner
+            asked = self.browser_slots is not None and self.browser_slots.asked(IDLE_CHECK * 2)
+            limit = ASKED_GRACE if asked else self.idle_close
+            async with self._changed:
+                idle = [b for b in self._browsers
+                        if b.open_tabs == 0 and now - b.last_used > limit]
+                for browser in idle:
+                    self._browsers.remove(browser)
+            for browser in idle:
+                await self._close(browser)
+
+
+def host_from_env(browser_slots=None):
+    """TabHost configured from the environment, or None for one browser per fetch.
+
+    Args:
+        browser_slots: Host-wide browser slots (browser_pool.SlotFiles)
+    """
+    if DEFAULT_TABS <= 1:
+        return None
+    if not available():
+        print("TRIPVIBE_TABS is set but this Scrapling has no AsyncStealthySession; "
+              "using one browser per fetch")
+        return None
+    return TabHost(browser_slots=browser_slots)
@@ -0,0 +1,277 @@
+"""
+TripVibe Tracing - Lightweight nested timing spans
+
+Answers "where did this slow search spend its time?" without a profiler.
+Wrap each phase in a span; spans nest, so a request produces a small tree:
+
+    GET /api/bundle                         21840.1 ms
+      build_search                          21810.7 ms
+        scrape_flights                      12403.2 ms
+          browser.slot_wait                     0.1 ms
+          browser.load                      11893.4 ms
+          browser.teardown                    402.9 ms
+          parse                                98.5 ms
+        ...
+
+Every finished span also feeds a per-phase histogram (fixed log-scale
+buckets, so recording is a bisect and two additions under a lock). The last
+few hundred request trees are kept in a ring buffer. init_app() exposes both
+at /debug/timings and can add a Server-Timing header to responses.
+
+Usage:
+    with tracing.span("parse"):
+        ...
+
+    @tracing.traced("create_bundles")
+    def create_bundles(...): ...
+
+    tracing.init_app(app)     # Flask: root span per request + /debug/timings
+"""
+
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+
+# Histogram bucket upper bounds in milliseconds
+BUCKETS_MS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+    1000, 2500, 5000, 10000, 30000, 60000, float("inf"),
+)
+
+TRACE_BUFFER_SIZE = int(os.environ.get("TRIPVIBE_TRACE_BUFFER", "200"))
+ENABLED = os.environ.get("TRIPVIBE_TRACING", "1") != "0"
+
+_current = ContextVar("tripvibe_span", default=None)
+
+
+class Span:
+    """One timed phase. Children are the spans opened inside it."""
+
+    __slots__ = ("name", "start", "duration_ms", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.children = []
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "children": [c.to_dict() for c in self.children],
+        }
+
+
+class Histogram:
+    """Fixed-bucket latency histogram for one phase."""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.50), 3),
+            "p95_ms": round(self.quantile(0.95), 3),
+            "p99_ms": round(self.quantile(0.99), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+class Recorder:
+    """Process-wide store of phase histograms and recent request traces."""
+
+    def __init__(self, buffer_size=TRACE_BUFFER_SIZE):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.traces = deque(maxlen=buffer_size)
+
+    def observe(self, name, ms):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(ms)
+
+    def add_trace(self, span):
+        # deque.append with maxlen is atomic; no lock needed
+        self.traces.append(span)
+
+    def snapshot(self, traces=20):
+        with self._lock:
+            phases = {name: h.summary() for name, h in sorted(self.histograms.items())}
+        recent = list(self.traces)[-traces:] if traces else []
+        return {
+            "phases": phases,
+            "recent": [s.to_dict() for s in reversed(recent)],
+        }
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.traces.clear()
+
+
+RECORDER = Recorder()
+
+
+class span:
+    """Context manager timing one phase, nested under the current span."""
+
+    __slots__ = ("name", "_span", "_token")
+
+    def __init__(self, name):
+        self.name = name
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        if not ENABLED:
+            return None
+        self._span = Span(self.name)
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        s = self._span
+        if s is None:
+            return False
+        s.duration_ms = (time.perf_counter() - s.start) * 1000
+        _current.reset(self._token)
+
+        parent = _current.get()
+        if parent is not None:
+            parent.children.append(s)
+        RECORDER.observe(s.name, s.duration_ms)
+        return False
+
+
+def record(name, duration_ms):
+    """Record a phase measured by hand (e.g. from a callback)."""
+    if not ENABLED:
+        return
+    s = Span(name)
+    s.duration_ms = duration_ms
+    parent = _current.get()
+    if parent is not None:
+        parent.children.append(s)
+    RECORDER.observe(name, duration_ms)
+
+
+def traced(name=None):
+    """Decorator: run the function inside a span (default: function name)."""
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    return _current.get()
+
+
+def _walk(root):
+    """Yield every descendant of root, depth-first."""
+    for child in root.children:
+        yield child
+        yield from _walk(child)
+
+
+def server_timing(root, limit=20):
+    """Format a span tree as a Server-Timing header value."""
+    parts = []
+    for child in _walk(root):
+        if len(parts) >= limit:
+            break
+        # Metric names must be HTTP tokens; the readable name goes in desc
+        token = child.name.replace(" ", "_").replace("/", "_").replace(".", "_")
+        parts.append(f"{token};desc=\"{child.name}\";dur={child.duration_ms:.1f}")
+    parts.append(f"total;dur={root.duration_ms:.1f}")
+    return ", ".join(parts)
+
+
+def init_app(app, server_timing_header=None):
+    """Trace every request of a Flask app and expose /debug/timings.
+
+    Args:
+        app: Flask app
+        server_timing_header: Add a Server-Timing header to responses.
+            Defaults to the TRIPVIBE_SERVER_TIMING environment variable.
+    """
+    from flask import g, jsonify, request
+
+    if server_timing_header is None:
+        server_timing_header = os.environ.get("TRIPVIBE_SERVER_TIMING") == "1"
+
+    @app.before_request
+    def _start_request_span():
+        root = span(f"{request.method} {request.url_rule.rule if request.url_rule else request.path}")
+        root.__enter__()
+        g._tripvibe_span = root
+
+    def _finish(root):
+        root.__exit__(None, None, None)
+        RECORDER.add_trace(root._span)
+
+    @app.after_request
+    def _finish_request_span(response):
+        root = g.pop("_tripvibe_span", None)
+        if root is None or root._span is None:
+            return response
+        if response.is_streamed:
+            # The body is generated after this returns; keep the root span
+            # current until the server has sent it all. (No Server-Timing:
+            # the headers are gone before the total is known.)
+            response.call_on_close(lambda: _finish(root))
+            return response
+        _finish(root)
+        if server_timing_header:
+            response.headers["Server-Timing"] = server_timing(root._span)
+        return response
+
+    @app.teardown_request
+    def _drop_request_span(exc):
+        # after_request is skipped on unhandled errors; close the span anyway
+        root = g.pop("_tripvibe_span", None)
+        if root is not None and root._span is not None:
+            _finish(root)
+
+    @app.route("/debug/timings")
+    def debug_timings():
+        limit = request.args.get("traces", 20, type=int)
+        return jsonify(RECORDER.snapshot(traces=limit))
@@ -3,18 +3,34 @@ TripVibe - Next-Gen Travel Advisor
 A personalized, vibe-based flight & hotel search for modern travelers.
 """
 
-import json
 import re
 import random
 from datetime import datetime, timedelta
 from pathlib import Path
 from flask import Flask, render_template_string, request, jsonify
-from scrapling import StealthyFetcher
+
+import browser_pool
+import metrics
+import places
+import price_windows
+import records
+import storage
+import tracing
+from shared_state import SharedCache
+from records import Flight
+
 
 app = Flask(__name__)
+app.json = records.RecordJSONProvider(app)
+tracing.init_app(app)
+metrics.init_app(app)
+places.init_app(app)
 
 DATA_DIR = Path(__file__).parent / "tripvibe_data"
 DATA_DIR.mkdir(exist_ok=True)
+SEARCH_STORE = storage.SnapshotStore(DATA_DIR / "latest_search.json")
+# Shared by every worker process on the host (see serve.py)
+SEARCH_CACHE = SharedCache(DATA_DIR / "shared.db", ttl=900)
 
 # Traveler Personas
 PERSONAS = {
@@ -530,33 +546,11 @@ HTML_TEMPLATE = """
             <form id="searchForm" class="search-grid">
                 <div class="input-group">
                     <label>From</label>
-                    <select name="origin" id="origin">
-                        <option value="SIN">🇸🇬 Singapore (SIN)</option>
-                        <option value="NYCA">🇺🇸 New York (NYC)</option>
-                        <option value="LHR">🇬🇧 London (LHR)</option>
-                        <option value="NRT">🇯🇵 Tokyo (NRT)</option>
-                        <option value="LAX">🇺🇸 Los Angeles (LAX)</option>
-                        <option value="CDG">🇫🇷 Paris (CDG)</option>
-                        <option value="DXB">🇦🇪 Dubai (DXB)</option>
-                        <option value="BKK">🇹🇭 Bangkok (BKK)</option>
-                        <option value="HKG">🇭🇰 Hong Kong (HKG)</option>
-                        <option value="SYD">🇦🇺 Sydney (SYD)</option>
-                    </select>
+                    {{ place_picker('origin', 'SIN') }}
                 </div>
                 <div class="input-group">
                     <label>To</label>
-                    <select name="destination" id="destination">
-                        <option value="NYCA">🇺🇸 New York (NYC)</option>
-                        <option value="SIN">🇸🇬 Singapore (SIN)</option>
-                        <option value="LHR">🇬🇧 London (LHR)</option>
-                        <option value="NRT">🇯🇵 Tokyo (NRT)</option>
-                        <option value="LAX">🇺🇸 Los Angeles (LAX)</option>
-                        <option value="CDG">🇫🇷 Paris (CDG)</option>
-                        <option value="DXB">🇦🇪 Dubai (DXB)</option>
-                        <option value="BKK">🇹🇭 Bangkok (BKK)</option>
-                        <option value="HKG">🇭🇰 Hong Kong (HKG)</option>
-                        <option value="SYD">🇦🇺 Sydney (SYD)</option>
-                    </select>
+                    {{ place_picker('destination', 'NYCA') }}
                 </div>
                 <div class="input-group">
                     <label>When</label>
@@ -684,6 +678,7 @@ HTML_TEMPLATE = """
         </div>
     </div>
 
+    {{ places_script() }}
     <script>
         // Flight data from server
         const allFlights = {{ results.flights | tojson if results else '[]' }};
@@ -933,6 +928,11 @@ AIRLINE_EMOJIS = {
 }
 
 
+# SGD fare window for routes without enough price history (see price_windows.py)
+FLIGHT_WINDOW = (400, 20000)
+
+
+@tracing.traced()
 def scrape_flights(origin, destination, date_str):
     """Scrape flights and return structured data."""
     date_obj = datetime.strptime(date_str, "%Y-%m-%d")
@@ -940,31 +940,57 @@ def scrape_flights(origin, destination, date_str):
 
     url = f"https://www.skyscanner.com.sg/transport/flights/{origin.lower()}/{destination.lower()}/{sky_date}/?currency=SGD&locale=en-GB&market=SG"
 
-    fetcher = StealthyFetcher(headless=True)
-    response = fetcher.fetch(url, solve_cloudflare=True)
+    response = browser_pool.default_pool().fetch(
+        url,
+        source="skyscanner",
+        solve_cloudflare=True,
+        page_action=browser_pool.wait_for_results("skyscanner", 20),
+    )
 
-    if response.status != 200:
+    # Keep only the HTML; the response's DOM is freed before parsing
+    status, _, html = browser_pool.page_html(response)
+    del response
+    if status != 200:
         return None
 
-    html = response.html_content
+    # The route's learned fare window, once it has enough history
+    window = price_windows.default_windows().window(
+        price_windows.flight_key(origin, destination, False), FLIGHT_WINDOW,
+    )
+    results = parse_flights(html, origin, destination, date_str, window)
+    metrics.ITEMS_EXTRACTED.labels("skyscanner").observe(len(results["flights"]))
+    return results
+
 
+@tracing.traced()
+def parse_flights(html, origin, destination, date_str, window=None):
+    """Build the search result dict from a Skyscanner results page.
+
+    Args:
+        html: Page HTML
+        window: (low, high) SGD fare window (default FLIGHT_WINDOW). Prices
+            from this page aren't fed back into the route's sketch: the
+            whole page is scanned, scripts included, so they're noisier
+            than tripvibe_v2's.
+    """
+    low, high = window or FLIGHT_WINDOW
     # Extract prices
     prices = re.findall(r'\$\s*([\d,]+)', html)
     flight_prices = []
     for p in prices:
         try:
             val = int(p.replace(',', ''))
-            if 400 <= val <= 20000:
+            if low <= val <= high:
                 flight_prices.append(val)
         except:
             pass
 
     # Extract airlines
     airline_names = list(AIRLINE_EMOJIS.keys())
-    found_airlines = set()
-    for airline in airline_names:
-        if airline.lower() in html.lower():
-            found_airlines.add(airline)
+    # One lower-cased copy of the page, not one per airline
+    lowered = html.lower()
+    found_airlines = {airline for airline in airline_names if airline.lower() in lowered}
+    del lowered
 
     # Extract times
     times = list(set(re.findall(r'\b(\d{1,2}:\d{2})\b', html)))[:20]
@@ -990,17 +1016,17 @@ def scrape_flights(origin, destination, date_str):
         dur_match = re.match(r'(\d+)h', duration)
         dur_hours = int(dur_match.group(1)) if dur_match else 20
 
-        flights.append({
-            "airline": airline,
-            "emoji": AIRLINE_EMOJIS.get(airline, "✈️"),
-            "price": price,
-            "duration": duration,
-            "duration_hours": dur_hours,
-            "depart": times[i % len(times)] if times else "08:00",
-            "arrive": times[(i + 5) % len(times)] if times else "18:00",
-            "stops": 1 if dur_hours < 22 else (0 if dur_hours < 20 else 2),
-            "carbon": int(dur_hours * 45),  # Rough estimate
-        })
+        flights.append(Flight(
+            airline=airline,
+            emoji=AIRLINE_EMOJIS.get(airline, "✈️"),
+            price=price,
+            duration=duration,
+            duration_hours=dur_hours,
+            depart=times[i % len(times)] if times else "08:00",
+            arrive=times[(i + 5) % len(times)] if times else "18:00",
+            stops=1 if dur_hours < 22 else (0 if dur_hours < 20 else 2),
+            carbon=int(dur_hours * 45),  # Rough estimate
+        ))
 
     results = {
         "route": f"{origin} → {destination}",
@@ -1013,33 +1039,27 @@ def scrape_flights(origin, destination, date_str):
         "scraped_at": datetime.now().isoformat()
     }
 
-    # Save
-    with open(DATA_DIR / "latest_search.json", "w") as f:
-        json.dump(results, f, indent=2)
-
     return results
 
 
+@tracing.traced("store.get")
 def load_results():
     """Load cached results."""
-    path = DATA_DIR / "latest_search.json"
-    if path.exists():
-        with open(path) as f:
-            return json.load(f)
-    return None
+    return SEARCH_STORE.get()
 
 
 @app.route("/")
 def index():
     results = load_results()
     default_date = (datetime.now() + timedelta(days=90)).strftime("%Y-%m-%d")
-    return render_template_string(
-        HTML_TEMPLATE,
-        results=results,
-        personas=PERSONAS,
-        vibes=VIBE_FILTERS,
-        default_date=default_date
-    )
+    with tracing.span("render"):
+        return render_template_string(
+            HTML_TEMPLATE,
+            results=results,
+            personas=PERSONAS,
+            vibes=VIBE_FILTERS,
+            default_date=default_date
+        )
 
 
 @app.route("/api/search")
@@ -1052,8 +1072,14 @@ def api_search():
         return jsonify({"success": False, "error": "Date is required"})
 
     try:
-        results = scrape_flights(origin, destination, date)
+        # Identical searches from any worker share one scrape
+        results = SEARCH_CACHE.get_or_compute(
+            f"flights:{origin}:{destination}:{date}",
+            lambda: scrape_flights(origin, destination, date),
+        )
         if results:
+            with tracing.span("store.put"):
+                SEARCH_STORE.put(results)
             return jsonify({"success": True})
         return jsonify({"success": False, "error": "No results found"})
     except Exception as e:
@@ -3,29 +3,49 @@ TripVibe v2 - The McDonald's of Travel
 Bundle flights + hotels like ordering a combo meal.
 """
 
-import json
+import contextvars
+import os
 import re
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from itertools import chain, islice, zip_longest
 from pathlib import Path
-from flask import Flask, render_template_string, request, jsonify
-from scrapling import StealthyFetcher
+from urllib.parse import urlsplit
+from flask import Flask, Response, render_template_string, request, jsonify, stream_with_context
+from scrapling import Fetcher
+
+import alerts
+import browser_pool
+import currency
+import hotel_index
+import metrics
+import places
+import price_windows
+import ratelimit
+import records
+import sessions
+import storage
+import tracing
+from shared_state import SharedCache
+from records import Bundle, Flight, Hotel
+
 
 app = Flask(__name__)
+app.json = records.RecordJSONProvider(app)
+tracing.init_app(app)
+metrics.init_app(app)
+places.init_app(app)
 
 DATA_DIR = Path(__file__).parent / "tripvibe_data"
 DATA_DIR.mkdir(exist_ok=True)
+BUNDLE_STORE = storage.SnapshotStore(DATA_DIR / "bundles.json")
+# Shared by every worker process on the host (see serve.py)
+SEARCH_CACHE = SharedCache(DATA_DIR / "shared.db", ttl=900)
 
-# City mappings
-CITIES = {
-    "SIN": {"name": "Singapore", "booking": "Singapore", "flag": "🇸🇬"},
-    "NYCA": {"name": "New York", "booking": "New+York", "flag": "🇺🇸"},
-    "LHR": {"name": "London", "booking": "London", "flag": "🇬🇧"},
-    "NRT": {"name": "Tokyo", "booking": "Tokyo", "flag": "🇯🇵"},
-    "CDG": {"name": "Paris", "booking": "Paris", "flag": "🇫🇷"},
-    "BKK": {"name": "Bangkok", "booking": "Bangkok", "flag": "🇹🇭"},
-    "DXB": {"name": "Dubai", "booking": "Dubai", "flag": "🇦🇪"},
-    "LAX": {"name": "Los Angeles", "booking": "Los+Angeles", "flag": "🇺🇸"},
-}
+# Booking.com district ids per city code; each adds one filtered hotel results page
+HOTEL_DISTRICTS = {}
 
 AIRLINE_EMOJIS = {
     "Singapore Airlines": "🇸🇬", "Emirates": "🇦🇪", "Qatar Airways": "🇶🇦",
@@ -566,19 +586,11 @@ HTML_TEMPLATE = """
                 <input type="hidden" name="tripType" id="tripType" value="return">
                 <div class="input-group">
                     <label>From</label>
-                    <select name="origin" id="origin">
-                        {% for code, city in cities.items() %}
-                        <option value="{{ code }}" {% if code == 'SIN' %}selected{% endif %}>{{ city.flag }} {{ city.name }}</option>
-                        {% endfor %}
-                    </select>
+                    {{ place_picker('origin', 'SIN') }}
                 </div>
                 <div class="input-group">
                     <label>To</label>
-                    <select name="destination" id="destination">
-                        {% for code, city in cities.items() %}
-                        <option value="{{ code }}" {% if code == 'NYCA' %}selected{% endif %}>{{ city.flag }} {{ city.name }}</option>
-                        {% endfor %}
-                    </select>
+                    {{ place_picker('destination', 'NYCA') }}
                 </div>
                 <div class="input-group">
                     <label>Depart</label>
@@ -622,6 +634,7 @@ HTML_TEMPLATE = """
                     </div>
                 </div>
                 <div class="view-toggle">
+                    <button class="toggle-btn refresh-btn">🔄 Refresh prices</button>
                     <button class="toggle-btn active">Best Value</button>
                     <button class="toggle-btn">Cheapest</button>
                     <button class="toggle-btn">Fastest</button>
@@ -862,9 +875,10 @@ HTML_TEMPLATE = """
     <!-- Toast -->
     <div class="toast" id="toast">✅ Updated!</div>
 
+    {{ places_script() }}
     <script>
         // ========== DATA FROM SERVER ==========
-        const allBundles = {{ bundles | tojson if bundles else '[]' }};
+        let allBundles = {{ bundles | tojson if bundles else '[]' }};
         const allFlights = {{ bundles[0].flight | tojson if bundles else '{}' }};
         const routeInfo = {
             origin: '{{ bundles[0].origin if bundles else "SIN" }}',
@@ -872,19 +886,8 @@ HTML_TEMPLATE = """
             nights: {{ bundles[0].nights if bundles else 3 }},
             checkin: '{{ bundles_data.checkin if bundles_data else "" }}',
             checkout: '{{ bundles_data.checkout if bundles_data else "" }}',
-            tripType: '{{ bundles_data.trip_type if bundles_data else "return" }}'
-        };
-
-        // City mappings for booking URLs
-        const cityMappings = {
-            'SIN': { name: 'Singapore', bookingCity: 'Singapore' },
-            'NYCA': { name: 'New York', bookingCity: 'New+York' },
-            'LHR': { name: 'London', bookingCity: 'London' },
-            'NRT': { name: 'Tokyo', bookingCity: 'Tokyo' },
-            'CDG': { name: 'Paris', bookingCity: 'Paris' },
-            'BKK': { name: 'Bangkok', bookingCity: 'Bangkok' },
-            'DXB': { name: 'Dubai', bookingCity: 'Dubai' },
-            'LAX': { name: 'Los Angeles', bookingCity: 'Los+Angeles' }
+            tripType: '{{ bundles_data.trip_type if bundles_data else "return" }}',
+            bookingCity: {{ booking_city | tojson }}
         };
 
         // Generate Skyscanner flight URL
@@ -902,13 +905,12 @@ HTML_TEMPLATE = """
 
         // Generate Booking.com hotel URL
         function getBookingUrl() {
-            const destCity = cityMappings[routeInfo.destination]?.bookingCity || routeInfo.destination;
-            return `https://www.booking.com/searchresults.html?ss=${destCity}&checkin=${routeInfo.checkin}&checkout=${routeInfo.checkout}&group_adults=2&no_rooms=1&selected_currency=SGD`;
+            return `https://www.booking.com/searchresults.html?ss=${routeInfo.bookingCity}&checkin=${routeInfo.checkin}&checkout=${routeInfo.checkout}&group_adults=2&no_rooms=1&selected_currency=SGD`;
         }
 
         // Alternative options (simulated from same scrape)
-        const altFlights = allBundles.map(b => b.flight);
-        const altHotels = allBundles.map(b => b.hotel);
+        let altFlights = {{ bundles_data.flights | tojson if bundles_data and bundles_data.flights else 'allBundles.map(b => b.flight)' }};
+        let altHotels = {{ bundles_data.hotels | tojson if bundles_data and bundles_data.hotels else 'allBundles.map(b => b.hotel)' }};
 
         // Addon prices
         const addonPrices = {
@@ -918,9 +920,140 @@ HTML_TEMPLATE = """
         };
 
         // Track selected addons per bundle
-        const bundleAddons = {};
+        let bundleAddons = {};
         allBundles.forEach((_, i) => bundleAddons[i] = new Set());
 
+        // ========== CLIENT-SIDE RENDERING (streamed results) ==========
+        function escapeHtml(value) {
+            return String(value).replace(/[&<>"']/g, c => ({
+                '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+            })[c]);
+        }
+
+        function sectionHeaderHtml(count, tripType, routeDisplay) {
+            return `
+                <div class="section-header">
+                    <div>
+                        <h2 class="section-title">🎯 ${count} bundles for your trip</h2>
+                        <div style="margin-top: 8px; display: flex; align-items: center; gap: 12px;">
+                            <span class="trip-badge ${tripType === 'return' ? 'return' : 'oneway'}">
+                                ${tripType === 'return' ? '↩️ Return Flight' : '✈️ One-way Flight'}
+                            </span>
+                            <span style="color: var(--text-secondary); font-size: 0.9em;">${escapeHtml(routeDisplay)}</span>
+                        </div>
+                    </div>
+                    <div class="view-toggle">
+                        <button class="toggle-btn refresh-btn">🔄 Refresh prices</button>
+                        <button class="toggle-btn active">Best Value</button>
+                        <button class="toggle-btn">Cheapest</button>
+                        <button class="toggle-btn">Fastest</button>
+                    </div>
+                </div>
+            `;
+        }
+
+        // Same markup as the server-rendered cards in the template above
+        function bundleCardHtml(bundle, i) {
+            const f = bundle.flight;
+            const h = bundle.hotel;
+            let tag = '';
+            if (i === 0) tag = '<span class="bundle-tag value">🏆 BEST VALUE</span>';
+            else if (f.duration_hours < 20) tag = '<span class="bundle-tag fast">⚡ FASTEST</span>';
+            else if (f.carbon < 800) tag = '<span class="bundle-tag eco">🌱 ECO-FRIENDLY</span>';
+            if (f.available === false || h.available === false) tag = '<span class="bundle-tag">⛔ SOLD OUT</span>';
+
+            return `
+                <div class="bundle-card ${i === 0 ? 'best-value' : ''}">
+                    <div class="bundle-header">
+                        <span>${escapeHtml(bundle.vibe_text)}</span>
+                        ${tag}
+                    </div>
+
+                    <div class="bundle-content">
+                        <div class="bundle-flight">
+                            <div class="section-label">✈️ FLIGHT</div>
+                            <div class="flight-main">
+                                <div class="airline-logo">${escapeHtml(f.emoji)}</div>
+                                <div class="flight-route">
+                                    <div class="time-city">
+                                        <div class="time">${escapeHtml(f.depart)}</div>
+                                        <div class="city">${escapeHtml(bundle.origin)}</div>
+                                    </div>
+                                    <div class="route-line"></div>
+                                    <div class="time-city">
+                                        <div class="time">${escapeHtml(f.arrive)}</div>
+                                        <div class="city">${escapeHtml(bundle.destination)}</div>
+                                    </div>
+                                </div>
+                            </div>
+                            <div class="flight-meta">
+                                <span>${escapeHtml(f.airline)}</span>
+                                <span>⏱️ ${escapeHtml(f.duration)}</span>
+                                <span>${f.stops} stop${f.stops !== 1 ? 's' : ''}</span>
+                                <span class="flight-price">S$${f.price}</span>
+                            </div>
+                        </div>
+
+                        <div class="bundle-hotel">
+                            <div class="section-label">🏨 HOTEL · ${bundle.nights} nights</div>
+                            <div class="hotel-main">
+                                <div class="hotel-image">🏨</div>
+                                <div class="hotel-info">
+                                    <div class="hotel-name">${escapeHtml(h.name)}</div>
+                                    <div class="hotel-rating">
+                                        <span class="stars">${'⭐'.repeat(h.stars)}</span>
+                                        <span class="review-score">${escapeHtml(h.score)}</span>
+                                        <span style="color: var(--text-secondary);">${h.reviews} reviews</span>
+                                    </div>
+                                </div>
+                            </div>
+                            <div class="hotel-meta">
+                                <span>📍 ${escapeHtml(h.location)}</span> ·
+                                <span class="hotel-price">S$${h.price_per_night}/night</span>
+                            </div>
+                        </div>
+
+                        <div class="bundle-price">
+                            <div class="total-label">TOTAL BUNDLE</div>
+                            <div class="total-price">S$${bundle.total_price}</div>
+                            <div class="per-person">per person</div>
+                            ${bundle.savings > 0 ? `<div class="savings">💰 Save S$${bundle.savings} vs booking separately</div>` : ''}
+                            <button class="book-bundle-btn" onclick="bookBundle(${i})">Book This Bundle →</button>
+                        </div>
+                    </div>
+
+                    <div class="customize-row">
+                        <button class="customize-btn" onclick="swapFlight(${i})">🔄 Swap flight</button>
+                        <div class="add-ons">
+                            <span class="addon-chip" onclick="toggleAddon(${i}, 'bag', this)">+ 🧳 Extra bag</span>
+                            <span class="addon-chip" onclick="toggleAddon(${i}, 'breakfast', this)">+ 🍽️ Breakfast</span>
+                            <span class="addon-chip" onclick="toggleAddon(${i}, 'transfer', this)">+ 🚗 Airport transfer</span>
+                        </div>
+                        <button class="customize-btn" onclick="swapHotel(${i})">🔄 Swap hotel</button>
+                    </div>
+                </div>
+            `;
+        }
+
+        // Read an NDJSON response line by line, calling onEvent for each
+        async function readEvents(res, onEvent) {
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let newline;
+                while ((newline = buffer.indexOf('\\n')) >= 0) {
+                    const line = buffer.slice(0, newline).trim();
+                    buffer = buffer.slice(newline + 1);
+                    if (line) onEvent(JSON.parse(line));
+                }
+            }
+            if (buffer.trim()) onEvent(JSON.parse(buffer));
+        }
+
         // ========== MODAL FUNCTIONS ==========
         function openModal(title, content) {
             document.getElementById('modalTitle').textContent = title;
@@ -1181,35 +1314,112 @@ HTML_TEMPLATE = """
                 tripType: tripType
             });
 
-            try {
-                const res = await fetch('/api/bundle?' + params);
-                const data = await res.json();
-                clearInterval(msgInterval);
+            // Results arrive as NDJSON: flights, hotels per results page, then one line per bundle
+            allBundles = [];
+            altHotels = [];
+            bundleAddons = {};
+            let cardsEl = null;
+            let failed = false;
 
-                if (data.success) {
-                    location.reload();
-                } else {
-                    section.innerHTML = `<div class="loading"><p>😅 ${data.error}</p></div>`;
+            function handleEvent(event) {
+                const el = document.getElementById('loadingMsg');
+                if (event.type === 'flights') {
+                    altFlights = event.flights;
+                    if (el && event.flights.length) {
+                        const cheapest = Math.min(...event.flights.map(f => f.price));
+                        el.textContent = `✈️ ${event.flights.length} flights from S$${cheapest.toLocaleString()} · scanning hotels... 🏨`;
+                    }
+                } else if (event.type === 'hotels') {
+                    // One event per results page, each with the hotels new on it
+                    altHotels = altHotels.concat(event.hotels);
+                    if (el) el.textContent = `🏨 ${altHotels.length} hotels found · matching best combos... 🎯`;
+                } else if (event.type === 'bundle') {
+                    clearInterval(msgInterval);
+                    if (!cardsEl) {
+                        section.innerHTML = sectionHeaderHtml(0, tripType, '') + '<div id="bundleCards"></div>';
+                        cardsEl = document.getElementById('bundleCards');
+                    }
+                    const i = allBundles.length;
+                    allBundles.push(event.bundle);
+                    bundleAddons[i] = new Set();
+                    cardsEl.insertAdjacentHTML('beforeend', bundleCardHtml(event.bundle, i));
+                    section.querySelector('.section-title').textContent = `🎯 ${allBundles.length} bundles for your trip`;
+                } else if (event.type === 'done') {
+                    Object.assign(routeInfo, {
+                        origin: event.origin,
+                        destination: event.destination,
+                        nights: event.nights,
+                        checkin: event.checkin,
+                        checkout: event.checkout,
+                        tripType: event.trip_type,
+                        bookingCity: event.booking_city
+                    });
+                    const header = section.querySelector('.section-header');
+                    if (header) header.outerHTML = sectionHeaderHtml(event.count, event.trip_type, event.route_display);
+                } else if (event.type === 'error') {
+                    failed = true;
+                    section.innerHTML = `<div class="loading"><p>😅 ${escapeHtml(event.error)}</p></div>`;
+                }
+            }
+
+            try {
+                const res = await fetch('/api/bundle/stream?' + params);
+                await readEvents(res, handleEvent);
+                if (!failed && !allBundles.length) {
+                    section.innerHTML = `<div class="loading"><p>😅 No bundles found</p></div>`;
                 }
             } catch (err) {
-                clearInterval(msgInterval);
                 section.innerHTML = `<div class="loading"><p>😅 Something went wrong</p></div>`;
             } finally {
+                clearInterval(msgInterval);
                 btn.disabled = false;
                 btn.textContent = 'Build My Trip ✨';
             }
         });
 
+        // ========== REFRESH PRICES ==========
+        // Re-reads only the deep links of the shown bundles, then redraws them
+        async function refreshPrices(btn) {
+            btn.disabled = true;
+            btn.textContent = '🔄 Refreshing...';
+            try {
+                const res = await fetch('/api/bundle/refresh');
+                const data = await res.json();
+                if (!data.success) {
+                    showToast(data.error || 'Refresh failed');
+                    return;
+                }
+                allBundles = data.bundles;
+                bundleAddons = {};
+                allBundles.forEach((b, i) => { bundleAddons[i] = new Set(); });
+                const section = document.getElementById('bundlesSection');
+                section.innerHTML = sectionHeaderHtml(allBundles.length, data.trip_type, data.route_display) +
+                    '<div id="bundleCards">' + allBundles.map((b, i) => bundleCardHtml(b, i)).join('') + '</div>';
+                showToast(`Updated ${data.refreshed} prices`);
+            } catch (err) {
+                showToast('Refresh failed');
+            } finally {
+                btn.disabled = false;
+                btn.textContent = '🔄 Refresh prices';
+            }
+        }
+
         // ========== TOGGLE BUTTONS ==========
-        document.querySelectorAll('.toggle-btn').forEach(btn => {
-            btn.addEventListener('click', () => {
-                document.querySelectorAll('.toggle-btn').forEach(b => b.classList.remove('active'));
-                btn.classList.add('active');
-
-                const sortType = btn.textContent.toLowerCase().includes('cheap') ? 'cheapest' :
-                                 btn.textContent.toLowerCase().includes('fast') ? 'fastest' : 'value';
-                sortBundles(sortType);
-            });
+        // Delegated, since streamed results replace the header and its buttons
+        document.addEventListener('click', (e) => {
+            const refreshBtn = e.target.closest('.refresh-btn');
+            if (refreshBtn) {
+                refreshPrices(refreshBtn);
+                return;
+            }
+            const btn = e.target.closest('.toggle-btn');
+            if (!btn) return;
+            document.querySelectorAll('.toggle-btn:not(.refresh-btn)').forEach(b => b.classList.remove('active'));
+            btn.classList.add('active');
+
+            const sortType = btn.textContent.toLowerCase().includes('cheap') ? 'cheapest' :
+                             btn.textContent.toLowerCase().includes('fast') ? 'fastest' : 'value';
+            sortBundles(sortType);
         });
 
         // Close modal on overlay click
@@ -1238,7 +1448,178 @@ VIBE_TEXTS = [
 ]
 
 
-def scrape_flights(origin, destination, date_str, return_date_str=None):
+def _unique(values):
+    """Yield values in order, skipping repeats."""
+    seen = set()
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            yield value
+
+
+class _Pull:
+    """List view of a lazy iterator that only reads as far as it is indexed.
+
+    The parsers spread a few values over the records round-robin
+    (values[i % len(values)]). cycle(i) gives the same answer as the full
+    list would, and get(i) gives item i or a default, but both stop reading
+    the page as soon as item i is found; only a page with fewer than i+1
+    values is read to the end.
+    """
+
+    def __init__(self, iterable, cap=None):
+        self._it = iter(iterable)
+        self.items = []
+        self.cap = cap
+        self._done = False
+
+    def _fill(self, n):
+        while not self._done and len(self.items) < n and (self.cap is None or len(self.items) < self.cap):
+            try:
+                self.items.append(next(self._it))
+            except StopIteration:
+                self._done = True
+
+    def get(self, i, default=None):
+        """Item i, or default if the source has fewer items."""
+        self._fill(i + 1)
+        return self.items[i] if i < len(self.items) else default
+
+    def cycle(self, i, default=None):
+        """Item i % len(all items), or default if there are none."""
+        self._fill(i + 1)
+        if not self.items:
+            return default
+        return self.items[i % len(self.items)]
+
+
+# One pass over the page instead of one per tag type
+_SCRIPT_STYLE = re.compile(r'<(script|style)[^>]*>.*?</\1>', re.DOTALL)
+
+# Prices as they read in the text: tags between the symbol and the digits
+# are skipped, and tags are matched whole so a $ inside an attribute is not
+# a price. group(1) is None for the tag matches.
+_FLIGHT_PRICE = re.compile(r'<[^>]+>|\$(?:\s|<[^>]+>)*([\d,]+)')
+_HOTEL_PRICE = re.compile(r'<[^>]+>|S\$(?:\s|<[^>]+>)*([\d,]+)')
+_TIME = re.compile(r'\b(\d{1,2}:\d{2})\b')
+_DURATION = re.compile(r'(\d{1,2}h\s*\d{0,2}m?)')
+_HOTEL_NAME = re.compile(r'data-testid="title"[^>]*>([^<]+)<')
+_HOTEL_SCORE = re.compile(r'(\d\.\d)\s*(?:Superb|Excellent|Very Good|Good|Pleasant)')
+_PRICE_PATTERNS = {"SGD": _FLIGHT_PRICE}
+
+
+def _price_pattern(code):
+    """_FLIGHT_PRICE for prices shown in another currency (RM 1,234, £812...)."""
+    pattern = _PRICE_PATTERNS.get(code)
+    if pattern is None:
+        symbol = re.escape(currency.PAGE_SYMBOLS.get(code, code))
+        pattern = _PRICE_PATTERNS[code] = re.compile(r'<[^>]+>|' + symbol + r'(?:\s|<[^>]+>)*([\d,]+)')
+    return pattern
+
+# Case-insensitive name search reads the page in chunks this long, so it
+# never holds a lower-cased copy of the whole page
+_NAME_CHUNK = 64 * 1024
+
+
+def _visible(html):
+    """(start, end) of the parts of html outside <script> and <style> blocks.
+
+    The parsers search these spans of the page in place (pattern.finditer
+    with pos/endpos) instead of building script-free and tag-free copies;
+    scripts are most of a results page.
+    """
+    spans = []
+    start = 0
+    for m in _SCRIPT_STYLE.finditer(html):
+        if m.start() > start:
+            spans.append((start, m.start()))
+        start = m.end()
+    if start < len(html):
+        spans.append((start, len(html)))
+    return spans
+
+
+def _find(pattern, html, spans, group=1):
+    """Yield pattern's group from every match inside spans, skipping None."""
+    for start, end in spans:
+        for m in pattern.finditer(html, start, end):
+            value = m.group(group)
+            if value is not None:
+                yield value
+
+
+def _names_in(html, names):
+    """names that occur in html, ignoring case, in the order given."""
+    wanted = {name: name.lower() for name in names}
+    found = set()
+    # Chunks overlap by the longest name so none is cut in two
+    overlap = max(map(len, wanted.values()), default=1) - 1
+    for start in range(0, len(html), _NAME_CHUNK):
+        chunk = html[max(0, start - overlap):start + _NAME_CHUNK].lower()
+        found.update(name for name, low in wanted.items() if name not in found and low in chunk)
+        if len(found) == len(wanted):
+            break
+    return [name for name in names if name in found]
+
+# Results wanted per source: create_bundles pairs up to 6 flights, the
+# swap modal offers the rest
+FLIGHT_LIMIT = 10
+HOTEL_LIMIT = 8
+
+# Hotel fan-out (see HotelFanOut): every search fetches HOTEL_PAGES result
+# pages (offsets of HOTEL_PAGE_SIZE) plus one page per star class in
+# HOTEL_STARS, HOTEL_FANOUT_WORKERS at a time. Each page is one Booking.com
+# query against the daily budget; pages still queued when a search ends
+# early are never fetched.
+HOTEL_PAGE_SIZE = 25
+HOTEL_PAGES = int(os.environ.get("TRIPVIBE_HOTEL_PAGES", "3"))
+HOTEL_STARS = tuple(int(s) for s in os.environ.get("TRIPVIBE_HOTEL_STARS", "").split(",") if s.strip())
+HOTEL_FANOUT_WORKERS = int(os.environ.get("TRIPVIBE_HOTEL_WORKERS", "2"))
+
+# Prices are shown and stored in DISPLAY_CURRENCY. Flights are searched in
+# each Skyscanner market of TRIPVIBE_MARKETS (e.g. "SG,MY,US"), concurrently,
+# and the cheapest normalised fares win; each market is one Skyscanner query.
+DISPLAY_CURRENCY = "SGD"
+FLIGHT_MARKETS = tuple(m.strip().upper() for m in os.environ.get("TRIPVIBE_MARKETS", "SG").split(",") if m.strip())
+
+# Price windows (DISPLAY_CURRENCY) for routes without enough price history;
+# after that each route's window is learned (see price_windows.py).
+# Return flights: typically S$1200-5000 for long-haul
+# One-way flights: typically S$400-3000 for long-haul
+FLIGHT_WINDOWS = {True: (1000, 8000), False: (400, 5000)}
+HOTEL_NIGHT_WINDOW = (150, 1500)
+
+
+def price_window(key, default):
+    """The learned (low, high) price window for key, or default; never fails the search."""
+    try:
+        return price_windows.default_windows().window(key, default)
+    except Exception as e:
+        print(f"Price window for {key} unavailable: {e}")
+        return default
+
+
+def price_observer(key):
+    """fn(prices, candidates) feeding a page's prices into key's sketch (see PriceWindows.observe)."""
+    def observe(prices, candidates=None):
+        try:
+            price_windows.default_windows().observe(key, prices, candidates)
+        except Exception as e:
+            print(f"Prices for {key} not recorded: {e}")
+    return observe
+
+
+def check_alerts(method, *args, **kwargs):
+    """Run an alerts.AlertEngine check on fresh results; a failure never fails the search."""
+    try:
+        with tracing.span("alerts"):
+            getattr(alerts.default_engine(), method)(*args, **kwargs)
+    except Exception as e:
+        print(f"Alert check failed: {e}")
+
+
+@tracing.traced()
+def scrape_flights(origin, destination, date_str, return_date_str=None, market="SG", rates=None):
     """Scrape flights from Skyscanner.
 
     Args:
@@ -1246,170 +1627,446 @@ def scrape_flights(origin, destination, date_str, return_date_str=None):
         destination: Destination airport code
         date_str: Departure date (YYYY-MM-DD)
         return_date_str: Return date for round-trip (YYYY-MM-DD), or None for one-way
+        market: Skyscanner market to search in (see currency.MARKETS); prices
+            come back in DISPLAY_CURRENCY whatever the market
+        rates: currency.Rates to convert with (default: a snapshot of the
+            current table); scrape_flights_markets passes one for all markets
     """
     date_obj = datetime.strptime(date_str, "%Y-%m-%d")
     sky_date = date_obj.strftime("%y%m%d")
+    site, page_currency = currency.market_site(market)
 
     # Build URL - add return date for round-trip
     if return_date_str:
         return_obj = datetime.strptime(return_date_str, "%Y-%m-%d")
         sky_return = return_obj.strftime("%y%m%d")
-        base_url = f"https://www.skyscanner.com.sg/transport/flights/{origin.lower()}/{destination.lower()}/{sky_date}/{sky_return}/?currency=SGD"
+        base_url = f"https://{site}/transport/flights/{origin.lower()}/{destination.lower()}/{sky_date}/{sky_return}/?currency={page_currency}"
     else:
-        base_url = f"https://www.skyscanner.com.sg/transport/flights/{origin.lower()}/{destination.lower()}/{sky_date}/?currency=SGD"
+        base_url = f"https://{site}/transport/flights/{origin.lower()}/{destination.lower()}/{sky_date}/?currency={page_currency}"
 
-    fetcher = StealthyFetcher(headless=True)
-    response = fetcher.fetch(base_url, solve_cloudflare=True)
+    response = browser_pool.default_pool().fetch(
+        base_url,
+        source="skyscanner",
+        solve_cloudflare=True,
+        page_action=browser_pool.wait_for_results("skyscanner", FLIGHT_LIMIT),
+    )
 
-    if response.status != 200:
+    # Keep only the HTML; the response's DOM is freed before parsing
+    status, _, html = browser_pool.page_html(response)
+    del response
+    if status != 200:
         return []
 
-    html = response.html_content
+    round_trip = bool(return_date_str)
+    key = price_windows.flight_key(origin, destination, round_trip)
+    flights = parse_flights(
+        html, base_url, round_trip=round_trip, page_currency=page_currency, rates=rates,
+        window=price_window(key, FLIGHT_WINDOWS[round_trip]), observe=price_observer(key),
+    )
+    metrics.ITEMS_EXTRACTED.labels("skyscanner").observe(len(flights))
+    check_alerts("check_flights", origin, destination, date_str, flights, round_trip=bool(return_date_str))
+    return flights
+
+
+def iter_flights(html, base_url, round_trip=False, page_currency=DISPLAY_CURRENCY, rates=None,
+                 window=None, observe=None):
+    """Yield Flight records from a Skyscanner results page, cheapest first.
 
+    Prices are ranked, so the page is scanned for prices once; everything
+    else (links, airlines, times, durations) is read lazily and only as far
+    as the records pulled so far need.
+
+    Args:
+        html: Page HTML
+        base_url: Search URL, used as booking link when no deep link is found
+        round_trip: Whether prices are for return trips (changes the price window)
+        page_currency: Currency the page shows prices in; they are yielded
+            in DISPLAY_CURRENCY
+        rates: currency.Rates to convert with (default: the current table)
+        window: (low, high) fare window in DISPLAY_CURRENCY (default: the
+            FLIGHT_WINDOWS constant for the trip type)
+        observe: fn(prices, candidates) called once with the prices the
+            records are drawn from (in the window) and every price in the
+            sanity range, both in DISPLAY_CURRENCY
+    """
     # Extract flight detail URLs (Skyscanner uses these for specific flight results)
     # Pattern: /transport/flights/sin/nyca/260612/260619/config/... or similar deep links
-    flight_urls = re.findall(r'href="(/transport/flights/[^"]+)"', html)
-    flight_urls = list(dict.fromkeys(flight_urls))  # Remove duplicates, preserve order
+    flight_urls = _Pull(_unique(
+        m.group(1) for m in re.finditer(r'href="(/transport/flights/[^"]+)"', html)
+    ))
 
     # Extract prices more carefully
-    # Remove script and style tags first to avoid picking up non-price numbers
-    clean_html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL)
-    clean_html = re.sub(r'<style[^>]*>.*?</style>', '', clean_html, flags=re.DOTALL)
+    # Only the visible text counts, to avoid picking up non-price numbers
+    # from scripts and styles
+    spans = _visible(html)
+
+    min_price, max_price = window or FLIGHT_WINDOWS[bool(round_trip)]
+    sanity_low, sanity_high = price_windows.FLIGHT_SANITY
+    # The windows are in DISPLAY_CURRENCY; compare in the page's currency
+    if page_currency != DISPLAY_CURRENCY:
+        rates = rates or currency.default_table().snapshot()
+        min_price, max_price, sanity_low, sanity_high = rates.convert_all(
+            (min_price, max_price, sanity_low, sanity_high), DISPLAY_CURRENCY, page_currency,
+        )
+
+    # Find prices in the text; the results keep distinct ones in the
+    # window, cheapest first
+    candidates = set()
+    for p in _find(_price_pattern(page_currency), html, spans):
+        digits = p.replace(',', '')
+        if digits.isdigit() and sanity_low <= int(digits) <= sanity_high:
+            candidates.add(int(digits))
+    flight_prices = sorted(price for price in candidates if min_price <= price <= max_price)
+    if page_currency != DISPLAY_CURRENCY:
+        # One conversion pass over all prices, in ranked order
+        flight_prices = rates.convert_all(flight_prices, page_currency, DISPLAY_CURRENCY)
+    # The sketch learns from fares, not the fees and banners around them;
+    # candidates let a cold-start route learn fares the window misses
+    if observe and candidates:
+        if page_currency != DISPLAY_CURRENCY:
+            candidates = rates.convert_all(sorted(candidates), page_currency, DISPLAY_CURRENCY)
+        observe(list(flight_prices), list(candidates))
+    if not flight_prices:
+        return
 
-    # Extract text content
-    text_content = re.sub(r'<[^>]+>', ' ', clean_html)
+    # Airlines
+    airlines = _names_in(html, AIRLINE_EMOJIS)
 
-    # Find prices in clean text
-    prices = re.findall(r'\$\s*([\d,]+)', text_content)
-    flight_prices = []
+    # Times and durations come from the result cards, not the inline scripts
+    times = _Pull(_unique(_find(_TIME, html, spans)), cap=20)
+    durations = _Pull(
+        d for d in _find(_DURATION, html, spans)
+        if 10 <= int(d[:d.index('h')]) <= 50
+    )
 
-    # Return flights: typically S$1200-5000 for long-haul
-    # One-way flights: typically S$400-3000 for long-haul
-    if return_date_str:
-        min_price, max_price = 1000, 8000
-    else:
-        min_price, max_price = 400, 5000
+    site = urlsplit(base_url).netloc
+    for i, price in enumerate(flight_prices):
+        airline = airlines[i % len(airlines)] if airlines else "Unknown"
+        duration = durations.cycle(i, "20h")
+        dur_match = re.match(r'(\d+)h', duration)
+        dur_hours = int(dur_match.group(1)) if dur_match else 20
 
-    for p in prices:
-        try:
-            val = int(p.replace(',', ''))
-            if min_price <= val <= max_price:
-                flight_prices.append(val)
-        except:
-            pass
+        # Get flight-specific URL if available, otherwise use base search URL
+        path = flight_urls.get(i)
+        flight_url = f"https://{site}{path}" if path else base_url
+
+        yield Flight(
+            airline=airline,
+            emoji=AIRLINE_EMOJIS.get(airline, "✈️"),
+            price=price,
+            duration=duration,
+            duration_hours=dur_hours,
+            depart=times.cycle(i, "08:00"),
+            arrive=times.cycle(i + 3, "18:00"),
+            stops=1 if dur_hours < 22 else 2,
+            carbon=int(dur_hours * 45),
+            booking_url=flight_url,
+        )
+
+
+@tracing.traced()
+def parse_flights(html, base_url, round_trip=False, limit=FLIGHT_LIMIT, page_currency=DISPLAY_CURRENCY,
+                  rates=None, window=None, observe=None):
+    """Extract up to limit Flight records from a Skyscanner results page.
 
-    # Remove duplicates and sort
-    flight_prices = sorted(set(flight_prices))
+    Args:
+        html: Page HTML
+        base_url: Search URL, used as booking link when no deep link is found
+        round_trip: Whether prices are for return trips (changes the price window)
+        limit: Number of flights wanted; parsing stops once it is reached
+        page_currency: Currency the page shows prices in (see iter_flights)
+        rates, window, observe: Exchange rates, fare window and price
+            callback (see iter_flights)
+    """
+    return list(islice(iter_flights(html, base_url, round_trip, page_currency, rates=rates,
+                                    window=window, observe=observe), limit))
 
-    # Airlines
-    airline_names = list(AIRLINE_EMOJIS.keys())
-    found_airlines = [a for a in airline_names if a.lower() in html.lower()]
 
-    # Times
-    times = list(set(re.findall(r'\b(\d{1,2}:\d{2})\b', html)))[:20]
+def _flight_key(flight):
+    """The itinerary's deep-link path, the same in every market; None without one.
 
-    # Durations
-    durations = re.findall(r'(\d{1,2}h\s*\d{0,2}m?)', html)
-    valid_durations = [d for d in durations if re.match(r'(\d+)h', d) and 10 <= int(re.match(r'(\d+)h', d).group(1)) <= 50]
+    Airline, times and duration are assigned to fares by position, so they
+    don't identify an itinerary across markets; the /config/<itinerary>
+    path does (the host and query differ per market).
+    """
+    path = urlsplit(flight.booking_url).path
+    return path if "/config/" in path else None
 
-    sorted_prices = sorted(set(flight_prices))
-    flights = []
 
-    for i, price in enumerate(sorted_prices[:10]):
-        airline = found_airlines[i % len(found_airlines)] if found_airlines else "Unknown"
-        duration = valid_durations[i % len(valid_durations)] if valid_durations else "20h"
-        dur_match = re.match(r'(\d+)h', duration)
-        dur_hours = int(dur_match.group(1)) if dur_match else 20
+@tracing.traced()
+def scrape_flights_markets(origin, destination, date_str, return_date_str=None, markets=None):
+    """Scrape flights in several Skyscanner markets at once and keep the cheapest.
 
-        # Get flight-specific URL if available, otherwise use base search URL
-        if i < len(flight_urls):
-            flight_url = f"https://www.skyscanner.com.sg{flight_urls[i]}"
-        else:
-            flight_url = base_url
-
-        flights.append({
-            "airline": airline,
-            "emoji": AIRLINE_EMOJIS.get(airline, "✈️"),
-            "price": price,
-            "duration": duration,
-            "duration_hours": dur_hours,
-            "depart": times[i % len(times)] if times else "08:00",
-            "arrive": times[(i + 3) % len(times)] if times else "18:00",
-            "stops": 1 if dur_hours < 22 else 2,
-            "carbon": int(dur_hours * 45),
-            "booking_url": flight_url,
-        })
+    Every market's prices are normalised to DISPLAY_CURRENCY, so they
+    compare directly. An itinerary found in several markets (the same deep
+    link) is kept once, at its lowest price (with that market's booking
+    link).
 
-    return flights
+    Args:
+        origin, destination, date_str, return_date_str: As scrape_flights
+        markets: Market codes (default FLIGHT_MARKETS)
 
+    Returns:
+        (flights cheapest first, {market: cheapest price or None})
+    """
+    markets = markets or FLIGHT_MARKETS
+    # One set of rates for every market, so their fares compare exactly
+    rates = currency.default_table().snapshot()
+    if len(markets) == 1:
+        flights = scrape_flights(origin, destination, date_str, return_date_str, markets[0], rates)
+        return flights, {markets[0]: flights[0].price if flights else None}
+
+    cheapest = {}
+    best = {}
+    with ThreadPoolExecutor(max_workers=len(markets), thread_name_prefix="market") as executor:
+        futures = {
+            executor.submit(contextvars.copy_context().run, scrape_flights,
+                            origin, destination, date_str, return_date_str, market, rates): market
+            for market in markets
+        }
+        first_error = None
+        failed = 0
+        for future in as_completed(futures):
+            market = futures[future]
+            try:
+                flights = future.result()
+            except Exception as e:
+                # One market failing leaves the others
+                print(f"Flights in market {market} failed: {e}")
+                first_error = first_error or e
+                failed += 1
+                cheapest[market] = None
+                continue
+            cheapest[market] = flights[0].price if flights else None
+            for flight in flights:
+                # A fare without a deep link can't be matched; it stays on its own
+                key = _flight_key(flight) or id(flight)
+                if key not in best or flight.price < best[key].price:
+                    best[key] = flight
+
+    if failed == len(markets):
+        raise first_error
+    flights = sorted(best.values(), key=lambda f: f.price)[:FLIGHT_LIMIT]
+    return flights, {market: cheapest[market] for market in markets}
+
+
+def hotel_search_urls(city, checkin, checkout, pages=None, stars=None):
+    """Booking.com result pages that partition one hotel search.
 
-def scrape_hotels(city, checkin, checkout):
-    """Scrape hotels from Booking.com."""
-    city_info = CITIES.get(city, {"booking": city})
-    booking_city = city_info.get("booking", city)
+    Args:
+        city: Destination airport/metro code (see places.py) or city name
+        checkin: Check-in date (YYYY-MM-DD)
+        checkout: Check-out date (YYYY-MM-DD)
+        pages: Offset pages to fetch (default HOTEL_PAGES, at least 1)
+        stars: Star classes to fetch one filtered page each (default HOTEL_STARS)
+
+    Returns:
+        [(url, star class or None)], the plain first page first
+    """
+    booking_city = places.default_index().booking_city(city)
 
     base_url = f"https://www.booking.com/searchresults.html?ss={booking_city}&checkin={checkin}&checkout={checkout}&group_adults=2&no_rooms=1&selected_currency=SGD"
 
-    fetcher = StealthyFetcher(headless=True)
-    response = fetcher.fetch(base_url, solve_cloudflare=True)
+    pages = HOTEL_PAGES if pages is None else pages
+    stars = HOTEL_STARS if stars is None else stars
+    urls = [(base_url, None)]
+    urls += [(f"{base_url}&offset={page * HOTEL_PAGE_SIZE}", None) for page in range(1, pages)]
+    urls += [(f"{base_url}&nflt=class%3D{star}", star) for star in stars]
+    # Districts need Booking.com's district ids (HOTEL_DISTRICTS)
+    urls += [(f"{base_url}&nflt=di%3D{district}", None) for district in HOTEL_DISTRICTS.get(city, ())]
+    return urls
+
+
+@tracing.traced()
+def scrape_hotel_page(url, checkin, checkout, stars=None, city=None):
+    """Scrape one Booking.com results page.
 
-    if response.status != 200:
+    Args:
+        url: Results page URL (see hotel_search_urls)
+        checkin: Check-in date (YYYY-MM-DD)
+        checkout: Check-out date (YYYY-MM-DD)
+        stars: Star class the page is filtered to, or None
+        city: City searched, for its learned price window (None: the
+            HOTEL_NIGHT_WINDOW constant, and nothing is learned)
+    """
+    response = browser_pool.default_pool().fetch(
+        url,
+        source="booking",
+        solve_cloudflare=True,
+        page_action=browser_pool.wait_for_results("booking", HOTEL_PAGE_SIZE),
+    )
+
+    # Keep only the HTML; the response's DOM is freed before parsing
+    status, _, html = browser_pool.page_html(response)
+    del response
+    if status != 200:
         return []
 
-    html = response.html_content
+    # Known hotels keep their indexed attributes; new prices go back in
+    index = hotel_index.default_index()
+    window, observe = None, None
+    if city:
+        key = price_windows.hotel_key(city)
+        window, observe = price_window(key, HOTEL_NIGHT_WINDOW), price_observer(key)
+    hotels = parse_hotels(html, url, checkin, checkout, limit=HOTEL_PAGE_SIZE, stars=stars, known=index.static,
+                          window=window, observe=observe)
+    index.record(hotels, checkin, checkout)
+    metrics.ITEMS_EXTRACTED.labels("booking").observe(len(hotels))
+    return hotels
+
 
+def _hotel_key(hotel):
+    # The hotel page without our checkin/checkout query; name if no link was found
+    if "/hotel/" in hotel.booking_url:
+        return hotel.booking_url.split("?", 1)[0]
+    return hotel.name
+
+
+class HotelFanOut:
+    """All result pages of one hotel search, fetched concurrently.
+
+    Pages start fetching as soon as this is created, HOTEL_FANOUT_WORKERS at
+    a time, so callers create it first and scrape flights while the hotels
+    load; the rest wait their turn, and cancel() drops them unfetched.
+    Every page goes through the browser pool and the booking rate limiter
+    like a single scrape.
+    Iterating yields each page's hotels that weren't on an earlier page, as
+    pages finish; pool holds the merged, de-duplicated hotels in page order
+    (the plain first page first).
+
+    A failed extra page is skipped; if every page fails, the first page's
+    error is raised.
+    """
+
+    def __init__(self, city, checkin, checkout, pages=None, stars=None):
+        urls = hotel_search_urls(city, checkin, checkout, pages, stars)
+        self._search = (city, checkin, checkout)
+        self._ranked = {}           # key -> (page index, position, Hotel)
+        self._cancelled = threading.Event()
+        workers = max(1, min(HOTEL_FANOUT_WORKERS, len(urls)))
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hotel-page")
+        # Copy the caller's context so page spans land in the search's trace
+        self._futures = {
+            self._executor.submit(contextvars.copy_context().run, self._page, url, checkin, checkout, star, city): i
+            for i, (url, star) in enumerate(urls)
+        }
+        # Threads exit once their page is done; nothing waits on them
+        self._executor.shutdown(wait=False)
+
+    def _page(self, url, checkin, checkout, star, city):
+        # A page picked up just as the search was cancelled doesn't start
+        if self._cancelled.is_set():
+            raise CancelledError()
+        return scrape_hotel_page(url, checkin, checkout, star, city)
+
+    def __iter__(self):
+        first_error = None
+        delivered = False
+        for future in as_completed(self._futures):
+            page = self._futures[future]
+            try:
+                hotels = future.result()
+            except CancelledError:
+                continue
+            except Exception as e:
+                print(f"Hotel page {page} failed: {e}")
+                first_error = first_error or e
+                continue
+
+            new = []
+            for position, hotel in enumerate(hotels):
+                key = _hotel_key(hotel)
+                if key not in self._ranked:
+                    self._ranked[key] = (page, position, hotel)
+                    new.append(hotel)
+            delivered = True
+            check_alerts("check_hotels", *self._search, new)
+            yield new
+
+        if not delivered and first_error is not None:
+            raise first_error
+
+    @property
+    def pool(self):
+        """Hotels seen so far, first page first, each once."""
+        return [hotel for _, _, hotel in sorted(self._ranked.values(), key=lambda r: r[:2])]
+
+    def cancel(self):
+        """Don't start pages that haven't started yet (no budget is spent on them)."""
+        self._cancelled.set()
+        for future in self._futures:
+            future.cancel()
+
+
+@tracing.traced()
+def scrape_hotels(city, checkin, checkout):
+    """Scrape hotels from Booking.com: every page of the fan-out, merged."""
+    fan_out = HotelFanOut(city, checkin, checkout)
+    for _ in fan_out:
+        pass
+    return fan_out.pool
+
+
+def iter_hotels(html, base_url, checkin, checkout, stars=None, known=None, window=None, observe=None):
+    """Yield Hotel records from a Booking.com results page, in page order.
+
+    Names, links and scores are read lazily, up to the last hotel pulled;
+    prices are ranked, so they are read from the whole page.
+
+    Args:
+        html: Page HTML
+        base_url: Search URL, used as booking link when no hotel link is found
+        checkin: Check-in date (YYYY-MM-DD)
+        checkout: Check-out date (YYYY-MM-DD)
+        stars: Star class the page was filtered to, or None to estimate
+        known: fn(slug) -> static attributes or None (HotelIndex.static);
+            known hotels take those instead of what the card shows
+        window: (low, high) per-night price window in DISPLAY_CURRENCY
+            (default HOTEL_NIGHT_WINDOW)
+        observe: fn(prices, candidates) called once with the per-night
+            prices the records are drawn from (totals in the window) and
+            every per-night price in the sanity range
+    """
     # Extract hotel URLs - Booking.com uses /hotel/{country}/{hotel-slug}.html format
-    # Look for links with hotel paths
-    hotel_url_pattern = r'href="(https://www\.booking\.com/hotel/[^"]+)"'
-    hotel_urls = re.findall(hotel_url_pattern, html)
-    # Also try relative URLs
-    hotel_url_relative = re.findall(r'href="(/hotel/[^"]+\.html[^"]*)"', html)
-    hotel_urls.extend([f"https://www.booking.com{u}" for u in hotel_url_relative])
-    # Remove duplicates, preserve order
-    hotel_urls = list(dict.fromkeys(hotel_urls))
-
-    # Clean HTML - remove scripts and styles to avoid picking up wrong prices
-    clean_html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL)
-    clean_html = re.sub(r'<style[^>]*>.*?</style>', '', clean_html, flags=re.DOTALL)
-
-    # Extract hotel names
-    name_pattern = r'data-testid="title"[^>]*>([^<]+)<'
-    names = re.findall(name_pattern, clean_html)[:15]
+    # Absolute links first, then relative ones, duplicates removed
+    hotel_urls = _Pull(_unique(chain(
+        (m.group(1) for m in re.finditer(r'href="(https://www\.booking\.com/hotel/[^"]+)"', html)),
+        (f"https://www.booking.com{m.group(1)}" for m in re.finditer(r'href="(/hotel/[^"]+\.html[^"]*)"', html)),
+    )))
+
+    # Visible text only - scripts and styles carry prices that aren't rates
+    spans = _visible(html)
+
+    # Hotel names
+    names = _find(_HOTEL_NAME, html, spans)
 
     # Calculate nights for price filtering
     nights = (datetime.strptime(checkout, "%Y-%m-%d") - datetime.strptime(checkin, "%Y-%m-%d")).days
     nights = max(1, nights)
 
-    # Extract prices from clean text
-    text_content = re.sub(r'<[^>]+>', ' ', clean_html)
-
     # Look for S$ prices (total prices for stay)
     # For hotels, Booking.com shows total price which should be nights * per_night_rate
-    # Realistic range: $200-1000 per night = $200*nights to $1000*nights total
-    min_total = 150 * nights
-    max_total = 1500 * nights
-
-    price_pattern = r'S\$\s*([\d,]+)'
-    price_matches = re.findall(price_pattern, text_content)
-    prices = []
-    for p in price_matches:
-        try:
-            val = int(p.replace(',', ''))
-            if min_total <= val <= max_total:
-                prices.append(val)
-        except:
-            pass
-
-    # Remove duplicates and sort
-    prices = sorted(set(prices))
+    low, high = window or HOTEL_NIGHT_WINDOW
+    min_total, max_total = low * nights, high * nights
+    sanity_low, sanity_high = (bound * nights for bound in price_windows.HOTEL_NIGHT_SANITY)
+
+    candidates = set()
+    for p in _find(_HOTEL_PRICE, html, spans):
+        digits = p.replace(',', '')
+        if digits.isdigit() and sanity_low <= int(digits) <= sanity_high:
+            candidates.add(int(digits))
+    prices = sorted(total for total in candidates if min_total <= total <= max_total)
+    # Totals in the window (the hotels' rates) teach the sketch, not the
+    # taxes and fees around them; candidates serve a cold-start city
+    if observe and candidates:
+        observe([total // nights for total in prices], [total // nights for total in candidates])
 
     # Extract scores
-    scores = re.findall(r'(\d\.\d)\s*(?:Superb|Excellent|Very Good|Good|Pleasant)', clean_html)
+    scores = _Pull(_find(_HOTEL_SCORE, html, spans))
 
-    hotels = []
     locations = ["City Center", "Downtown", "Near Airport", "Business District", "Waterfront", "Arts District"]
 
-    for i in range(min(8, len(names))):
+    for i, name in enumerate(names):
         # Get price or estimate based on position (cheaper hotels listed first usually)
         if i < len(prices):
             total_price = prices[i]
@@ -1418,9 +2075,9 @@ def scrape_hotels(city, checkin, checkout):
             total_price = (200 + i * 50) * nights
 
         # Get hotel-specific URL if available
-        if i < len(hotel_urls):
+        hotel_url = hotel_urls.get(i)
+        if hotel_url:
             # Add checkin/checkout to the hotel URL
-            hotel_url = hotel_urls[i]
             if '?' in hotel_url:
                 hotel_url += f"&checkin={checkin}&checkout={checkout}&selected_currency=SGD"
             else:
@@ -1428,37 +2085,72 @@ def scrape_hotels(city, checkin, checkout):
         else:
             hotel_url = base_url
 
-        hotels.append({
-            "name": names[i][:35] + "..." if len(names[i]) > 35 else names[i],
-            "price_total": total_price,
-            "price_per_night": total_price // nights,
-            "stars": min(5, 3 + (i % 3)),
-            "score": scores[i] if i < len(scores) else f"{8.0 + (i % 15) / 10:.1f}",
-            "reviews": 500 + (i * 234) % 2000,
-            "location": locations[i % len(locations)],
-            "booking_url": hotel_url,
-        })
+        # Seen in an earlier search: only the price comes from this page
+        attrs = known(hotel_index.hotel_slug(hotel_url)) if known and hotel_url != base_url else None
+        if attrs:
+            yield Hotel(
+                name=attrs["name"],
+                price_total=total_price,
+                price_per_night=total_price // nights,
+                stars=stars or attrs["stars"],
+                score=attrs["score"],
+                reviews=attrs["reviews"],
+                location=attrs["location"],
+                booking_url=hotel_url,
+            )
+            continue
+
+        yield Hotel(
+            name=name[:35] + "..." if len(name) > 35 else name,
+            price_total=total_price,
+            price_per_night=total_price // nights,
+            stars=stars or min(5, 3 + (i % 3)),
+            score=scores.get(i) or f"{8.0 + (i % 15) / 10:.1f}",
+            reviews=500 + (i * 234) % 2000,
+            location=locations[i % len(locations)],
+            booking_url=hotel_url,
+        )
+
+
+@tracing.traced()
+def parse_hotels(html, base_url, checkin, checkout, limit=HOTEL_LIMIT, stars=None, known=None,
+                 window=None, observe=None):
+    """Extract up to limit Hotel records from a Booking.com results page.
 
-    return hotels
+    Args:
+        html: Page HTML
+        base_url: Search URL, used as booking link when no hotel link is found
+        checkin: Check-in date (YYYY-MM-DD)
+        checkout: Check-out date (YYYY-MM-DD)
+        limit: Number of hotels wanted; parsing stops once it is reached
+        stars: Star class the page was filtered to, or None to estimate
+        known: fn(slug) -> static attributes or None, see iter_hotels()
+        window, observe: Per-night price window and price callback, see iter_hotels()
+    """
+    return list(islice(iter_hotels(html, base_url, checkin, checkout, stars, known, window, observe), limit))
 
 
+@tracing.traced()
 def create_bundles(flights, hotels, origin, destination, nights):
     """Create flight + hotel bundles."""
     bundles = []
 
+    # One shared placeholder rather than a fresh dict per bundle
+    fallback_hotel = Hotel(
+        name="City Hotel",
+        price_total=200 * nights,
+        price_per_night=200,
+        stars=4,
+        score="8.5",
+        reviews=1000,
+        location="City Center",
+    )
+
     for i, flight in enumerate(flights[:6]):
-        hotel = hotels[i % len(hotels)] if hotels else {
-            "name": "City Hotel",
-            "price_total": 200 * nights,
-            "price_per_night": 200,
-            "stars": 4,
-            "score": "8.5",
-            "reviews": 1000,
-            "location": "City Center"
-        }
+        hotel = hotels[i % len(hotels)] if hotels else fallback_hotel
 
-        flight_price = flight["price"]
-        hotel_price = hotel["price_total"]
+        flight_price = flight.price
+        hotel_price = hotel.price_total
 
         # Bundle discount (5-15%)
         discount_pct = 0.05 + (i * 0.02)
@@ -1466,30 +2158,288 @@ def create_bundles(flights, hotels, origin, destination, nights):
         bundle_total = int(separate_total * (1 - discount_pct))
         savings = separate_total - bundle_total
 
-        bundles.append({
-            "flight": flight,
-            "hotel": hotel,
-            "origin": origin,
-            "destination": destination,
-            "nights": nights,
-            "total_price": bundle_total,
-            "savings": savings,
-            "vibe_text": VIBE_TEXTS[i % len(VIBE_TEXTS)],
-        })
+        bundles.append(Bundle(
+            flight=flight,
+            hotel=hotel,
+            origin=origin,
+            destination=destination,
+            nights=nights,
+            total_price=bundle_total,
+            savings=savings,
+            vibe_text=VIBE_TEXTS[i % len(VIBE_TEXTS)],
+        ))
 
     # Sort by value (price per quality)
-    bundles.sort(key=lambda b: b["total_price"] / (float(b["hotel"]["score"]) + 0.1))
+    bundles.sort(key=lambda b: b.total_price / (float(b.hotel.score) + 0.1))
 
     return bundles
 
 
+# ----- price-only refresh -----
+#
+# A stored search already has the deep link of every flight and hotel in
+# it. Refreshing re-reads just those pages for the current price (and
+# whether it is still on sale) instead of re-running the search pages.
+# Each page is tried over plain HTTP first, with the domain's saved
+# Cloudflare session if there is one; if that is blocked, the page goes
+# through the browser pool, and the domain skips plain HTTP for a while.
+# When the pool replays or records (TRIPVIBE_FETCH_MODE, see replay.py),
+# every page goes through it, so refreshes never reach the live site.
+
+REFRESH_WORKERS = 8
+REFRESH_BUNDLES = 6              # top bundles whose flight and hotel are refreshed
+REFRESH_MAX_JOBS = 12            # budgeted page fetches per refresh, at most
+PLAIN_HTTP_BACKOFF = 15 * 60     # seconds a blocked domain goes straight to the browser
+_plain_http_blocked = {}         # domain -> time plain HTTP may be tried again
+_plain_http_lock = threading.Lock()
+
+
+def _refresh_html(url, source):
+    """Page HTML for a refresh, over plain HTTP when the site allows it."""
+    domain = urlsplit(url).hostname
+    pool = browser_pool.default_pool()
+    spent = False
+    with _plain_http_lock:
+        plain_http = pool.live and _plain_http_blocked.get(domain, 0) < time.time()
+    if plain_http:
+        ratelimit.default_limiter().acquire(source)
+        spent = True
+        kwargs = {}
+        session = sessions.default_store().get(domain)
+        if session is not None:
+            kwargs["cookies"] = {c["name"]: c["value"] for c in session["cookies"]}
+            user_agent = session["fingerprint"].get("user_agent")
+            if user_agent:
+                kwargs["headers"] = {"User-Agent": user_agent}
+        try:
+            status, _, html = browser_pool.page_html(Fetcher.get(url, timeout=20, **kwargs))
+        except Exception as e:
+            status, html = None, ""
+            print(f"Plain HTTP refresh of {url} failed: {e}")
+        if status == 200 and not sessions.looks_challenged(html):
+            metrics.PRICE_REFRESHES.labels(source, "http").inc()
+            return html
+        with _plain_http_lock:
+            _plain_http_blocked[domain] = time.time() + PLAIN_HTTP_BACKOFF
+
+    # One refresh is one query: the browser retry doesn't spend another
+    response = pool.fetch(url, source=source, budgeted=not spent, solve_cloudflare=True)
+    status, _, html = browser_pool.page_html(response)
+    del response
+    metrics.PRICE_REFRESHES.labels(source, "browser").inc()
+    return html if status == 200 else None
+
+
+def _refresh_price(html, pattern, low, high):
+    """(cheapest price in [low, high], available) from a deep-link page.
+
+    A page that loads without any price in the window has nothing left to
+    sell for these dates: (None, False).
+    """
+    prices = [
+        int(digits) for digits in (p.replace(',', '') for p in _find(pattern, html, _visible(html)))
+        if digits.isdigit() and low <= int(digits) <= high
+    ]
+    if not prices:
+        return None, False
+    return min(prices), True
+
+
+def refresh_flight(flight, round_trip, window=None):
+    """Update flight's price and availability from its deep link, in place.
+
+    Args:
+        flight: Flight with a deep link
+        round_trip: Whether the price is for a return trip
+        window: (low, high) fare window in DISPLAY_CURRENCY (default: the
+            FLIGHT_WINDOWS constant)
+
+    Returns:
+        True if the page was read, False if it couldn't be fetched
+    """
+    html = _refresh_html(flight.booking_url, "skyscanner")
+    if html is None:
+        return False
+    # Same windows as iter_flights, in the currency of the link's market
+    page_currency = currency.detect(flight.booking_url, DISPLAY_CURRENCY)
+    rates = currency.default_table().snapshot()
+    low, high = rates.convert_all(window or FLIGHT_WINDOWS[bool(round_trip)], DISPLAY_CURRENCY, page_currency)
+    price, flight.available = _refresh_price(html, _price_pattern(page_currency), low, high)
+    if price is not None:
+        flight.price = rates.convert(price, page_currency, DISPLAY_CURRENCY)
+    return True
+
+
+def refresh_hotel(hotel, checkin, checkout, window=None):
+    """Update hotel's price and availability from its page, in place.
+
+    Args:
+        hotel: Hotel with a hotel page link
+        checkin, checkout: Stay dates (YYYY-MM-DD)
+        window: (low, high) per-night price window (default HOTEL_NIGHT_WINDOW)
+
+    Returns:
+        True if the page was read, False if it couldn't be fetched
+    """
+    html = _refresh_html(hotel.booking_url, "booking")
+    if html is None:
+        return False
+    nights = max(1, (datetime.strptime(checkout, "%Y-%m-%d") - datetime.strptime(checkin, "%Y-%m-%d")).days)
+    # Same window as iter_hotels
+    low, high = window or HOTEL_NIGHT_WINDOW
+    price, hotel.available = _refresh_price(html, _HOTEL_PRICE, low * nights, high * nights)
+    if price is not None:
+        hotel.price_total = price
+        hotel.price_per_night = price // nights
+        hotel_index.default_index().update_price(
+            hotel_index.hotel_slug(hotel.booking_url), checkin, checkout, price, price // nights,
+        )
+    return True
+
+
+@tracing.traced()
+def refresh_search(data):
+    """Refresh the prices of a stored search from its deep links, in place.
+
+    Each page read is one query against the source's daily budget, so only
+    the flights and hotels of the top REFRESH_BUNDLES bundles are refreshed
+    (the swap lists keep their search-time prices), at most REFRESH_MAX_JOBS
+    pages, best bundles first. Only flights with their own deep link (not
+    the search page) and hotels with a hotel page can be refreshed. A hotel
+    whose price for the stay is still fresh in the hotel index takes it
+    from there without a fetch. Bundle totals are recomputed with each
+    bundle's original discount.
+
+    Returns:
+        Number of flights and hotels whose page was read
+    """
+    round_trip = data["trip_type"] == "return"
+    bundles = data["bundles"]
+    top = bundles[:REFRESH_BUNDLES]
+    # Records are shared between bundles; refresh each once (dicts keep rank order)
+    flights = {id(b.flight): b.flight for b in top}
+    hotels = {id(b.hotel): b.hotel for b in top}
+    before = {id(b): (b.flight.price + b.hotel.price_total) for b in bundles}
+
+    # The routes' learned windows, looked up once for all their records
+    flight_window = price_window(price_windows.flight_key(data["origin"], data["destination"], round_trip),
+                                 FLIGHT_WINDOWS[round_trip])
+    hotel_window = price_window(price_windows.hotel_key(data["destination"]), HOTEL_NIGHT_WINDOW)
+    flight_jobs = [(refresh_flight, f, round_trip, flight_window)
+                   for f in flights.values() if "/config/" in f.booking_url]
+    hotel_jobs = []
+    index = hotel_index.default_index()
+    for hotel in hotels.values():
+        if "/hotel/" not in hotel.booking_url:
+            continue
+        # Priced by a search or refresh within PRICE_TTL: nothing to spend
+        known = index.price(hotel_index.hotel_slug(hotel.booking_url), data["checkin"], data["checkout"])
+        if known:
+            hotel.price_total, hotel.price_per_night = known
+        else:
+            hotel_jobs.append((refresh_hotel, hotel, data["checkin"], data["checkout"], hotel_window))
+    # Interleave by rank so the cap keeps both halves of the best bundles
+    jobs = [job for pair in zip_longest(flight_jobs, hotel_jobs) for job in pair if job][:REFRESH_MAX_JOBS]
+
+    refreshed = 0
+    with ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="price-refresh") as executor:
+        futures = [executor.submit(contextvars.copy_context().run, *job) for job in jobs]
+        for future in as_completed(futures):
+            try:
+                refreshed += future.result()
+            except Exception as e:
+                # The page failed: keep the stored price
+                print(f"Price refresh failed: {e}")
+
+    for bundle in bundles:
+        separate = bundle.flight.price + bundle.hotel.price_total
+        kept = bundle.total_price / before[id(bundle)] if before[id(bundle)] else 1.0
+        bundle.total_price = int(separate * kept)
+        bundle.savings = separate - bundle.total_price
+    data["prices_refreshed_at"] = datetime.now().isoformat()
+
+    # Refreshed prices can meet watches the search didn't
+    check_alerts("check_flights", data["origin"], data["destination"], data["checkin"],
+                 list(flights.values()), round_trip=round_trip)
+    check_alerts("check_hotels", data["destination"], data["checkin"], data["checkout"],
+                 list(hotels.values()))
+    return refreshed
+
+
+def iter_search(origin, destination, checkin, checkout, trip_type, nights):
+    """Scrape flights and hotels and build the stored search dict, step by step.
+
+    Yields (kind, value) as each step finishes so callers can show partial
+    results: ("flights", [Flight]), ("hotels", [Hotel]) once per hotel
+    results page with the hotels new on that page, ("bundles", [Bundle])
+    and last ("result", search dict, or None if no flights). The result
+    keeps every flight and hotel found, for the swap options.
+    """
+    # Hotel pages start loading now and run alongside the flight scrape
+    hotel_fan_out = HotelFanOut(destination, checkin, checkout)
+    try:
+        # Scrape flights - pass return date only for return trips
+        return_date = checkout if trip_type == "return" else None
+        flights, market_prices = scrape_flights_markets(origin, destination, checkin, return_date)
+        yield "flights", flights
+        if not flights:
+            yield "result", None
+            return
+
+        # Hotels, one batch per results page as pages finish
+        for batch in hotel_fan_out:
+            if batch:
+                yield "hotels", batch
+        hotels = hotel_fan_out.pool
+    finally:
+        # No flights, an error or the client went away: don't start the rest
+        hotel_fan_out.cancel()
+
+    # Create bundles
+    bundles = create_bundles(flights, hotels, origin, destination, nights)
+    yield "bundles", bundles
+
+    # Build route display
+    origin_city = places.default_index().city_name(origin)
+    dest_city = places.default_index().city_name(destination)
+    if trip_type == "return":
+        route_display = f"{origin_city} ↔ {dest_city} · {checkin} to {checkout}"
+    else:
+        route_display = f"{origin_city} → {dest_city} · {checkin}"
+
+    yield "result", {
+        "bundles": bundles,
+        "flights": flights,
+        "hotels": hotels,
+        "markets": market_prices,
+        "currency": DISPLAY_CURRENCY,
+        "origin": origin,
+        "destination": destination,
+        "checkin": checkin,
+        "checkout": checkout,
+        "trip_type": trip_type,
+        "route_display": route_display,
+        "scraped_at": datetime.now().isoformat()
+    }
+
+
+@tracing.traced()
+def build_search(origin, destination, checkin, checkout, trip_type, nights):
+    """Scrape flights and hotels and build the stored search dict.
+
+    Returns:
+        The search dict, or None if no flights were found
+    """
+    data = None
+    for kind, data in iter_search(origin, destination, checkin, checkout, trip_type, nights):
+        pass
+    return data
+
+
+@tracing.traced("store.get")
 def load_bundles():
-    """Load cached bundles."""
-    path = DATA_DIR / "bundles.json"
-    if path.exists():
-        with open(path) as f:
-            return json.load(f)
-    return None
+    """Load the latest complete bundle snapshot."""
+    return BUNDLE_STORE.get()
 
 
 @app.route("/")
@@ -1498,20 +2448,28 @@ def index():
     default_checkin = (datetime.now() + timedelta(days=90)).strftime("%Y-%m-%d")
     default_checkout = (datetime.now() + timedelta(days=97)).strftime("%Y-%m-%d")  # 7 days default
 
-    return render_template_string(
-        HTML_TEMPLATE,
-        bundles=bundles_data.get("bundles") if bundles_data else None,
-        bundles_data=bundles_data,
-        trip_type=bundles_data.get("trip_type", "return") if bundles_data else "return",
-        route_display=bundles_data.get("route_display", "") if bundles_data else "",
-        cities=CITIES,
-        default_checkin=default_checkin,
-        default_checkout=default_checkout,
-    )
-
-
-@app.route("/api/bundle")
-def api_bundle():
+    with tracing.span("render"):
+        return render_template_string(
+            HTML_TEMPLATE,
+            bundles=bundles_data.get("bundles") if bundles_data else None,
+            bundles_data=bundles_data,
+            trip_type=bundles_data.get("trip_type", "return") if bundles_data else "return",
+            route_display=bundles_data.get("route_display", "") if bundles_data else "",
+            booking_city=places.default_index().booking_city(
+                bundles_data["destination"] if bundles_data else "NYCA"
+            ),
+            default_checkin=default_checkin,
+            default_checkout=default_checkout,
+        )
+
+
+def search_params():
+    """Read and validate the search form from the query string.
+
+    Returns:
+        (params, None) with the keyword arguments for build_search(), or
+        (None, error message)
+    """
     origin = request.args.get("origin", "SIN")
     destination = request.args.get("destination", "NYCA")
     checkin = request.args.get("checkin")
@@ -1519,58 +2477,53 @@ def api_bundle():
     trip_type = request.args.get("tripType", "return")  # Default to return
 
     if not checkin:
-        return jsonify({"success": False, "error": "Departure date required"})
+        return None, "Departure date required"
 
     # For one-way, checkout is optional (but needed for hotel)
     if trip_type == "return" and not checkout:
-        return jsonify({"success": False, "error": "Return date required"})
+        return None, "Return date required"
 
-    try:
-        # Calculate nights for hotel
-        if checkout:
-            nights = (datetime.strptime(checkout, "%Y-%m-%d") - datetime.strptime(checkin, "%Y-%m-%d")).days
-            if nights <= 0:
-                return jsonify({"success": False, "error": "Invalid dates"})
-        else:
-            # One-way with no return date - default to 3 nights
-            nights = 3
-            checkout = (datetime.strptime(checkin, "%Y-%m-%d") + timedelta(days=3)).strftime("%Y-%m-%d")
+    # Calculate nights for hotel
+    if checkout:
+        nights = (datetime.strptime(checkout, "%Y-%m-%d") - datetime.strptime(checkin, "%Y-%m-%d")).days
+        if nights <= 0:
+            return None, "Invalid dates"
+    else:
+        # One-way with no return date - default to 3 nights
+        nights = 3
+        checkout = (datetime.strptime(checkin, "%Y-%m-%d") + timedelta(days=3)).strftime("%Y-%m-%d")
 
-        # Scrape flights - pass return date only for return trips
-        return_date = checkout if trip_type == "return" else None
-        flights = scrape_flights(origin, destination, checkin, return_date)
-        if not flights:
-            return jsonify({"success": False, "error": "No flights found"})
+    return {
+        "origin": origin,
+        "destination": destination,
+        "checkin": checkin,
+        "checkout": checkout,
+        "trip_type": trip_type,
+        "nights": nights,
+    }, None
 
-        # Scrape hotels
-        dest_city = CITIES.get(destination, {}).get("name", destination)
-        hotels = scrape_hotels(destination, checkin, checkout)
 
-        # Create bundles
-        bundles = create_bundles(flights, hotels, origin, destination, nights)
+def search_cache_key(params):
+    return "bundle:{origin}:{destination}:{checkin}:{checkout}:{trip_type}".format(**params)
 
-        # Build route display
-        origin_city = CITIES.get(origin, {}).get("name", origin)
-        dest_city = CITIES.get(destination, {}).get("name", destination)
-        if trip_type == "return":
-            route_display = f"{origin_city} ↔ {dest_city} · {checkin} to {checkout}"
-        else:
-            route_display = f"{origin_city} → {dest_city} · {checkin}"
 
-        # Save
-        data = {
-            "bundles": bundles,
-            "origin": origin,
-            "destination": destination,
-            "checkin": checkin,
-            "checkout": checkout,
-            "trip_type": trip_type,
-            "route_display": route_display,
-            "scraped_at": datetime.now().isoformat()
-        }
+@app.route("/api/bundle")
+def api_bundle():
+    try:
+        params, error = search_params()
+        if error:
+            return jsonify({"success": False, "error": error})
+
+        # Identical searches from any worker share one scrape
+        data = SEARCH_CACHE.get_or_compute(
+            search_cache_key(params),
+            lambda: build_search(**params),
+        )
+        if not data:
+            return jsonify({"success": False, "error": "No flights found"})
 
-        with open(DATA_DIR / "bundles.json", "w") as f:
-            json.dump(data, f, indent=2)
+        with tracing.span("store.put"):
+            BUNDLE_STORE.put(data)
 
         return jsonify({"success": True})
 
@@ -1578,6 +2531,156 @@ def api_bundle():
         return jsonify({"success": False, "error": str(e)})
 
 
+@app.route("/api/bundle/refresh")
+def api_bundle_refresh():
+    """Refresh the prices of the displayed (latest) search from its deep links."""
+    try:
+        snapshot = load_bundles()
+        if not snapshot:
+            return jsonify({"success": False, "error": "No search to refresh"})
+
+        # The snapshot is shared with every reader: refresh a copy of its
+        # records (shared between bundles and swap lists, as in the original)
+        # and publish it whole
+        data = storage.decode_search(storage.encode_search(snapshot))
+        refreshed = refresh_search(data)
+
+        with tracing.span("store.put"):
+            BUNDLE_STORE.put(data)
+        # The next identical search gets the fresh prices too
+        params = {key: data[key] for key in ("origin", "destination", "checkin", "checkout", "trip_type")}
+        params["nights"] = data["bundles"][0].nights if data["bundles"] else 0
+        SEARCH_CACHE.put(search_cache_key(params), storage.dumps_search(data))
+
+        return jsonify({
+            "success": True,
+            "refreshed": refreshed,
+            "bundles": data["bundles"],
+            "trip_type": data["trip_type"],
+            "route_display": data["route_display"],
+        })
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+
+@app.route("/api/alerts", methods=["POST"])
+def api_alerts_add():
+    """Save a price watch (see alerts.AlertEngine.add for the fields)."""
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return jsonify({"success": False, "error": "Expected a JSON object"})
+    try:
+        alert_id = alerts.default_engine().add(
+            body.get("kind", "flight"),
+            body["target"],
+            body["date_from"],
+            body.get("date_to") or body["date_from"],
+            int(body["max_price"]),
+            trip_type=body.get("trip_type", "return"),
+            contact=body.get("contact", ""),
+        )
+        return jsonify({"success": True, "id": alert_id})
+    except KeyError as e:
+        return jsonify({"success": False, "error": f"Missing field {e}"})
+    except (TypeError, ValueError) as e:
+        # e.g. "max_price": null, or a date that isn't a string
+        return jsonify({"success": False, "error": str(e)})
+
+
+@app.route("/api/alerts/<int:alert_id>", methods=["GET", "DELETE"])
+def api_alert(alert_id):
+    engine = alerts.default_engine()
+    if request.method == "DELETE":
+        return jsonify({"success": engine.remove(alert_id)})
+    watch = engine.get(alert_id)
+    if watch is None:
+        return jsonify({"success": False, "error": "No such alert"})
+    return jsonify({"success": True, "alert": watch})
+
+
+def search_events(params):
+    """Yield the events of one search as dicts, in the order results arrive.
+
+    A live search sends flights as soon as Skyscanner is parsed, then one
+    hotels event per Booking.com results page (the hotels new on that
+    page), then one event per bundle in ranked order. A cached search (or one that
+    another worker was already running) sends the same events at once.
+    """
+    data = None
+    sent = set()
+    produce = lambda: iter_search(**params)
+    for kind, value in SEARCH_CACHE.get_or_stream(search_cache_key(params), produce):
+        if kind == "result":
+            data = value
+        elif kind == "bundles":
+            for bundle in value:
+                yield {"type": "bundle", "bundle": bundle}
+            sent.add(kind)
+        else:
+            yield {"type": kind, kind: value}
+            sent.add(kind)
+
+    if not data:
+        yield {"type": "error", "error": "No flights found"}
+        return
+
+    # Served from the cache: rebuild the partial events (searches cached
+    # before flights/hotels were kept only have the bundles)
+    if "flights" not in sent:
+        flights = data.get("flights") or list({id(b.flight): b.flight for b in data["bundles"]}.values())
+        yield {"type": "flights", "flights": flights}
+    if "hotels" not in sent:
+        hotels = data.get("hotels") or list({id(b.hotel): b.hotel for b in data["bundles"]}.values())
+        yield {"type": "hotels", "hotels": hotels}
+    if "bundles" not in sent:
+        for bundle in data["bundles"]:
+            yield {"type": "bundle", "bundle": bundle}
+
+    with tracing.span("store.put"):
+        BUNDLE_STORE.put(data)
+
+    yield {
+        "type": "done",
+        "count": len(data["bundles"]),
+        "origin": data["origin"],
+        "destination": data["destination"],
+        "checkin": data["checkin"],
+        "checkout": data["checkout"],
+        "trip_type": data["trip_type"],
+        "nights": params["nights"],
+        "route_display": data["route_display"],
+        "booking_city": places.default_index().booking_city(data["destination"]),
+    }
+
+
+@app.route("/api/bundle/stream")
+def api_bundle_stream():
+    """Stream a search as NDJSON, one event per line (see search_events)."""
+    try:
+        params, error = search_params()
+    except ValueError as e:
+        params, error = None, str(e)
+
+    def generate():
+        if error:
+            yield app.json.dumps({"type": "error", "error": error}) + "\n"
+            return
+        try:
+            for event in search_events(params):
+                yield app.json.dumps(event) + "\n"
+        except Exception as e:
+            # Headers are already sent; report the failure in-band
+            yield app.json.dumps({"type": "error", "error": str(e)}) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        # Ask proxies (nginx) not to buffer, or nothing arrives until the end
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     print("""
 ╔═══════════════════════════════════════════════════════════════╗